@@ -0,0 +1,101 @@
+# Adaptive batch sizing for batched generation
+# Prompts are sorted by token length and packed into batches whose padded size
+# (batch size x (longest prompt + max_new_tokens)) fits a token budget derived from free
+# GPU memory (or RAM on CPU) and the model's KV-cache size per token. A batch that still runs
+# out of memory is split in half and retried, and the budget shrinks for the batches after it
+
+import os
+
+import torch
+
+DEFAULT_MAX_BATCH_SIZE = 16
+MEMORY_FRACTION = 0.5  # share of free memory the KV cache may use, the rest is left for activations
+
+
+def is_out_of_memory(error):
+    if isinstance(error, MemoryError) or isinstance(error, torch.cuda.OutOfMemoryError):
+        return True
+    return isinstance(error, RuntimeError) and "out of memory" in str(error).lower()
+
+
+def kv_bytes_per_token(model):
+    """Bytes of KV cache one token takes in a transformers causal LM"""
+    config = model.config
+    head_dim = getattr(config, "head_dim", None) or config.hidden_size // config.num_attention_heads
+    kv_heads = getattr(config, "num_key_value_heads", None) or config.num_attention_heads
+    dtype_bytes = torch.finfo(model.dtype).bits // 8
+    return 2 * config.num_hidden_layers * kv_heads * head_dim * dtype_bytes
+
+
+def free_memory_bytes():
+    """Free memory on the current CUDA device, or available RAM on CPU (None if unknown)"""
+    if torch.cuda.is_available():
+        free, _ = torch.cuda.mem_get_info()
+        return free
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class AdaptiveBatchScheduler:
+    """Plans length-sorted batches within a token budget and backs off on out-of-memory errors"""
+
+    def __init__(self, token_budget=None, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_new_tokens=512):
+        """token_budget: padded tokens per batch (None = only max_batch_size limits batches)"""
+        self.token_budget = token_budget
+        self.max_batch_size = max_batch_size
+        self.max_new_tokens = max_new_tokens
+
+    @classmethod
+    def for_model(cls, model, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_new_tokens=512, memory_fraction=MEMORY_FRACTION):
+        """Scheduler whose budget fits the model's KV cache into free memory (no budget for remote/stub generators)"""
+        free = free_memory_bytes()
+        if model is None or free is None:
+            return cls(None, max_batch_size, max_new_tokens)
+        return cls(int(free * memory_fraction / kv_bytes_per_token(model)), max_batch_size, max_new_tokens)
+
+    def _fits(self, batch_size, longest):
+        if batch_size > self.max_batch_size:
+            return False
+        return self.token_budget is None or batch_size * (longest + self.max_new_tokens) <= self.token_budget
+
+    def plan(self, lengths, positions=None):
+        """Split positions (default 0..n-1) into batches of similar length (shortest first) that fit the budget"""
+        order = sorted(range(len(lengths)) if positions is None else positions, key=lambda i: lengths[i])
+        batches, current = [], []
+        for i in order:
+            # Sorted ascending, so the prompt being added is the longest in the batch
+            if current and not self._fits(len(current) + 1, lengths[i]):
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+
+    def run(self, lengths, generate_fn):
+        """
+        Call generate_fn(positions) for every planned batch and collect {position: output}
+        generate_fn returns one output per position. On out-of-memory the batch is halved and
+        retried, and the budget is lowered below what did not fit and the remaining batches are re-planned
+        """
+        outputs = {}
+        pending = self.plan(lengths)
+        while pending:
+            batch = pending.pop(0)
+            try:
+                outputs.update(zip(batch, generate_fn(batch)))
+            except Exception as e:
+                if not is_out_of_memory(e) or len(batch) == 1:
+                    raise
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+
+                longest = max(lengths[i] for i in batch)
+                self.token_budget = (len(batch) // 2) * (longest + self.max_new_tokens)
+                print(f"Out of memory on a batch of {len(batch)}, retrying in halves (token budget now {self.token_budget})")
+                half = len(batch) // 2
+                remaining = [i for planned in pending for i in planned]
+                pending = [batch[:half], batch[half:]] + self.plan(lengths, remaining)
+        return outputs
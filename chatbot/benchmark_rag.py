@@ -0,0 +1,276 @@
+# Benchmarks the RAG pipeline end to end on synthetic data
+# For each corpus size, generates sentence-pair and travel metadata with clustered random
+# embeddings, builds their FAISS indexes, then replays experiment_queries.json through
+# retrieve_context and generate_response in a child process that loads the chatbot module
+# with CHATBOT_DATA_DIR pointing at the synthetic corpus and CHATBOT_GENERATOR=stub
+# (no Mistral, no real data). Reports per-stage latency percentiles and throughput as JSON,
+# and --compare prints the p50 change against an earlier result file
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import faiss
+import numpy as np
+from faiss_index_utils import INDEX_METRICS, INDEX_STORAGE, build_faiss_index
+
+BENCHMARK_DIR = "data/benchmark"
+QUERIES_FILE = "chatbot/experiment_queries.json"
+EMBEDDING_DIM = 384  # both MiniLM sentence encoders
+CHUNK_ROWS = 100000
+
+WORDS_EN = "the a house city train market food beach street museum old new big small good eat see go visit buy".split()
+WORDS_ES = "el la casa ciudad tren mercado comida playa calle museo viejo nuevo grande pequeño bueno comer ver ir visitar comprar".split()
+CITIES = ["Oaxaca", "Madrid", "Lima", "Bogotá", "Sevilla", "Cusco", "Havana", "Valparaíso"]
+
+
+def percentiles(values):
+    values = np.asarray(values, dtype="float64")
+    if not len(values):
+        return {}
+    return {
+        "count": int(len(values)),
+        "mean": round(float(values.mean()), 3),
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p90": round(float(np.percentile(values, 90)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "max": round(float(values.max()), 3)
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def synthetic_embeddings(path, rows, rng, clusters=256):
+    """Clustered random embeddings written in chunks to a .npy memmap (2M x 384 float32 is ~3 GB)"""
+    centers = rng.standard_normal((clusters, EMBEDDING_DIM)).astype("float32")
+    embeddings = np.lib.format.open_memmap(path, mode="w+", dtype="float32", shape=(rows, EMBEDDING_DIM))
+    for start in range(0, rows, CHUNK_ROWS):
+        n = min(CHUNK_ROWS, rows - start)
+        noise = rng.standard_normal((n, EMBEDDING_DIM)).astype("float32")
+        embeddings[start:start + n] = centers[rng.integers(0, clusters, n)] + 0.5 * noise
+    return embeddings
+
+
+def synthetic_sentence(words, rng, length=8):
+    return " ".join(words[i] for i in rng.integers(0, len(words), length)).capitalize() + "."
+
+
+def write_metadata(path, rows, make_row):
+    with open(path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        for i in range(rows):
+            f.write(json.dumps(make_row(i), ensure_ascii=False) + "\n")
+
+
+def build_corpus(corpus_dir, rows, travel_rows, metric, storage, seed):
+    """Write synthetic metadata and indexes under the chatbot's data file names; returns build timings"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    stats = {}
+
+    start = time.perf_counter()
+    write_metadata(
+        os.path.join(corpus_dir, "sentence_pairs_metadata.jsonl"),
+        rows,
+        lambda i: {"en": synthetic_sentence(WORDS_EN, rng), "es": synthetic_sentence(WORDS_ES, rng), "source": "synthetic"}
+    )
+    write_metadata(
+        os.path.join(corpus_dir, "chunked_travel_info_metadata.jsonl"),
+        travel_rows,
+        lambda i: {
+            "lang": "en" if i % 2 == 0 else "es",
+            "city": CITIES[i % len(CITIES)],
+            "source": "synthetic",
+            "chunk_id": f"synthetic_{i}",
+            "text": " ".join(synthetic_sentence(WORDS_EN if i % 2 == 0 else WORDS_ES, rng, 20) for _ in range(10)),
+            "section": "intro"
+        }
+    )
+    stats["write_metadata_s"] = time.perf_counter() - start
+
+    for name, n in [("sentence_pairs", rows), ("chunked_travel_info", travel_rows)]:
+        embeddings_path = os.path.join(corpus_dir, f"{name}_embeddings.npy")
+
+        start = time.perf_counter()
+        embeddings = synthetic_embeddings(embeddings_path, n, rng)
+        stats[f"{name}_embeddings_s"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = build_faiss_index(embeddings, metric=metric, storage=storage)
+        stats[f"{name}_build_index_s"] = time.perf_counter() - start
+
+        index_path = os.path.join(corpus_dir, f"{name}_index.faiss")
+        faiss.write_index(index, index_path)
+        stats[f"{name}_index_mb"] = os.path.getsize(index_path) / 1e6
+
+        del embeddings, index
+        os.remove(embeddings_path)
+
+    stats = {key: round(value, 3) for key, value in stats.items()}
+    with open(os.path.join(corpus_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"rows": rows, "travel_rows": travel_rows, "metric": metric, "storage": storage, "seed": seed, "build": stats}, f, indent=2)
+    return stats
+
+
+def replay(queries_file, repeat):
+    """Child process: load the chatbot on the synthetic corpus and replay the queries"""
+    start = time.perf_counter()
+    import multilingual_rag_chatbot_llm as chatbot
+    from tracing import Trace, activate
+    load_s = time.perf_counter() - start
+    chatbot.warm_up()
+
+    with open(queries_file, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+
+    results = {}
+    for mode, lang_dict in queries.items():
+        stages = {}
+        retrieval_ms, end_to_end_ms = [], []
+
+        for lang, mode_queries in lang_dict.items():
+            for _ in range(repeat):
+                for query in mode_queries:
+                    trace = Trace()
+                    retrieve_start = time.perf_counter()
+                    with activate(trace):
+                        chatbot.retrieve_context(query, k=5, source=mode, lang="auto")
+                    retrieval_ms.append((time.perf_counter() - retrieve_start) * 1000)
+                    for stage, value in trace.as_dict().items():
+                        if stage.endswith("_ms") and stage != "total_ms":
+                            stages.setdefault(f"retrieve_context.{stage}", []).append(value)
+
+                    response_start = time.perf_counter()
+                    details = chatbot.generate_response(query, mode=mode, lang="auto", use_cache=False, trace=True, return_details=True)
+                    end_to_end_ms.append((time.perf_counter() - response_start) * 1000)
+                    for stage, value in details["timings"].items():
+                        if stage.endswith("_ms"):
+                            stages.setdefault(f"generate_response.{stage}", []).append(value)
+
+        results[mode] = {
+            "retrieve_context_ms": percentiles(retrieval_ms),
+            "generate_response_ms": percentiles(end_to_end_ms),
+            "retrieval_qps": round(len(retrieval_ms) / (sum(retrieval_ms) / 1000), 2) if retrieval_ms and sum(retrieval_ms) else None,
+            "end_to_end_qps": round(len(end_to_end_ms) / (sum(end_to_end_ms) / 1000), 2) if end_to_end_ms else None,
+            "stages_ms": {stage: percentiles(values) for stage, values in sorted(stages.items())}
+        }
+
+    return {
+        "load_s": round(load_s, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "modes": results
+    }
+
+
+def run_benchmark(sizes, travel_rows=None, metric="cosine", storage="float32", repeat=3, seed=42,
+                  queries_file=QUERIES_FILE, benchmark_dir=BENCHMARK_DIR, rebuild=False):
+    runs = []
+    for rows in sizes:
+        n_travel = travel_rows or max(rows // 10, 100)
+        corpus_dir = os.path.join(benchmark_dir, f"{rows}_{metric}_{storage}")
+        manifest_path = os.path.join(corpus_dir, "manifest.json")
+
+        manifest = None
+        if os.path.exists(manifest_path) and not rebuild:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest["travel_rows"] != n_travel or manifest["seed"] != seed:
+                manifest = None
+
+        if manifest is None:
+            print(f"Building synthetic corpus: {rows} sentence pairs, {n_travel} travel chunks ({metric}, {storage})")
+            build = build_corpus(corpus_dir, rows, n_travel, metric, storage, seed)
+        else:
+            print(f"Reusing synthetic corpus in {corpus_dir}")
+            build = manifest["build"]
+
+        print(f"Replaying {queries_file} x{repeat}")
+        env = {**os.environ, "CHATBOT_DATA_DIR": corpus_dir, "CHATBOT_GENERATOR": "stub"}
+        env.pop("INFERENCE_SERVER_URL", None)
+        env.pop("METRICS_PORT", None)
+        child = subprocess.run(
+            [sys.executable, __file__, "--replay", "--queries", queries_file, "--repeat", str(repeat)],
+            env=env, capture_output=True, text=True
+        )
+        if child.returncode != 0:
+            raise RuntimeError(f"Replay failed for {rows} rows:\n{child.stderr}")
+
+        # The chatbot module prints while loading; the replay result is the last line
+        runs.append({
+            "rows": rows,
+            "travel_rows": n_travel,
+            "build": build,
+            "replay": json.loads(child.stdout.strip().splitlines()[-1])
+        })
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"metric": metric, "storage": storage, "repeat": repeat, "seed": seed, "queries": queries_file},
+        "runs": runs
+    }
+
+
+def compare(current, previous):
+    """Print the p50 change per corpus size, mode and stage"""
+    previous_runs = {run["rows"]: run for run in previous["runs"]}
+    print(f"\nComparison with {previous.get('commit')} (p50 ms):")
+    for run in current["runs"]:
+        old_run = previous_runs.get(run["rows"])
+        if old_run is None:
+            continue
+        for mode, result in run["replay"]["modes"].items():
+            old_result = old_run["replay"]["modes"].get(mode, {})
+            rows = [("retrieve_context", result["retrieve_context_ms"], old_result.get("retrieve_context_ms")),
+                    ("generate_response", result["generate_response_ms"], old_result.get("generate_response_ms"))]
+            rows += [(stage, stats, old_result.get("stages_ms", {}).get(stage)) for stage, stats in result["stages_ms"].items()]
+            for stage, stats, old_stats in rows:
+                if not stats or not old_stats or not old_stats.get("p50"):
+                    continue
+                change = (stats["p50"] - old_stats["p50"]) / old_stats["p50"] * 100
+                print(f"  {run['rows']:>8} {mode:<13} {stage:<45} {old_stats['p50']:>9.2f} -> {stats['p50']:>9.2f} ({change:+.1f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end RAG benchmark on synthetic corpora with a stub generator")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="Sentence-pair rows per corpus (10k to 2M)")
+    parser.add_argument("--travel_rows", type=int, default=None, help="Travel chunks per corpus (default rows / 10)")
+    parser.add_argument("--metric", choices=INDEX_METRICS, default="cosine")
+    parser.add_argument("--storage", choices=INDEX_STORAGE, default="float32")
+    parser.add_argument("--repeat", type=int, default=3, help="Times each query is replayed")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--queries", default=QUERIES_FILE)
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild corpora even if they exist")
+    parser.add_argument("--output", default=None, help="Result JSON (default results/benchmarks/benchmark_<commit>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier result JSON to compare against")
+    parser.add_argument("--replay", action="store_true", help=argparse.SUPPRESS)  # child process mode
+    args = parser.parse_args()
+
+    if args.replay:
+        print(json.dumps(replay(args.queries, args.repeat)))
+        sys.exit(0)
+
+    result = run_benchmark(args.sizes, args.travel_rows, args.metric, args.storage, args.repeat, args.seed, args.queries, rebuild=args.rebuild)
+
+    output = args.output or f"results/benchmarks/benchmark_{result['commit'] or time.strftime('%Y%m%d_%H%M%S')}.json"
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    for run in result["runs"]:
+        for mode, mode_result in run["replay"]["modes"].items():
+            print(f"{run['rows']:>8} rows  {mode:<13} retrieve p50 {mode_result['retrieve_context_ms'].get('p50')} ms"
+                  f"  end-to-end p50 {mode_result['generate_response_ms'].get('p50')} ms  {mode_result['end_to_end_qps']} q/s")
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(result, json.load(f))
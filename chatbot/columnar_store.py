@@ -0,0 +1,108 @@
+# Binary columnar format for text datasets (e.g. sentence pairs)
+# Each column is stored as one UTF-8 blob plus a uint64 offsets array, so the index builders
+# can load a single column (e.g. the English side) without parsing every JSON line
+#
+# Layout of a columnar directory:
+#   manifest.json       {"format": ..., "rows": n, "columns": [...]}
+#   <column>.bin        UTF-8 bytes of every value, concatenated
+#   <column>.offsets    n + 1 little-endian uint64 offsets into <column>.bin
+
+import json
+import os
+import sys
+from array import array
+
+COLUMNAR_FORMAT = "utf8-offsets-v1"
+
+
+class ColumnarWriter:
+    """Streams rows (dicts) into a columnar directory with buffered writes"""
+
+    def __init__(self, directory, columns, flush_rows=100000):
+        self.directory = directory
+        self.columns = list(columns)
+        self.flush_rows = flush_rows
+        self.rows = 0
+
+        os.makedirs(directory, exist_ok=True)
+        # A manifest left by an earlier run would describe the files about to be overwritten
+        try:
+            os.remove(os.path.join(directory, "manifest.json"))
+        except FileNotFoundError:
+            pass
+        self._bin_files = {c: open(os.path.join(directory, f"{c}.bin"), "wb", buffering=1 << 20) for c in self.columns}
+        self._offset_files = {c: open(os.path.join(directory, f"{c}.offsets"), "wb") for c in self.columns}
+        self._positions = {c: 0 for c in self.columns}
+        self._pending_offsets = {c: array("Q", [0]) for c in self.columns}
+
+    def write_row(self, row):
+        for column in self.columns:
+            data = str(row.get(column, "")).encode("utf-8")
+            self._bin_files[column].write(data)
+            self._positions[column] += len(data)
+            self._pending_offsets[column].append(self._positions[column])
+        self.rows += 1
+
+        if self.rows % self.flush_rows == 0:
+            self._flush_offsets()
+
+    def _flush_offsets(self):
+        for column, offsets in self._pending_offsets.items():
+            if sys.byteorder != "little":
+                offsets.byteswap()
+            offsets.tofile(self._offset_files[column])
+            self._pending_offsets[column] = array("Q")
+
+    def _close_files(self):
+        for f in list(self._bin_files.values()) + list(self._offset_files.values()):
+            f.close()
+
+    def close(self):
+        self._flush_offsets()
+        self._close_files()
+
+        # Manifest last, so a half-written directory is never mistaken for a complete one
+        with open(os.path.join(self.directory, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump({"format": COLUMNAR_FORMAT, "rows": self.rows, "columns": self.columns}, f, indent=2)
+
+    def abort(self):
+        """Close the files without writing the manifest, so the partial directory is never read"""
+        self._close_files()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_columnar_manifest(directory):
+    """Load and check the manifest of a columnar directory"""
+    with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != COLUMNAR_FORMAT:
+        raise ValueError(f"Unsupported columnar format in {directory}: {manifest.get('format')}")
+    return manifest
+
+
+def read_column(directory, column):
+    """Load one column as a list of strings"""
+    manifest = read_columnar_manifest(directory)
+    if column not in manifest["columns"]:
+        raise ValueError(f"Column '{column}' not found in {directory} (has {manifest['columns']})")
+
+    offsets = array("Q")
+    with open(os.path.join(directory, f"{column}.offsets"), "rb") as f:
+        offsets.frombytes(f.read())
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    if len(offsets) != manifest["rows"] + 1:
+        raise ValueError(f"Column '{column}' in {directory} has {len(offsets) - 1} rows, manifest says {manifest['rows']}")
+
+    with open(os.path.join(directory, f"{column}.bin"), "rb") as f:
+        data = f.read()
+
+    return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(manifest["rows"])]
@@ -0,0 +1,160 @@
+# Multi-turn conversation memory for the chatbot
+# Keeps the last few turns verbatim, compacts older turns into a short token-bounded summary,
+# and remembers the passages retrieved for the previous question so a follow-up on the same
+# topic can reuse them instead of searching again. Everything serialises to a small dict
+
+import base64
+import re
+
+import numpy as np
+
+
+def count_words(text):
+    """Default token counter: whitespace-separated words"""
+    return len(text.split())
+
+
+def first_sentence(text, max_words=25):
+    """First sentence of a text, cut to max_words"""
+    sentence = re.split(r"(?<=[.!?])\s+", text.strip(), maxsplit=1)[0]
+    words = sentence.split()
+    return " ".join(words[:max_words]) + (" ..." if len(words) > max_words else "")
+
+
+def truncate_words(text, fits):
+    """Longest word prefix of text (marked with " ...") for which fits(prefix) is true, "" if none"""
+    words = text.split()
+    low, high = 0, len(words)  # fits holds for words[:low] (or low == 0)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if fits(" ".join(words[:middle]) + " ..."):
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low]) + " ..." if low else ""
+
+
+def encode_vector(vector):
+    """Compact float16 + base64 encoding of an embedding"""
+    return base64.b64encode(np.asarray(vector, dtype="float16").tobytes()).decode("ascii")
+
+
+def decode_vector(data):
+    return np.frombuffer(base64.b64decode(data), dtype="float16").astype("float32")
+
+
+class ConversationSession:
+    """Turn history, compacted summary and reusable passages for one conversation"""
+
+    def __init__(
+        self,
+        mode="general",
+        max_history_tokens=300,  # budget for the verbatim recent turns
+        max_summary_tokens=150,  # budget for the summary of older turns
+        reuse_threshold=0.75,  # cosine similarity to the previous question needed to reuse its passages
+        count_tokens=count_words
+    ):
+        self.mode = mode
+        self.max_history_tokens = max_history_tokens
+        self.max_summary_tokens = max_summary_tokens
+        self.reuse_threshold = reuse_threshold
+        self.count_tokens = count_tokens
+
+        self.turns = []  # recent turns: {"user": ..., "answer": ...}
+        self.summary = []  # one short line per compacted turn, oldest first
+        self.last_query_vector = None  # float16/base64 embedding of the previous question
+        self.last_results = []  # (row, distance) pairs retrieved for the previous question
+
+    def reset(self, mode=None):
+        """Start a new conversation (optionally in another mode)"""
+        self.__init__(
+            mode=mode or self.mode,
+            max_history_tokens=self.max_history_tokens,
+            max_summary_tokens=self.max_summary_tokens,
+            reuse_threshold=self.reuse_threshold,
+            count_tokens=self.count_tokens
+        )
+
+    def reusable_results(self, query_vector):
+        """Previous passages if the new question is close enough to the previous one, else None"""
+        if self.last_query_vector is None or not self.last_results:
+            return None
+
+        previous = decode_vector(self.last_query_vector)
+        current = np.asarray(query_vector, dtype="float32").reshape(-1)
+        similarity = float(np.dot(previous, current) / (np.linalg.norm(previous) * np.linalg.norm(current) + 1e-12))
+        return self.last_results if similarity >= self.reuse_threshold else None
+
+    def add_turn(self, user_input, answer, results=None, query_vector=None):
+        """Record a finished turn and compact the history back under budget"""
+        self.turns.append({"user": user_input, "answer": answer})
+        if query_vector is not None:
+            self.last_query_vector = encode_vector(np.asarray(query_vector).reshape(-1))
+            self.last_results = list(results or [])
+        self._compact()
+
+    def _turn_text(self, turn):
+        return f"User: {turn['user']}\nAssistant: {turn['answer']}"
+
+    def _truncate_turn(self, turn):
+        """Cut a turn down to max_history_tokens: the answer first, then the question if still too long"""
+        turn = dict(turn)
+        for field in ("answer", "user"):
+            def fits(text):
+                return self.count_tokens(self._turn_text({**turn, field: text})) <= self.max_history_tokens
+
+            if fits(turn[field]):
+                break
+            turn[field] = truncate_words(turn[field], fits)
+        return turn
+
+    def _compact(self):
+        """Move the oldest turns into the summary until the recent turns fit the token budget"""
+        while len(self.turns) > 1 and sum(self.count_tokens(self._turn_text(t)) for t in self.turns) > self.max_history_tokens:
+            turn = self.turns.pop(0)
+            self.summary.append(f"- User asked: {first_sentence(turn['user'])} Assistant replied: {first_sentence(turn['answer'])}")
+
+        # The remaining turn can still be over budget on its own (e.g. one very long answer)
+        if self.turns and self.count_tokens(self._turn_text(self.turns[0])) > self.max_history_tokens:
+            self.turns[0] = self._truncate_turn(self.turns[0])
+
+        # The summary is bounded too: the oldest lines are dropped first
+        while self.summary and self.count_tokens("\n".join(self.summary)) > self.max_summary_tokens:
+            self.summary.pop(0)
+
+    def history_text(self):
+        """Conversation so far, as inserted into the prompt ("" for a new conversation)"""
+        parts = []
+        if self.summary:
+            parts.append("Earlier in the conversation:\n" + "\n".join(self.summary))
+        if self.turns:
+            parts.append("\n".join(self._turn_text(t) for t in self.turns))
+        return "\n\n".join(parts)
+
+    def to_dict(self):
+        """JSON-serialisable state (the token counter is not stored)"""
+        return {
+            "mode": self.mode,
+            "max_history_tokens": self.max_history_tokens,
+            "max_summary_tokens": self.max_summary_tokens,
+            "reuse_threshold": self.reuse_threshold,
+            "turns": self.turns,
+            "summary": self.summary,
+            "last_query_vector": self.last_query_vector,
+            "last_results": [[row, dist] for row, dist in self.last_results]
+        }
+
+    @classmethod
+    def from_dict(cls, data, count_tokens=count_words):
+        session = cls(
+            mode=data["mode"],
+            max_history_tokens=data["max_history_tokens"],
+            max_summary_tokens=data["max_summary_tokens"],
+            reuse_threshold=data["reuse_threshold"],
+            count_tokens=count_tokens
+        )
+        session.turns = data["turns"]
+        session.summary = data["summary"]
+        session.last_query_vector = data["last_query_vector"]
+        session.last_results = [(row, dist) for row, dist in data["last_results"]]
+        return session
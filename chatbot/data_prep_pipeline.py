@@ -0,0 +1,415 @@
+# Data prep task graph
+# Runs the data prep steps as stages: filter per source, combine, near-dedup, chunk, embed, index
+# A stage is skipped when its inputs, parameters and outputs match its last successful run,
+# and stages that do not depend on each other run in parallel processes
+#
+# Run from the repo root, e.g.:
+#   python chatbot/data_prep_pipeline.py                      # everything that is stale
+#   python chatbot/data_prep_pipeline.py --targets index_travel
+#   python chatbot/data_prep_pipeline.py --dry_run
+
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import multilingual_rag_chatbot_sentence_pairs_data_prep as pairs_prep
+
+CACHE_DIR = "data/.pipeline_cache"
+
+# Language ID processes per source, so the three filter stages together roughly fill the CPUs
+LANGID_WORKERS_PER_SOURCE = max(1, (os.cpu_count() or 1) // 3)
+
+# Both indexes use cosine similarity (what the sentence-transformer models are trained for)
+# with float16 storage, half the size of float32 at practically the same scores
+INDEX_METRIC = "cosine"
+INDEX_STORAGE = "float16"
+
+SENTENCE_PAIRS_MODULE = "multilingual_rag_chatbot_sentence_pairs_data_prep"
+
+
+def default_stages(seed=pairs_prep.SAMPLING_SEED):
+    """
+    The data prep graph. Each stage calls module.function(**params, **runtime)
+    inputs/outputs are file (or directory) paths; dependencies are inferred from them
+    runtime holds settings that do not change the result, so they are not part of the cache key
+    """
+    filter_defaults = {
+        "min_length": 3,
+        "max_length": 1000,
+        "remove_duplicates": True,
+        "use_langdetect": True,
+        "max_lines": None,
+        "seed": seed,
+        "print_examples": True
+    }
+    langid_runtime = {
+        "langid_workers": LANGID_WORKERS_PER_SOURCE,
+        "langid_cache": pairs_prep.LANGID_CACHE_FILE
+    }
+
+    return [
+        # Sentence pairs
+        {
+            "name": "filter_tatoeba",
+            "module": SENTENCE_PAIRS_MODULE,
+            "function": "filter_tatoeba",
+            "inputs": [pairs_prep.TATOEBA_INFILE],
+            "outputs": [pairs_prep.TATOEBA_ENG_300K_OUTFILE, pairs_prep.TATOEBA_SPA_300K_OUTFILE],
+            "params": {
+                "infile": pairs_prep.TATOEBA_INFILE,
+                "eng_outfile": pairs_prep.TATOEBA_ENG_300K_OUTFILE,
+                "spa_outfile": pairs_prep.TATOEBA_SPA_300K_OUTFILE,
+                "sample_size": 300000,  # 300k samples
+                **filter_defaults
+            },
+            "runtime": langid_runtime
+        },
+        {
+            "name": "filter_wikimatrix",
+            "module": SENTENCE_PAIRS_MODULE,
+            "function": "filter_parallel_corpus",
+            "inputs": [pairs_prep.WIKIMATRIX_ENG_INFILE, pairs_prep.WIKIMATRIX_SPA_INFILE],
+            "outputs": [pairs_prep.WIKIMATRIX_ENG_300K_OUTFILE, pairs_prep.WIKIMATRIX_SPA_300K_OUTFILE],
+            "params": {
+                "eng_infile": pairs_prep.WIKIMATRIX_ENG_INFILE,
+                "spa_infile": pairs_prep.WIKIMATRIX_SPA_INFILE,
+                "eng_outfile": pairs_prep.WIKIMATRIX_ENG_300K_OUTFILE,
+                "spa_outfile": pairs_prep.WIKIMATRIX_SPA_300K_OUTFILE,
+                "sample_size": 300000,  # 300k samples
+                **filter_defaults
+            },
+            "runtime": langid_runtime
+        },
+        {
+            "name": "filter_opensubtitles",
+            "module": SENTENCE_PAIRS_MODULE,
+            "function": "filter_parallel_corpus",
+            "inputs": [pairs_prep.OPENSUBTITLES_ENG_INFILE, pairs_prep.OPENSUBTITLES_SPA_INFILE],
+            "outputs": [pairs_prep.OPENSUBTITLES_ENG_300K_OUTFILE, pairs_prep.OPENSUBTITLES_SPA_300K_OUTFILE],
+            "params": {
+                "eng_infile": pairs_prep.OPENSUBTITLES_ENG_INFILE,
+                "spa_infile": pairs_prep.OPENSUBTITLES_SPA_INFILE,
+                "eng_outfile": pairs_prep.OPENSUBTITLES_ENG_300K_OUTFILE,
+                "spa_outfile": pairs_prep.OPENSUBTITLES_SPA_300K_OUTFILE,
+                "sample_size": 600000,  # 600k samples
+                **filter_defaults
+            },
+            "runtime": langid_runtime
+        },
+        {
+            "name": "combine_sentence_pairs",
+            "module": SENTENCE_PAIRS_MODULE,
+            "function": "combined_filtered_files_to_jsonl",
+            "inputs": [
+                pairs_prep.TATOEBA_ENG_300K_OUTFILE, pairs_prep.TATOEBA_SPA_300K_OUTFILE,
+                pairs_prep.WIKIMATRIX_ENG_300K_OUTFILE, pairs_prep.WIKIMATRIX_SPA_300K_OUTFILE,
+                pairs_prep.OPENSUBTITLES_ENG_300K_OUTFILE, pairs_prep.OPENSUBTITLES_SPA_300K_OUTFILE
+            ],
+            "outputs": [pairs_prep.COMBINED_OUTFILE],
+            "params": {
+                "pairs_list": [
+                    (pairs_prep.TATOEBA_ENG_300K_OUTFILE, pairs_prep.TATOEBA_SPA_300K_OUTFILE, "tatoeba"),
+                    (pairs_prep.WIKIMATRIX_ENG_300K_OUTFILE, pairs_prep.WIKIMATRIX_SPA_300K_OUTFILE, "wikimatrix"),
+                    (pairs_prep.OPENSUBTITLES_ENG_300K_OUTFILE, pairs_prep.OPENSUBTITLES_SPA_300K_OUTFILE, "opensubtitles")
+                ],
+                "output_file": pairs_prep.COMBINED_OUTFILE
+            }
+        },
+        {
+            "name": "near_dedup_sentence_pairs",
+            "module": "near_dedup",
+            "function": "near_dedup_jsonl",
+            "inputs": [pairs_prep.COMBINED_OUTFILE],
+            "outputs": [pairs_prep.DEDUPED_OUTFILE, pairs_prep.DEDUPED_COLUMNAR_DIR],
+            "params": {
+                "input_file": pairs_prep.COMBINED_OUTFILE,
+                "output_file": pairs_prep.DEDUPED_OUTFILE,
+                "fields": ["en", "es"],
+                "threshold": 0.8,
+                "num_perm": 64,
+                "bands": 16,
+                "seed": seed,
+                "columnar_dir": pairs_prep.DEDUPED_COLUMNAR_DIR
+            }
+        },
+        {
+            "name": "embed_sentence_pairs",
+            "module": "multilingual_rag_chatbot_sentence_pairs_faiss",
+            "function": "embed_sentence_pairs",
+            "inputs": [pairs_prep.DEDUPED_COLUMNAR_DIR],
+            "outputs": ["data/sentence_pairs_embeddings.npy"],
+            "params": {
+                "data_path": pairs_prep.DEDUPED_OUTFILE,
+                "embeddings_file": "data/sentence_pairs_embeddings.npy",
+                "columnar_dir": pairs_prep.DEDUPED_COLUMNAR_DIR
+            }
+        },
+        {
+            "name": "index_sentence_pairs",
+            "module": "multilingual_rag_chatbot_sentence_pairs_faiss",
+            "function": "build_sentence_pairs_index",
+            "inputs": [pairs_prep.DEDUPED_OUTFILE, "data/sentence_pairs_embeddings.npy"],
+            "outputs": ["data/sentence_pairs_index.faiss", "data/sentence_pairs_metadata.jsonl"],
+            "params": {
+                "data_path": pairs_prep.DEDUPED_OUTFILE,
+                "embeddings_file": "data/sentence_pairs_embeddings.npy",
+                "index_file": "data/sentence_pairs_index.faiss",
+                "metadata_file": "data/sentence_pairs_metadata.jsonl",
+                "metric": INDEX_METRIC,
+                "storage": INDEX_STORAGE
+            }
+        },
+
+        # Travel passages (scraping is not a stage, it depends on the network)
+        {
+            "name": "combine_travel",
+            "module": "multilingual_rag_chatbot_travel_data_prep",
+            "function": "combine_jsonl_files",
+            "inputs": ["data/wikivoyage/scraped_cities_data"],
+            "outputs": ["data/combined_travel_data.jsonl"],
+            "params": {
+                "input_dir": "data/wikivoyage/scraped_cities_data",
+                "output_file": "data/combined_travel_data.jsonl"
+            }
+        },
+        {
+            "name": "chunk_travel",
+            "module": "multilingual_rag_chatbot_travel_chunk_data",
+            "function": "chunk_travel_file",
+            "inputs": ["data/combined_travel_data.jsonl"],
+            "outputs": ["data/chunked_travel_info_orig_data.jsonl"],
+            "params": {
+                "input_file": "data/combined_travel_data.jsonl",
+                "output_file": "data/chunked_travel_info_orig_data.jsonl"
+            }
+        },
+        {
+            "name": "embed_travel",
+            "module": "multilingual_rag_chatbot_travel_faiss",
+            "function": "embed_travel_chunks",
+            "inputs": ["data/chunked_travel_info_orig_data.jsonl"],
+            "outputs": ["data/chunked_travel_info_embeddings.npy"],
+            "params": {
+                "chunked_file": "data/chunked_travel_info_orig_data.jsonl",
+                "embeddings_file": "data/chunked_travel_info_embeddings.npy"
+            }
+        },
+        {
+            "name": "index_travel",
+            "module": "multilingual_rag_chatbot_travel_faiss",
+            "function": "build_travel_index",
+            "inputs": ["data/chunked_travel_info_orig_data.jsonl", "data/chunked_travel_info_embeddings.npy"],
+            "outputs": ["data/chunked_travel_info_index.faiss", "data/chunked_travel_info_metadata.jsonl"],
+            "params": {
+                "chunked_file": "data/chunked_travel_info_orig_data.jsonl",
+                "embeddings_file": "data/chunked_travel_info_embeddings.npy",
+                "index_file": "data/chunked_travel_info_index.faiss",
+                "metadata_file": "data/chunked_travel_info_metadata.jsonl",
+                "metric": INDEX_METRIC,
+                "storage": INDEX_STORAGE
+            }
+        }
+    ]
+
+
+def file_hash(path, memo):
+    """
+    Content hash of a file or directory
+    memo maps (path, size, mtime) to a previous hash, so unchanged files are not re-read
+    """
+    if os.path.isdir(path):
+        h = hashlib.blake2b(digest_size=16)
+        for name in sorted(os.listdir(path)):
+            h.update(name.encode("utf-8"))
+            h.update(file_hash(os.path.join(path, name), memo).encode("ascii"))
+        return h.hexdigest()
+
+    stat = os.stat(path)
+    memo_key = f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+    if memo_key not in memo:
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        memo[memo_key] = h.hexdigest()
+    return memo[memo_key]
+
+
+def stage_key(stage, memo):
+    """Cache key of a stage: its function, parameters and the content of its inputs"""
+    payload = {
+        "function": f"{stage['module']}.{stage['function']}",
+        "params": stage["params"],
+        "inputs": {path: file_hash(path, memo) for path in stage["inputs"]}
+    }
+    return hashlib.blake2b(json.dumps(payload, sort_keys=True).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def stamp_path(stage, cache_dir):
+    return os.path.join(cache_dir, f"{stage['name']}.json")
+
+
+def is_stale(stage, memo, cache_dir):
+    """A stage is stale if it never ran, its key changed, or its outputs are missing or were modified"""
+    path = stamp_path(stage, cache_dir)
+    if not os.path.exists(path):
+        return True
+    if not all(os.path.exists(p) for p in stage["inputs"] + stage["outputs"]):
+        return True
+
+    with open(path, "r", encoding="utf-8") as f:
+        stamp = json.load(f)
+
+    if stamp.get("key") != stage_key(stage, memo):
+        return True
+    return stamp.get("outputs") != {p: file_hash(p, memo) for p in stage["outputs"]}
+
+
+def write_stamp(stage, memo, cache_dir, elapsed):
+    stamp = {
+        "key": stage_key(stage, memo),
+        "outputs": {p: file_hash(p, memo) for p in stage["outputs"]},
+        "elapsed_seconds": round(elapsed, 2),
+        "finished_at": time.strftime("%Y-%m-%d %H:%M:%S")
+    }
+    with open(stamp_path(stage, cache_dir), "w", encoding="utf-8") as f:
+        json.dump(stamp, f, indent=2)
+
+
+def stage_levels(stages, targets=None):
+    """
+    Group stages into levels: every stage only depends on stages in earlier levels
+    If targets are given, only they and their upstream stages are kept
+    """
+    producers = {out: s["name"] for s in stages for out in s["outputs"]}
+    deps = {s["name"]: {producers[p] for p in s["inputs"] if p in producers} for s in stages}
+    by_name = {s["name"]: s for s in stages}
+
+    if targets:
+        unknown = set(targets) - set(by_name)
+        if unknown:
+            raise ValueError(f"Unknown stage(s): {', '.join(sorted(unknown))}")
+        wanted = set()
+        frontier = list(targets)
+        while frontier:
+            name = frontier.pop()
+            if name not in wanted:
+                wanted.add(name)
+                frontier.extend(deps[name])
+    else:
+        wanted = set(by_name)
+
+    levels = []
+    done = set()
+    remaining = [s["name"] for s in stages if s["name"] in wanted]
+    while remaining:
+        level = [name for name in remaining if deps[name] <= done]
+        if not level:
+            raise ValueError(f"Cycle in data prep stages: {', '.join(remaining)}")
+        levels.append([by_name[name] for name in level])
+        done.update(level)
+        remaining = [name for name in remaining if name not in done]
+    return levels
+
+
+def _run_stage(module_name, function_name, kwargs):
+    """Worker entry point: import the stage's module and call its function"""
+    start = time.time()
+    func = getattr(importlib.import_module(module_name), function_name)
+    func(**kwargs)
+    return time.time() - start
+
+
+def run_pipeline(stages=None, targets=None, workers=None, force=False, dry_run=False, cache_dir=CACHE_DIR):
+    """
+    Run every stale stage, level by level
+    Independent stages in the same level run in parallel processes (workers=1 runs them in-process)
+    """
+    stages = stages if stages is not None else default_stages()
+    os.makedirs(cache_dir, exist_ok=True)
+
+    memo_path = os.path.join(cache_dir, "file_hashes.json")
+    memo = {}
+    if os.path.exists(memo_path):
+        with open(memo_path, "r", encoding="utf-8") as f:
+            memo = json.load(f)
+
+    start_time = time.time()
+    executed = []
+
+    try:
+        for level in stage_levels(stages, targets):
+            stale = [s for s in level if force or is_stale(s, memo, cache_dir)]
+            for stage in level:
+                status = "RUN" if stage in stale else "up to date"
+                print(f"[{stage['name']}] {status}")
+
+            if dry_run or not stale:
+                continue
+
+            for stage in stale:
+                for path in stage["outputs"]:
+                    out_dir = os.path.dirname(path)
+                    if out_dir:
+                        os.makedirs(out_dir, exist_ok=True)
+
+            calls = [
+                (s["module"], s["function"], {**s["params"], **s.get("runtime", {})})
+                for s in stale
+            ]
+
+            failures = []
+            if len(stale) > 1 and workers != 1:
+                print("-" * 100)
+                print(f"Running {', '.join(s['name'] for s in stale)} in parallel")
+                with ProcessPoolExecutor(max_workers=workers or len(stale)) as executor:
+                    futures = [executor.submit(_run_stage, *call) for call in calls]
+                    for stage, future in zip(stale, futures):
+                        try:
+                            elapsed = future.result()
+                        except Exception as e:
+                            failures.append((stage["name"], e))
+                            continue
+                        write_stamp(stage, memo, cache_dir, elapsed)
+                        executed.append(stage["name"])
+            else:
+                for stage, call in zip(stale, calls):
+                    print("-" * 100)
+                    print(f"Running {stage['name']}")
+                    elapsed = _run_stage(*call)
+                    write_stamp(stage, memo, cache_dir, elapsed)
+                    executed.append(stage["name"])
+
+            # Stages that succeeded keep their stamps, so a re-run only repeats the failed ones
+            if failures:
+                for name, error in failures:
+                    print(f"[{name}] FAILED: {error}")
+                raise RuntimeError(f"Data prep stage(s) failed: {', '.join(name for name, _ in failures)}")
+    finally:
+        with open(memo_path, "w", encoding="utf-8") as f:
+            json.dump(memo, f)
+
+    print(f"\nRan {len(executed)} stage(s) in {time.time() - start_time:.2f} seconds")
+    return executed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the data prep stages that are out of date")
+    parser.add_argument("--targets", nargs="*", help="Only run these stages (and whatever they depend on)")
+    parser.add_argument("--workers", type=int, default=None, help="Max parallel stages (1 = sequential)")
+    parser.add_argument("--seed", type=int, default=pairs_prep.SAMPLING_SEED, help="Seed for corpus sampling")
+    parser.add_argument("--force", action="store_true", help="Re-run stages even if they are up to date")
+    parser.add_argument("--dry_run", action="store_true", help="Only show which stages would run")
+    args = parser.parse_args()
+
+    run_pipeline(
+        stages=default_stages(seed=args.seed),
+        targets=args.targets,
+        workers=args.workers,
+        force=args.force,
+        dry_run=args.dry_run
+    )
@@ -0,0 +1,208 @@
+# Retrieval quality and speed evaluation across FAISS index configurations
+# Takes labelled query -> relevant row pairs (a JSONL file, or pairs derived from the sentence pairs:
+# one side of a row is the query, the row itself the answer), builds every configured index over the
+# saved embeddings, and reports agreement with exact search, recall@k, MRR, QPS, build time and index
+# memory in one table, so ANN parameters are chosen from measurements
+#
+# Agreement with exact search (exact_overlap@k) is the main measure of what an ANN setting loses.
+# Recall of derived labels only means something when the queries are encoded into the same space as
+# the embedded side: the default sentence pairs index embeds the English side with the English-only
+# all-MiniLM-L12-v2, so labels default to English queries; Spanish queries (--query_field es) need
+# embeddings and --model from a multilingual encoder
+
+import argparse
+import json
+import random
+import time
+
+import faiss
+import numpy as np
+import pandas as pd
+from sentence_transformers import SentenceTransformer
+from faiss_index_utils import SQ8_TRAIN_SIZE, build_faiss_index
+
+EMBEDDINGS_FILE = "data/sentence_pairs_embeddings.npy"  # add _version# if needed
+METADATA_FILE = "data/sentence_pairs_metadata.jsonl"  # add _version# if needed
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L12-v2"
+OUTPUT_FILE = "results/retrieval_eval.csv"
+
+# Each config is one index; list-valued search parameters are swept without rebuilding
+DEFAULT_CONFIGS = [
+    {"name": "flat_l2", "type": "flat", "metric": "l2", "storage": "float32"},
+    {"name": "flat_cosine", "type": "flat", "metric": "cosine", "storage": "float32"},
+    {"name": "flat_cosine_fp16", "type": "flat", "metric": "cosine", "storage": "float16"},
+    {"name": "flat_cosine_sq8", "type": "flat", "metric": "cosine", "storage": "sq8"},
+    {"name": "hnsw32_cosine", "type": "hnsw", "metric": "cosine", "M": 32, "efSearch": [16, 64, 256]},
+    {"name": "ivf_cosine", "type": "ivf", "metric": "cosine", "nlist": 1024, "nprobe": [1, 8, 32, 128]}
+]
+
+
+def derive_translation_labels(metadata_file=METADATA_FILE, num_queries=1000, limit=None, query_field="en", seed=42):
+    """
+    Labelled pairs from the sentence pairs: the query_field side of a sampled row is the query and the
+    row itself is the relevant result. Rows whose query text appears more than once all count as relevant
+    query_field "en" queries the embedded side; "es" is a cross-lingual test and needs a multilingual encoder
+    """
+    rows_by_text = {}
+    with open(metadata_file, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if limit is not None and i >= limit:
+                break
+            text = json.loads(line).get(query_field, "").strip()
+            if text:
+                rows_by_text.setdefault(text, []).append(i)
+
+    texts = sorted(rows_by_text)
+    sample = random.Random(seed).sample(texts, min(num_queries, len(texts)))
+    return [{"query": text, "relevant": rows_by_text[text]} for text in sample]
+
+
+def load_labels(path):
+    """JSONL lines of {"query": ..., "relevant": [row ids]}"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def build_index(embeddings, config):
+    """Build the index described by config; flat types go through build_faiss_index"""
+    if config["type"] == "flat":
+        # build_faiss_index normalises cosine inputs in place, keep the shared array intact
+        return build_faiss_index(np.array(embeddings, dtype="float32"), metric=config["metric"], storage=config["storage"])
+
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    faiss_metric = faiss.METRIC_L2
+    if config["metric"] == "cosine":
+        embeddings = embeddings.copy()  # don't normalise the shared array in place
+        faiss.normalize_L2(embeddings)
+        faiss_metric = faiss.METRIC_INNER_PRODUCT
+
+    if config["type"] == "hnsw":
+        index = faiss.index_factory(embeddings.shape[1], f"HNSW{config['M']}", faiss_metric)
+    elif config["type"] == "ivf":
+        index = faiss.index_factory(embeddings.shape[1], f"IVF{config['nlist']},Flat", faiss_metric)
+        train = embeddings
+        if len(embeddings) > SQ8_TRAIN_SIZE:
+            train = embeddings[np.sort(np.random.RandomState(0).choice(len(embeddings), SQ8_TRAIN_SIZE, replace=False))]
+        index.train(train)
+    else:
+        raise ValueError(f"Unknown index type '{config['type']}'")
+
+    index.add(embeddings)
+    return index
+
+
+def search_settings(config):
+    """(label, {parameter: value}) for every search-time setting of a config"""
+    for parameter in ["efSearch", "nprobe"]:
+        if parameter in config:
+            return [(f"{parameter}={value}", {parameter: value}) for value in config[parameter]]
+    return [("", {})]
+
+
+def score(retrieved, relevant_sets, ks):
+    """recall@k (share of relevant rows found in the top k) and MRR over the full result list"""
+    metrics = {f"recall@{k}": 0.0 for k in ks}
+    mrr = 0.0
+    for row_ids, relevant in zip(retrieved, relevant_sets):
+        for k in ks:
+            metrics[f"recall@{k}"] += len(relevant.intersection(row_ids[:k])) / len(relevant)
+        for rank, row_id in enumerate(row_ids, start=1):
+            if row_id in relevant:
+                mrr += 1 / rank
+                break
+    n = len(relevant_sets)
+    metrics = {name: value / n for name, value in metrics.items()}
+    metrics["mrr"] = mrr / n
+    return metrics
+
+
+def evaluate(embeddings, query_vectors, labels, configs=DEFAULT_CONFIGS, ks=(1, 5, 10)):
+    """Build and search every config; returns one result row per config and search setting"""
+    max_k = max(ks)
+    relevant_sets = [set(label["relevant"]) for label in labels]
+    exact = {}  # metric -> exact top-k ids, to measure how much an ANN setting loses
+    rows = []
+
+    for config in configs:
+        start = time.perf_counter()
+        index = build_index(embeddings, config)
+        build_s = time.perf_counter() - start
+        memory_mb = faiss.serialize_index(index).nbytes / 1e6
+
+        queries = np.ascontiguousarray(query_vectors, dtype="float32").copy()
+        if config["metric"] == "cosine":
+            faiss.normalize_L2(queries)
+
+        for setting, parameters in search_settings(config):
+            for parameter, value in parameters.items():
+                faiss.ParameterSpace().set_index_parameter(index, parameter, value)
+
+            # One query at a time, as the chatbot searches
+            start = time.perf_counter()
+            ids = np.vstack([index.search(queries[i:i + 1], max_k)[1] for i in range(len(queries))])
+            search_s = time.perf_counter() - start
+
+            retrieved = [[int(i) for i in row if i >= 0] for row in ids]
+            if config["type"] == "flat" and config["storage"] == "float32":
+                exact.setdefault(config["metric"], retrieved)
+
+            result = {"config": config["name"], "search": setting}
+            if config["metric"] in exact:
+                result[f"exact_overlap@{max_k}"] = float(np.mean([
+                    len(set(a) & set(b)) / max(len(b), 1) for a, b in zip(retrieved, exact[config["metric"]])
+                ]))
+            result.update({
+                **score(retrieved, relevant_sets, ks),
+                "qps": len(queries) / search_s,
+                "latency_ms": search_s / len(queries) * 1000,
+                "build_s": build_s,
+                "memory_mb": memory_mb
+            })
+            rows.append(result)
+            overlap = result.get(f"exact_overlap@{max_k}")
+            print(f"{config['name']} {setting}: exact_overlap@{max_k} {'n/a' if overlap is None else f'{overlap:.3f}'}, recall@{max_k} {result[f'recall@{max_k}']:.3f}, {result['qps']:.0f} q/s")
+
+        del index
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare recall@k, MRR, QPS and memory across FAISS index configurations")
+    parser.add_argument("--labels", default=None, help="JSONL of {query, relevant} pairs (default: derived from translations)")
+    parser.add_argument("--num_queries", type=int, default=1000, help="Derived queries to sample")
+    parser.add_argument("--query_field", default="en", help="Sentence-pair side used as the query for derived labels (es needs multilingual embeddings and --model)")
+    parser.add_argument("--limit", type=int, default=None, help="Only index the first N rows")
+    parser.add_argument("--configs", default=None, help="JSON file with a list of index configs (default DEFAULT_CONFIGS)")
+    parser.add_argument("--embeddings", default=EMBEDDINGS_FILE)
+    parser.add_argument("--metadata", default=METADATA_FILE)
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME, help="Query encoder, must match the embeddings")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.labels:
+        labels = load_labels(args.labels)
+    else:
+        labels = derive_translation_labels(args.metadata, args.num_queries, args.limit, args.query_field, args.seed)
+
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs, "r", encoding="utf-8") as f:
+            configs = json.load(f)
+
+    embeddings = np.load(args.embeddings, mmap_mode="r")
+    if args.limit:
+        embeddings = embeddings[:args.limit]
+    labels = [label for label in labels if all(row < len(embeddings) for row in label["relevant"])]
+    print(f"Evaluating {len(labels)} queries over {len(embeddings)} rows")
+
+    model = SentenceTransformer(args.model)
+    query_vectors = model.encode([label["query"] for label in labels], batch_size=128, convert_to_numpy=True, show_progress_bar=True)
+
+    table = evaluate(np.asarray(embeddings, dtype="float32"), query_vectors, labels, configs)
+    pd.set_option("display.width", 200)
+    print()
+    print(table.round(4).to_string(index=False))
+    table.to_csv(args.output, index=False)
+    print(f"\nSaved results to {args.output}")
@@ -0,0 +1,15 @@
+# Experiment settings shared by the experiment runners
+# Kept apart from run_prompt_experiments so the run planner can read them without loading the models
+
+import json
+
+# Define generation settings
+GENERATION_SETTINGS = {
+    "deterministic": {"do_sample": False},
+    "balanced": {"do_sample": True, "top_p": 0.85, "temperature": 0.6}
+}
+
+
+def load_experiment_queries(path="chatbot/experiment_queries.json"):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
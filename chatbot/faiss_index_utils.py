@@ -0,0 +1,100 @@
+# Shared helpers for building and querying the FAISS indexes
+# metric "cosine" L2-normalises vectors and searches by inner product,
+# storage "float16" / "sq8" keeps 2-byte / 1-byte codes per dimension instead of float32
+
+import faiss
+import numpy as np
+
+INDEX_METRICS = ("l2", "cosine")
+INDEX_STORAGE = ("float32", "float16", "sq8")
+
+# Vectors used to train the SQ8 quantiser (it only needs per-dimension min/max)
+SQ8_TRAIN_SIZE = 100000
+
+
+def build_faiss_index(embeddings, metric="l2", storage="float32"):
+    """
+    Build a flat FAISS index over the embeddings
+    metric: "l2" (raw vectors, L2 distance) or "cosine" (normalised vectors, inner product)
+    storage: "float32", "float16" or "sq8" (scalar-quantised 8-bit codes)
+    """
+    if metric not in INDEX_METRICS:
+        raise ValueError(f"Unsupported metric '{metric}', expected one of {INDEX_METRICS}")
+    if storage not in INDEX_STORAGE:
+        raise ValueError(f"Unsupported storage '{storage}', expected one of {INDEX_STORAGE}")
+
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    dimension = embeddings.shape[1]
+
+    if metric == "cosine":
+        faiss.normalize_L2(embeddings)  # in place
+        faiss_metric = faiss.METRIC_INNER_PRODUCT
+    else:
+        faiss_metric = faiss.METRIC_L2
+
+    if storage == "float32":
+        index = faiss.IndexFlat(dimension, faiss_metric)
+    elif storage == "float16":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss_metric)
+    else:
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss_metric)
+
+    if not index.is_trained:
+        if len(embeddings) > SQ8_TRAIN_SIZE:
+            sample = np.random.RandomState(0).choice(len(embeddings), SQ8_TRAIN_SIZE, replace=False)
+            index.train(embeddings[np.sort(sample)])
+        else:
+            index.train(embeddings)
+
+    index.add(embeddings)
+    return index
+
+
+def open_index(path, mmap=True):
+    """Read an index with its codes memory-mapped (falls back to a full read for index types that can't be mapped)"""
+    if mmap:
+        try:
+            # IO_FLAG_MMAP_IFC maps the codes of flat and SQ indexes, IO_FLAG_MMAP only the inverted lists of IVF indexes
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print(f"Could not memory-map {path} ({str(e).splitlines()[0]}), reading it into memory")
+    return faiss.read_index(path)
+
+
+def uses_cosine(index):
+    """True if the index stores normalised vectors searched by inner product"""
+    return index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+
+def prepare_queries(index, vectors):
+    """Cast query vectors to float32 and apply the same normalisation the index was built with"""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    if uses_cosine(index):
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def to_distances(index, scores):
+    """
+    Convert raw FAISS scores to distances where lower is better:
+    squared L2 for L2 indexes, 1 - cosine similarity for cosine indexes
+    """
+    return 1.0 - scores if uses_cosine(index) else scores
+
+
+def build_language_filters(metadata, field="lang"):
+    """
+    Search parameters restricting a search to the rows of each value of a metadata field (e.g. "en" / "es")
+    Returns {value: faiss.SearchParameters}; pass one as index.search(..., params=...) to search only
+    that value's rows of the single index, so no per-language copy of the vectors is kept in memory
+    """
+    ids_by_value = {}
+    for i, row in enumerate(metadata):
+        value = row.get(field)
+        if value:
+            ids_by_value.setdefault(value, []).append(i)
+
+    return {
+        value: faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.array(ids, dtype="int64")))
+        for value, ids in ids_by_value.items()
+    }
@@ -0,0 +1,51 @@
+# On-disk cache of deterministic generations for experiment sweeps
+# A greedy (do_sample=False) generation only depends on the prompt, the model and the generation
+# settings, so repeated sweeps can reuse earlier outputs instead of running the model again
+# Stored in SQLite (like the language ID cache) so several experiment workers can share it
+
+import hashlib
+import json
+import os
+import sqlite3
+
+GENERATION_CACHE_FILE = "data/generation_cache.sqlite"
+
+
+def is_deterministic(generation_args):
+    return not generation_args.get("do_sample", False)
+
+
+def generation_key(prompt, model_name, generation_args):
+    """Hash of (prompt, model, settings); settings are serialised with sorted keys"""
+    settings = json.dumps(generation_args, sort_keys=True)
+    return hashlib.sha256(f"{model_name}\t{settings}\t{prompt}".encode("utf-8")).hexdigest()
+
+
+def open_generation_cache(cache_path=GENERATION_CACHE_FILE):
+    """Open (or create) the SQLite cache of generation key -> generated text"""
+    cache_dir = os.path.dirname(cache_path)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    conn = sqlite3.connect(cache_path, timeout=60)  # experiment workers may share one cache
+    conn.execute("CREATE TABLE IF NOT EXISTS generations (key TEXT PRIMARY KEY, model TEXT, output TEXT)")
+    return conn
+
+
+def cache_lookup(conn, keys):
+    """Fetch cached outputs for a list of keys, in chunks below SQLite's variable limit"""
+    found = {}
+    unique_keys = list(set(keys))
+    for i in range(0, len(unique_keys), 900):
+        chunk = unique_keys[i:i + 900]
+        placeholders = ",".join("?" * len(chunk))
+        found.update(conn.execute(f"SELECT key, output FROM generations WHERE key IN ({placeholders})", chunk))
+    return found
+
+
+def cache_store(conn, model_name, outputs):
+    """Store {key: output} generated by model_name"""
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO generations (key, model, output) VALUES (?, ?, ?)",
+            [(key, model_name, output) for key, output in outputs.items()]
+        )
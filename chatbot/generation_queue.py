@@ -0,0 +1,160 @@
+# Bounded generation queue shared by all chat sessions
+# Generations run one at a time (per worker) in submission order instead of every session
+# calling the pipeline at once. Each job's retrieval/prompt building starts as soon as it is
+# submitted, so it overlaps with waiting in the queue. Jobs can be cancelled per session,
+# also mid-generation through a stopping criterion, and a full queue rejects new jobs
+# (backpressure) instead of letting latency grow without bound
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+
+import torch
+from transformers import StoppingCriteria
+
+
+class QueueFull(Exception):
+    """Raised when the queue already holds max_pending jobs"""
+
+
+class CancelStoppingCriteria(StoppingCriteria):
+    """Stops model.generate as soon as the job's cancel event is set"""
+
+    def __init__(self, cancel_event):
+        self.cancel_event = cancel_event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.cancel_event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+class TokenTimingCriteria(StoppingCriteria):
+    """
+    Never stops generation; model.generate calls it once per generated token, which gives the
+    time to first token (prefill + first decode step) and the number of decode steps
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self.steps = 0
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.steps += 1
+        return torch.zeros((input_ids.shape[0],), dtype=torch.bool, device=input_ids.device)
+
+    def ttft_ms(self):
+        return None if self.first_token_at is None else (self.first_token_at - self.start) * 1000
+
+
+class GenerationJob:
+    """One queued request: a prepare future (retrieval + prompt) and a result future"""
+
+    def __init__(self, session_id, prepared=None, generate_fn=None):
+        self.session_id = session_id
+        self.prepared = prepared
+        self.generate_fn = generate_fn
+        self.cancel_event = threading.Event()
+        self.future = Future()
+        self.submitted_at = time.time()
+
+    @classmethod
+    def completed(cls, session_id, result):
+        """A job that needs no generation (e.g. a response cache hit)"""
+        job = cls(session_id)
+        job.future.set_result(result)
+        return job
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        """Job result; raises CancelledError if the job was cancelled"""
+        return self.future.result(timeout)
+
+
+class GenerationQueue:
+    """Thread-safe FIFO of generation jobs with a fixed number of generation workers"""
+
+    def __init__(self, max_pending=8, workers=1, prepare_workers=4):
+        """
+        max_pending: jobs waiting (not yet generating) before submit raises QueueFull
+        workers: generations running at once, 1 keeps a single-GPU model from contending with itself
+        prepare_workers: threads for retrieval and prompt building, which run while jobs wait
+        """
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._running = set()
+        self._condition = threading.Condition()
+        self._prepare_pool = ThreadPoolExecutor(max_workers=prepare_workers, thread_name_prefix="prepare")
+
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"generation-{i}", daemon=True).start()
+
+    def submit(self, session_id, prepare_fn, generate_fn):
+        """
+        Queue a job: prepare_fn() starts right away, generate_fn(prepared, cancel_event) runs
+        when the job reaches the front of the queue. Raises QueueFull when the queue is full
+        """
+        with self._condition:
+            if len(self._pending) >= self.max_pending:
+                raise QueueFull(f"{len(self._pending)} requests already waiting")
+            job = GenerationJob(session_id, self._prepare_pool.submit(prepare_fn), generate_fn)
+            self._pending.append(job)
+            self._condition.notify()
+        return job
+
+    def cancel(self, session_id):
+        """Cancel every queued or running job of a session; returns the number of jobs cancelled"""
+        with self._condition:
+            jobs = [job for job in list(self._pending) + list(self._running) if job.session_id == session_id]
+            for job in jobs:
+                job.cancel()
+                if job in self._pending:
+                    self._pending.remove(job)
+                    job.future.set_exception(CancelledError())
+        return len(jobs)
+
+    def position(self, job):
+        """Jobs ahead of this one (0 once it is generating or done)"""
+        with self._condition:
+            try:
+                return self._pending.index(job) + len(self._running)
+            except ValueError:
+                return 0
+
+    def depth(self):
+        """Jobs waiting or generating"""
+        with self._condition:
+            return len(self._pending) + len(self._running)
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                job = self._pending.popleft()
+                self._running.add(job)
+
+            try:
+                self._run(job)
+            finally:
+                with self._condition:
+                    self._running.discard(job)
+
+    def _run(self, job):
+        try:
+            prepared = job.prepared.result()
+            if job.cancel_event.is_set():
+                raise CancelledError()
+            result = job.generate_fn(prepared, job.cancel_event)
+            if job.cancel_event.is_set():
+                raise CancelledError()
+            job.future.set_result(result)
+        except Exception as e:
+            job.future.set_exception(e)
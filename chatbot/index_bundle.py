@@ -0,0 +1,276 @@
+# Versioned index bundles: a FAISS index, its metadata and a manifest that ties them together
+# The manifest records the row count, dimension, metric, embedding model and the size and SHA-256
+# of both files. Loading checks sizes, the metadata hash (computed while the metadata is parsed, so
+# it costs little extra), row counts and dimension, so a mismatched index/metadata pair fails loudly
+# instead of returning the wrong context
+#
+# Layout of <data_dir>/bundles/<name>:
+#   CURRENT                    version the chatbot loads
+#   <version>/index.faiss
+#   <version>/metadata.jsonl
+#   <version>/manifest.json
+#
+# A version directory is complete before it is renamed into place and CURRENT is replaced atomically,
+# so a running chatbot can pick up a rebuilt bundle (see reload_indexes) without ever seeing half of one
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import faiss
+
+from faiss_index_utils import open_index, uses_cosine
+
+BUNDLE_FORMAT = "index-bundle-v1"
+BUNDLES_DIR = "bundles"
+INDEX_FILE = "index.faiss"
+METADATA_FILE = "metadata.jsonl"
+MANIFEST_FILE = "manifest.json"
+KEEP_VERSIONS = 3  # older versions are deleted when a new one is published (for rollback with activate)
+
+
+class IndexBundle:
+    """A loaded index with its metadata rows and manifest (manifest is None for unbundled files)"""
+
+    def __init__(self, index, metadata, manifest=None, path=None):
+        self.index = index
+        self.metadata = metadata
+        self.manifest = manifest
+        self.path = path
+
+    @property
+    def version(self):
+        return self.manifest["version"] if self.manifest else None
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def bundle_root(data_dir, name):
+    return os.path.join(data_dir, BUNDLES_DIR, name)
+
+
+def current_version(data_dir, name):
+    """Version CURRENT points to, or None if no bundle was published"""
+    try:
+        with open(os.path.join(bundle_root(data_dir, name), "CURRENT"), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def list_versions(data_dir, name):
+    root = bundle_root(data_dir, name)
+    if not os.path.isdir(root):
+        return []
+    return sorted(v for v in os.listdir(root) if not v.startswith(".") and os.path.isfile(os.path.join(root, v, MANIFEST_FILE)))
+
+
+def activate(data_dir, name, version):
+    """Point CURRENT at a published version (atomic; also used to roll back)"""
+    if version not in list_versions(data_dir, name):
+        raise ValueError(f"Bundle '{name}' has no version '{version}' in {bundle_root(data_dir, name)}")
+    tmp_path = os.path.join(bundle_root(data_dir, name), "CURRENT.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(bundle_root(data_dir, name), "CURRENT"))
+
+
+def publish_bundle(data_dir, name, index_file, metadata_file, embedder, version=None, make_current=True, keep=KEEP_VERSIONS):
+    """
+    Copy an index and its metadata into a new bundle version with a manifest, then make it current
+    Raises ValueError (and publishes nothing) if the metadata row count doesn't match the index
+    Returns the version
+    """
+    if version is None:
+        now = time.time()  # microseconds keep same-second publishes apart (and in order)
+        version = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now % 1 * 1e6):06d}"
+    root = bundle_root(data_dir, name)
+    final_dir = os.path.join(root, version)
+    if os.path.exists(final_dir):
+        raise ValueError(f"Bundle '{name}' version '{version}' already exists")
+    staging_dir = os.path.join(root, f".{version}.tmp")
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+
+    try:
+        shutil.copyfile(index_file, os.path.join(staging_dir, INDEX_FILE))
+        index = open_index(os.path.join(staging_dir, INDEX_FILE))
+
+        # Copy the metadata while hashing and counting it
+        rows, digest = 0, hashlib.sha256()
+        with open(metadata_file, "rb") as f_in, open(os.path.join(staging_dir, METADATA_FILE), "wb") as f_out:
+            for line in f_in:
+                digest.update(line)
+                f_out.write(line)
+                rows += 1
+        if rows != index.ntotal:
+            raise ValueError(f"{metadata_file} has {rows} rows but {index_file} has {index.ntotal} vectors")
+
+        manifest = {
+            "format": BUNDLE_FORMAT,
+            "name": name,
+            "version": version,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "rows": rows,
+            "dimension": index.d,
+            "metric": "cosine" if uses_cosine(index) else "l2",
+            "index_type": type(index).__name__,
+            "embedder": embedder,
+            "files": {
+                "index": {"file": INDEX_FILE, "bytes": os.path.getsize(os.path.join(staging_dir, INDEX_FILE)), "sha256": file_sha256(os.path.join(staging_dir, INDEX_FILE))},
+                "metadata": {"file": METADATA_FILE, "bytes": os.path.getsize(os.path.join(staging_dir, METADATA_FILE)), "sha256": digest.hexdigest()}
+            }
+        }
+        del index
+        _write_json_atomic(os.path.join(staging_dir, MANIFEST_FILE), manifest)
+        os.rename(staging_dir, final_dir)  # the version appears complete or not at all
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    if make_current:
+        activate(data_dir, name, version)
+        _prune(data_dir, name, keep)
+    print(f"Published bundle '{name}' version {version} ({rows} rows) to {final_dir}")
+    return version
+
+
+def _prune(data_dir, name, keep):
+    current = current_version(data_dir, name)
+    old = [v for v in list_versions(data_dir, name) if v != current]
+    for version in old[:max(len(old) - (keep - 1), 0)]:
+        shutil.rmtree(os.path.join(bundle_root(data_dir, name), version), ignore_errors=True)
+
+
+def read_manifest(bundle_dir):
+    with open(os.path.join(bundle_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"Unsupported bundle format in {bundle_dir}: {manifest.get('format')}")
+    return manifest
+
+
+def load_bundle(bundle_dir, embedder=None, verify_index_hash=False):
+    """
+    Load and validate one bundle version directory
+    embedder: model the caller will encode queries with; must match the one the index was built with
+    verify_index_hash: also hash the index file (reads it twice; sizes, row count and dimension are always checked)
+    Raises ValueError on any mismatch
+    """
+    manifest = read_manifest(bundle_dir)
+    files = manifest["files"]
+    index_path = os.path.join(bundle_dir, files["index"]["file"])
+    metadata_path = os.path.join(bundle_dir, files["metadata"]["file"])
+
+    if embedder is not None and manifest["embedder"] != embedder:
+        raise ValueError(f"Bundle {bundle_dir} was built with {manifest['embedder']}, queries are encoded with {embedder}")
+    for key, path in (("index", index_path), ("metadata", metadata_path)):
+        if os.path.getsize(path) != files[key]["bytes"]:
+            raise ValueError(f"{path} is {os.path.getsize(path)} bytes, manifest says {files[key]['bytes']}")
+    if verify_index_hash and file_sha256(index_path) != files["index"]["sha256"]:
+        raise ValueError(f"{index_path} does not match the manifest hash")
+
+    metadata, digest = [], hashlib.sha256()
+    with open(metadata_path, "rb") as f:
+        for line in f:
+            digest.update(line)
+            metadata.append(json.loads(line))
+    if digest.hexdigest() != files["metadata"]["sha256"]:
+        raise ValueError(f"{metadata_path} does not match the manifest hash")
+
+    index = faiss.read_index(index_path)
+    if not (index.ntotal == len(metadata) == manifest["rows"]):
+        raise ValueError(f"Bundle {bundle_dir}: {index.ntotal} vectors, {len(metadata)} metadata rows, manifest says {manifest['rows']}")
+    if index.d != manifest["dimension"]:
+        raise ValueError(f"Bundle {bundle_dir}: index dimension {index.d}, manifest says {manifest['dimension']}")
+    return IndexBundle(index, metadata, manifest, bundle_dir)
+
+
+def load_unbundled(index_path, metadata_path):
+    """Load a plain index/metadata pair (no manifest), checking that the row counts match"""
+    index = faiss.read_index(index_path)
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        metadata = [json.loads(line) for line in f]
+    if index.ntotal != len(metadata):
+        raise ValueError(f"{index_path} has {index.ntotal} vectors but {metadata_path} has {len(metadata)} rows")
+    return IndexBundle(index, metadata, None, os.path.dirname(index_path))
+
+
+def load_index(data_dir, name, unbundled_files, embedder=None):
+    """
+    Load the current bundle called name, or the unbundled (index file, metadata file) in data_dir if none was published
+    Once a bundle exists the plain files are ignored, so a warning is printed if they are newer than CURRENT
+    (e.g. rebuilt with --no_bundle); publish them or remove the bundle to load them
+    """
+    index_path, metadata_path = (os.path.join(data_dir, file) for file in unbundled_files)
+    version = current_version(data_dir, name)
+    if version is None:
+        print(f"Loading '{name}' from unbundled files {index_path}, {metadata_path}")
+        return load_unbundled(index_path, metadata_path)
+
+    current_path = os.path.join(bundle_root(data_dir, name), "CURRENT")
+    newer = [path for path in (index_path, metadata_path) if os.path.exists(path) and os.path.getmtime(path) > os.path.getmtime(current_path)]
+    if newer:
+        print(f"Warning: {', '.join(newer)} changed after bundle '{name}' version {version} was made current and will be ignored; publish them to load them")
+    print(f"Loading '{name}' from bundle version {version}")
+    return load_bundle(os.path.join(bundle_root(data_dir, name), version), embedder)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish, verify and switch versioned index bundles")
+    parser.add_argument("--data_dir", default=os.environ.get("CHATBOT_DATA_DIR", "data"))
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    publish = commands.add_parser("publish", help="Create a new version from an index and metadata file and make it current")
+    publish.add_argument("name")
+    publish.add_argument("--index", required=True)
+    publish.add_argument("--metadata", required=True)
+    publish.add_argument("--embedder", required=True, help="Embedding model the index was built with")
+    publish.add_argument("--version", default=None)
+    publish.add_argument("--no_activate", action="store_true", help="Publish without switching CURRENT")
+
+    verify = commands.add_parser("verify", help="Fully verify a version (default: current), including the index hash")
+    verify.add_argument("name")
+    verify.add_argument("--version", default=None)
+
+    list_parser = commands.add_parser("list", help="List published versions")
+    list_parser.add_argument("name")
+
+    activate_parser = commands.add_parser("activate", help="Point CURRENT at a version (e.g. roll back)")
+    activate_parser.add_argument("name")
+    activate_parser.add_argument("version")
+
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        publish_bundle(args.data_dir, args.name, args.index, args.metadata, args.embedder, args.version, not args.no_activate)
+    elif args.command == "verify":
+        version = args.version or current_version(args.data_dir, args.name)
+        if version is None:
+            raise SystemExit(f"No bundle '{args.name}' in {args.data_dir}")
+        bundle = load_bundle(os.path.join(bundle_root(args.data_dir, args.name), version), verify_index_hash=True)
+        print(f"Bundle '{args.name}' version {version} OK: {len(bundle.metadata)} rows, dimension {bundle.index.d}, embedder {bundle.manifest['embedder']}")
+    elif args.command == "list":
+        current = current_version(args.data_dir, args.name)
+        for version in list_versions(args.data_dir, args.name):
+            manifest = read_manifest(os.path.join(bundle_root(args.data_dir, args.name), version))
+            print(f"{'*' if version == current else ' '} {version}  {manifest['rows']} rows  {manifest['metric']}/{manifest['index_type']}  {manifest['embedder']}")
+    else:
+        activate(args.data_dir, args.name, args.version)
+        print(f"Bundle '{args.name}' now at version {args.version}")
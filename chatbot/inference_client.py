@@ -0,0 +1,84 @@
+# Client for an external text-generation server
+# Lets the chatbot send generations to a separate inference server (e.g. Hugging Face
+# text-generation-inference serving Mistral) instead of loading the LLM in the same process
+# RemoteTextGenerator is called like the transformers pipeline, so callers don't change
+# StubTextGenerator is a deterministic stand-in with the same interface for benchmarks
+
+import hashlib
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Generation arguments the server understands (pipeline-only ones like batch_size are dropped)
+SERVER_PARAMETERS = ("max_new_tokens", "do_sample", "top_p", "temperature", "top_k", "repetition_penalty")
+
+
+class RemoteTextGenerator:
+    """Pipeline-compatible wrapper around a text-generation-inference style HTTP server"""
+
+    def __init__(self, url, timeout=120):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _generate(self, prompt, **generation_args):
+        parameters = {key: value for key, value in generation_args.items() if key in SERVER_PARAMETERS}
+        response = self.session.post(
+            f"{self.url}/generate",
+            json={"inputs": prompt, "parameters": parameters},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        # The pipeline returns prompt + continuation by default, keep that shape
+        return [{"generated_text": prompt + response.json()["generated_text"]}]
+
+    def __call__(self, prompts, batch_size=1, **generation_args):
+        """Generate for one prompt (returns [{"generated_text": ...}]) or a list (returns one such list per prompt)"""
+        if isinstance(prompts, str):
+            return self._generate(prompts, **generation_args)
+
+        # The server batches concurrent requests itself, so a batch is sent as parallel requests
+        with ThreadPoolExecutor(max_workers=max(batch_size, 1)) as executor:
+            return list(executor.map(lambda prompt: self._generate(prompt, **generation_args), prompts))
+
+    def health(self):
+        """True if the server answers its health endpoint"""
+        try:
+            return self.session.get(f"{self.url}/health", timeout=5).ok
+        except requests.RequestException:
+            return False
+
+
+STUB_VOCABULARY = (
+    "the city museum market beach plaza tour local food train bus night street old town "
+    "la ciudad museo mercado playa plaza comida tren noche calle centro visitar"
+).split()
+
+
+class StubTextGenerator:
+    """
+    Pipeline-compatible generator that answers deterministically without a model
+    The answer depends only on the prompt; seconds_per_token optionally mimics decode speed
+    """
+
+    def __init__(self, answer_tokens=64, seconds_per_token=0.0):
+        self.answer_tokens = answer_tokens
+        self.seconds_per_token = seconds_per_token
+
+    def _generate(self, prompt, max_new_tokens=512, **generation_args):
+        seed = int.from_bytes(hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).digest(), "little")
+        n_tokens = min(self.answer_tokens, max_new_tokens)
+        if self.seconds_per_token:
+            time.sleep(n_tokens * self.seconds_per_token)
+        words = random.Random(seed).choices(STUB_VOCABULARY, k=n_tokens)
+        return [{"generated_text": prompt + " " + " ".join(words)}]
+
+    def __call__(self, prompts, batch_size=1, **generation_args):
+        if isinstance(prompts, str):
+            return self._generate(prompts, **generation_args)
+        return [self._generate(prompt, **generation_args) for prompt in prompts]
+
+    def health(self):
+        return True
@@ -0,0 +1,202 @@
+# Inspect FAISS indexes and their metadata without loading either fully
+# The index is opened with IO_FLAG_MMAP_IFC (IO_FLAG_MMAP for IVF indexes), so vector codes stay on disk and are paged in as they are
+# read; vectors are then reconstructed in fixed-size chunks and metadata is streamed line by line.
+# Memory stays bounded by the chunk size, plus 8 bytes per vector for the duplicate check and one
+# counter per distinct value of the histogram fields
+#
+# Reports: index type/metric/size, vector norm stats, exact duplicate vectors, metadata/index
+# alignment (row counts and malformed rows) and per-field histograms (e.g. city, source, lang)
+
+import argparse
+import json
+import os
+from collections import Counter
+from itertools import islice
+
+import numpy as np
+
+from faiss_index_utils import open_index, uses_cosine
+from index_bundle import INDEX_FILE, METADATA_FILE, bundle_root, current_version
+
+DATA_DIR = os.environ.get("CHATBOT_DATA_DIR", "data")
+
+# Indexes the chatbot loads: name -> (index file, metadata file), used when no bundle was published
+CHATBOT_INDEXES = {
+    "sentence_pairs": ("sentence_pairs_index.faiss", "sentence_pairs_metadata.jsonl"),  # add _version# if needed
+    "travel": ("chunked_travel_info_index.faiss", "chunked_travel_info_metadata.jsonl")  # add _version# if needed
+}
+
+HISTOGRAM_FIELDS = ["source", "city", "lang"]
+CHUNK_SIZE = 65536  # vectors reconstructed at a time
+UNIT_NORM_TOLERANCE = 1e-3
+
+
+def iter_vector_chunks(index, chunk_size=CHUNK_SIZE):
+    """Yield (start, vectors) for consecutive chunks of reconstructed float32 vectors"""
+    for start in range(0, index.ntotal, chunk_size):
+        yield start, index.reconstruct_n(start, min(chunk_size, index.ntotal - start))
+
+
+def vector_hashes(vectors, multipliers):
+    """64-bit hash per vector: its float32 bit patterns mixed by random odd multipliers (wrapping uint64 arithmetic)"""
+    words = np.ascontiguousarray(vectors, dtype="float32").view(np.uint32)
+    # One dimension at a time, so only one uint64 column of the chunk is widened at once
+    hashes = np.zeros(len(words), dtype=np.uint64)
+    for j, multiplier in enumerate(multipliers):
+        hashes += words[:, j].astype(np.uint64) * multiplier
+    return hashes
+
+
+def vector_stats(index, chunk_size=CHUNK_SIZE):
+    """Norm stats and duplicate counts over all vectors, one chunk at a time"""
+    multipliers = np.random.RandomState(0).randint(1, 2 ** 62, size=index.d, dtype=np.int64).astype(np.uint64) * 2 + 1
+    hashes = np.empty(index.ntotal, dtype=np.uint64)
+    count, total, total_sq = 0, 0.0, 0.0
+    low, high = np.inf, 0.0
+    zero, off_unit = 0, 0
+
+    for start, vectors in iter_vector_chunks(index, chunk_size):
+        norms = np.linalg.norm(vectors, axis=1).astype(np.float64)
+        count += len(norms)
+        total += norms.sum()
+        total_sq += np.square(norms).sum()
+        low, high = min(low, norms.min()), max(high, norms.max())
+        zero += int((norms == 0).sum())
+        off_unit += int((np.abs(norms - 1) > UNIT_NORM_TOLERANCE).sum())
+        hashes[start:start + len(vectors)] = vector_hashes(vectors, multipliers)
+
+    if count == 0:
+        return {"vectors": 0}
+    _, counts = np.unique(hashes, return_counts=True)
+    mean = total / count
+    stats = {
+        "vectors": count,
+        "norm_mean": round(mean, 4),
+        "norm_std": round(max(total_sq / count - mean ** 2, 0.0) ** 0.5, 4),
+        "norm_min": round(float(low), 4),
+        "norm_max": round(float(high), 4),
+        "zero_vectors": zero,
+        "duplicate_vectors": int((counts[counts > 1] - 1).sum()),  # copies beyond the first of each vector
+        "duplicated_groups": int((counts > 1).sum())
+    }
+    if uses_cosine(index):
+        stats["not_unit_norm"] = off_unit  # should be 0: cosine indexes store vectors normalised at build time
+    return stats
+
+
+def metadata_stats(metadata_path, fields=HISTOGRAM_FIELDS):
+    """Stream a JSONL metadata file: row count, malformed rows and value counts of the given fields"""
+    rows, malformed = 0, 0
+    missing = Counter()
+    histograms = {field: Counter() for field in fields}
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        for line in f:
+            rows += 1
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                malformed += 1
+                continue
+            for field in fields:
+                if field in row:
+                    histograms[field][row[field]] += 1
+                else:
+                    missing[field] += 1
+    return {"rows": rows, "malformed_rows": malformed, "missing_fields": dict(missing), "histograms": histograms}
+
+
+def _parse_row(line):
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError:
+        return {"malformed": line.strip()}
+
+
+def preview(index, metadata_path, count=5, dims=8):
+    """First rows of the index with their metadata (only these rows are read)"""
+    count = min(count, index.ntotal)
+    vectors = index.reconstruct_n(0, count) if count else []
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        rows = [_parse_row(line) for line in islice(f, count)]
+    for i, vector in enumerate(vectors):
+        print(f"  Index {i}")
+        print(f"  Vector[:{dims}]: {np.round(vector[:dims], 4)} ...")
+        if i < len(rows):
+            for key, value in rows[i].items():
+                text = str(value)
+                print(f"  {key}: {text[:100]}{'...' if len(text) > 100 else ''}")
+        print()
+
+
+def inspect_index(index_path, metadata_path=None, fields=HISTOGRAM_FIELDS, top=15, preview_rows=5, mmap=True, chunk_size=CHUNK_SIZE):
+    """Print the report for one index (and its metadata); returns True if index and metadata line up"""
+    print("=" * 60)
+    print(f"Index: {index_path} ({os.path.getsize(index_path) / 1e6:.1f} MB on disk)")
+    print("=" * 60)
+    index = open_index(index_path, mmap)
+    print(f"Type: {type(index).__name__}, dimension: {index.d}, vectors: {index.ntotal}, metric: {'cosine (inner product)' if uses_cosine(index) else 'L2'}")
+
+    print("\nVector stats:")
+    for key, value in vector_stats(index, chunk_size).items():
+        print(f"  {key}: {value}")
+
+    aligned = True
+    if metadata_path:
+        stats = metadata_stats(metadata_path, fields)
+        aligned = stats["rows"] == index.ntotal and stats["malformed_rows"] == 0
+        print(f"\nMetadata: {metadata_path}")
+        print(f"  rows: {stats['rows']} ({'matches' if stats['rows'] == index.ntotal else 'DOES NOT MATCH'} {index.ntotal} vectors)")
+        print(f"  malformed rows: {stats['malformed_rows']}")
+        if stats["missing_fields"]:
+            print(f"  rows missing fields: {stats['missing_fields']}")
+        for field, histogram in stats["histograms"].items():
+            if not histogram:
+                continue
+            print(f"\n  {field} ({len(histogram)} distinct values, top {min(top, len(histogram))}):")
+            for value, count in histogram.most_common(top):
+                print(f"    {str(value)[:40]:<40} {count:>10} ({count / stats['rows'] * 100:.1f}%)")
+
+        if preview_rows:
+            print(f"\nFirst {min(preview_rows, index.ntotal)} vectors and their metadata:\n")
+            preview(index, metadata_path, preview_rows)
+
+    print(f"Alignment: {'OK' if aligned else 'MISMATCH'}\n")
+    return aligned
+
+
+def chatbot_index_files(data_dir, name):
+    """(index path, metadata path) the chatbot loads for name: the current bundle version, else the plain files"""
+    version = current_version(data_dir, name)
+    if version is not None:
+        bundle_dir = os.path.join(bundle_root(data_dir, name), version)
+        return os.path.join(bundle_dir, INDEX_FILE), os.path.join(bundle_dir, METADATA_FILE)
+    index_file, metadata_file = CHATBOT_INDEXES[name]
+    return os.path.join(data_dir, index_file), os.path.join(data_dir, metadata_file)
+
+
+def main(argv=None, **defaults):
+    """Command line entry point; defaults override argument defaults (used by the older inspection scripts)"""
+    parser = argparse.ArgumentParser(description="Inspect FAISS indexes and metadata in bounded memory")
+    parser.add_argument("--index", default=None, help="Index file (default: the chatbot's indexes in --data_dir)")
+    parser.add_argument("--metadata", default=None, help="Metadata JSONL for --index")
+    parser.add_argument("--data_dir", default=DATA_DIR)
+    parser.add_argument("--names", nargs="+", default=list(CHATBOT_INDEXES), choices=list(CHATBOT_INDEXES), help="Chatbot indexes to inspect")
+    parser.add_argument("--fields", nargs="+", default=HISTOGRAM_FIELDS, help="Metadata fields to histogram")
+    parser.add_argument("--top", type=int, default=15, help="Values shown per histogram")
+    parser.add_argument("--preview", type=int, default=5, help="Rows to preview (0 = none)")
+    parser.add_argument("--chunk_size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--no_mmap", action="store_true", help="Read indexes fully into memory")
+    parser.set_defaults(**defaults)
+    args = parser.parse_args(argv)
+
+    if args.index:
+        targets = [(args.index, args.metadata)]
+    else:
+        targets = [chatbot_index_files(args.data_dir, name) for name in args.names]
+
+    results = [inspect_index(index_path, metadata_path, args.fields, args.top, args.preview, not args.no_mmap, args.chunk_size) for index_path, metadata_path in targets]
+    return all(results)
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
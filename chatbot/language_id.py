@@ -0,0 +1,211 @@
+# Language identification stage for data prep
+# Batch API over pluggable backends, with a cheap stopword/character prefilter,
+# a process pool over chunks of lines, and an on-disk cache keyed by line hash
+
+import hashlib
+import os
+import sqlite3
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+# Small, high-frequency stopword lists. Only words that no other language likely to turn up in the
+# corpora uses as well: "was", "in", "is", "we", "will", "do", "on", "to", "at", "of", "i" are German,
+# Dutch, Portuguese, Italian or French words too, and "de", "que", "con", "está", "porque", "aquí" ...
+# are shared by Spanish with Portuguese, Italian or Catalan, so either would shortcut the wrong language
+EN_STOPWORDS = {
+    "the", "and", "are", "were", "you", "it", "this", "that", "with", "for", "have", "not", "what",
+    "my", "your", "she", "they", "be", "does", "did", "can", "would", "there", "how", "which", "been"
+}
+ES_STOPWORDS = {
+    "los", "las", "también", "usted", "ustedes", "nosotros", "nosotras", "ellos", "ellas", "muy",
+    "mucho", "muchos", "cuando", "dónde", "cómo", "qué", "pues", "fue", "ahora", "esto", "eso"
+}
+ES_CHARACTERS = set("ñ¿¡")  # only used by Spanish
+ACCENTED_CHARACTERS = set("áéíóúàèìòùâêôãõçü")  # rule out the English shortcut
+MIN_STOPWORD_SHARE = 0.2  # stopword hits as a share of all words, so a few shared-looking words in a long line aren't enough
+
+# Hyphenated words stay whole, so Portuguese/Catalan clitics ("vê-los", "donar-los") don't count as "los"
+WORD_PATTERN = re.compile(r"[^\W\d_]+(?:-[^\W\d_]+)*", re.UNICODE)
+
+# Lines the prefilter must leave to the real detector (or shortcut correctly), see check_prefilter
+PREFILTER_CHECKS = [
+    ("Was ist in der Box?", None),  # German
+    ("Ich habe die Stadt gesehen und es war schön", None),
+    ("Ik was in de stad", None),  # Dutch
+    ("Wij hebben het gedaan en het is goed", None),
+    ("Ela está aqui porque quer vê-los", None),  # Portuguese
+    ("O que é que você está a fazer?", None),
+    ("Està aquí perquè vol donar-los el llibre", None),  # Catalan
+    ("On és la platja? És aquí, a prop", None),
+    ("Il cane è in casa con i bambini", None),  # Italian
+    ("The cat is on the table and it is happy", "en"),
+    ("What are you doing with this?", "en"),
+    ("¿Dónde está el baño?", "es"),
+    ("Los niños también juegan en las calles", "es")
+]
+
+
+def guess_language(text, min_hits=2, min_share=MIN_STOPWORD_SHARE):
+    """
+    Cheap prefilter: return 'en' or 'es' when the text is obviously one of them, otherwise None
+    Ambiguous lines (short, mixed, other languages) are left for the real detector
+    """
+    lowered = text.lower()
+    words = WORD_PATTERN.findall(lowered)
+    if not words:
+        return None
+
+    en_hits = sum(1 for w in words if w in EN_STOPWORDS)
+    es_hits = sum(1 for w in words if w in ES_STOPWORDS)
+    has_es_chars = any(c in ES_CHARACTERS for c in lowered)
+    needed = max(min_hits, min_share * len(words))
+
+    if en_hits >= needed and es_hits == 0 and not has_es_chars and not any(c in ACCENTED_CHARACTERS for c in lowered):
+        return "en"
+    # Spanish only on Spanish-only evidence; Portuguese, Italian, Catalan... go to the real detector
+    if (es_hits >= needed or has_es_chars) and en_hits == 0:
+        return "es"
+    return None
+
+
+def check_prefilter(checks=PREFILTER_CHECKS):
+    """Raise AssertionError listing every check line guess_language gets wrong"""
+    wrong = [(text, expected, guess_language(text)) for text, expected in checks if guess_language(text) != expected]
+    assert not wrong, f"Prefilter regressions (text, expected, got): {wrong}"
+
+
+def _langdetect_batch(texts):
+    """Default backend: langdetect, seeded so results are reproducible"""
+    from langdetect import DetectorFactory, detect
+
+    DetectorFactory.seed = 0
+    langs = []
+    for text in texts:
+        try:
+            langs.append(detect(text))
+        except Exception:
+            # langdetect raises on lines with no usable features
+            langs.append(None)
+    return langs
+
+
+# Backends map a list of texts to a list of language codes (None when detection fails)
+LANGID_BACKENDS = {
+    "langdetect": _langdetect_batch
+}
+
+
+def register_backend(name, batch_func):
+    """
+    Register a language ID backend taking a list of texts and returning a list of codes
+    Register at import time of a module so worker processes can see it too
+    """
+    LANGID_BACKENDS[name] = batch_func
+
+
+def _detect_chunk(backend, texts):
+    """Worker entry point for the process pool"""
+    return LANGID_BACKENDS[backend](texts)
+
+
+def line_hash(text, backend="langdetect"):
+    """Signed 64-bit hash of a line (fits an SQLite INTEGER key)"""
+    digest = hashlib.blake2b(f"{backend}\t{text}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def open_langid_cache(cache_path):
+    """Open (or create) the SQLite cache of line hash -> detected language"""
+    cache_dir = os.path.dirname(cache_path)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    conn = sqlite3.connect(cache_path, timeout=60)  # several filter stages may share one cache
+    conn.execute("CREATE TABLE IF NOT EXISTS langid (hash INTEGER PRIMARY KEY, lang TEXT)")
+    return conn
+
+
+def _cache_lookup(conn, hashes):
+    """Fetch cached languages for a list of hashes, in chunks below SQLite's variable limit"""
+    found = {}
+    unique_hashes = list(set(hashes))
+    for i in range(0, len(unique_hashes), 900):
+        chunk = unique_hashes[i:i + 900]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(f"SELECT hash, lang FROM langid WHERE hash IN ({placeholders})", chunk)
+        found.update(rows)
+    return found
+
+
+def detect_languages(
+    texts,
+    backend="langdetect",
+    use_prefilter=True,
+    cache=None,  # an open connection from open_langid_cache, or None to disable caching
+    executor=None,  # a ProcessPoolExecutor to spread chunks over, or None to run in-process
+    chunk_size=2000
+):
+    """
+    Detect the language of every text in a batch
+    Order of checks: prefilter, cache, then the backend (in parallel chunks if an executor is given)
+    Returns a list of language codes aligned with texts (None when detection fails)
+    """
+    results = [None] * len(texts)
+    pending = {}  # text -> list of positions, so repeated lines are only detected once
+
+    for i, text in enumerate(texts):
+        guess = guess_language(text) if use_prefilter else None
+        if guess:
+            results[i] = guess
+        else:
+            pending.setdefault(text, []).append(i)
+
+    if not pending:
+        return results
+
+    # Cached lines from earlier runs
+    hashes = {}
+    if cache is not None:
+        hashes = {text: line_hash(text, backend) for text in pending}
+        cached = _cache_lookup(cache, list(hashes.values()))
+        for text in list(pending):
+            h = hashes[text]
+            if h in cached:
+                for i in pending.pop(text):
+                    results[i] = cached[h]
+
+    if not pending:
+        return results
+
+    # Run the backend on whatever is left
+    to_detect = list(pending)
+    chunks = [to_detect[i:i + chunk_size] for i in range(0, len(to_detect), chunk_size)]
+    if executor is not None and len(chunks) > 1:
+        detected_chunks = executor.map(_detect_chunk, [backend] * len(chunks), chunks)
+    else:
+        detected_chunks = (_detect_chunk(backend, chunk) for chunk in chunks)
+
+    new_rows = []
+    for chunk, langs in zip(chunks, detected_chunks):
+        for text, lang in zip(chunk, langs):
+            for i in pending[text]:
+                results[i] = lang
+            if cache is not None:
+                new_rows.append((hashes[text], lang))
+
+    if new_rows:
+        cache.executemany("INSERT OR REPLACE INTO langid (hash, lang) VALUES (?, ?)", new_rows)
+        cache.commit()
+
+    return results
+
+
+def make_langid_executor(workers=None):
+    """Process pool for detect_languages; workers=None uses all CPUs, workers<=1 disables the pool"""
+    if workers is not None and workers <= 1:
+        return None
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+if __name__ == "__main__":
+    check_prefilter()
+    print(f"Prefilter checks passed ({len(PREFILTER_CHECKS)} lines)")
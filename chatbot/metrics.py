@@ -0,0 +1,195 @@
+# Prometheus-style runtime metrics
+# Counters and histograms keep one cell per thread, so updates on the request path are plain
+# dict writes with no lock; cells are only summed when the registry is scraped. When a thread ends
+# (e.g. a Streamlit rerun thread) its cell is merged into a base total and dropped. render() gives
+# the Prometheus text exposition format and start_metrics_server serves it on /metrics
+
+import bisect
+import threading
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(labelnames, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _CellOwner:
+    """Lives only in the thread-local, so it is collected when its thread ends"""
+
+
+class _Metric:
+    """Base class: per-thread cells mapping label values to state"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._cells = []
+        self._base = {}  # merged cells of threads that have ended
+        self._cells_lock = threading.Lock()  # only taken the first time a thread updates the metric, and when it ends
+        self._local = threading.local()
+
+    def _cell(self):
+        cell = getattr(self._local, "cell", None)
+        if cell is None:
+            cell = self._local.cell = {}
+            owner = self._local.owner = _CellOwner()
+            weakref.finalize(owner, self._retire, cell)
+            with self._cells_lock:
+                self._cells.append(cell)
+        return cell
+
+    def _retire(self, cell):
+        with self._cells_lock:
+            self._cells.remove(cell)
+            self._merge(self._base, cell.items())
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _totals(self):
+        """Label values -> state summed over the base and every live thread's cell"""
+        with self._cells_lock:
+            cells = list(self._cells)
+            totals = self._merge({}, self._base.items())
+        for cell in cells:
+            self._merge(totals, list(cell.items()))
+        return totals
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return lines + self._render_samples()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        cell = self._cell()
+        key = self._key(labels)
+        cell[key] = cell.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._totals().get(self._key(labels), 0)
+
+    def _merge(self, totals, items):
+        for key, value in items:
+            totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def _render_samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in sorted(self._totals().items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        cell = self._cell()
+        key = self._key(labels)
+        state = cell.get(key)
+        if state is None:
+            state = cell[key] = [0] * (len(self.buckets) + 1) + [0.0]  # bucket counts, +Inf count, sum
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def _merge(self, totals, items):
+        for key, state in items:
+            merged = totals.setdefault(key, [0] * len(state[:-1]) + [0.0])
+            for i, value in enumerate(state):
+                merged[i] += value
+        return totals
+
+    def _render_samples(self):
+        lines = []
+        for key, state in sorted(self._totals().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Gauge read from a callback at scrape time (e.g. the current queue depth)"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, read_fn):
+        super().__init__(name, documentation)
+        self.read_fn = read_fn
+
+    def _render_samples(self):
+        return [f"{self.name} {_format_value(self.read_fn())}"]
+
+
+class MetricsRegistry:
+    """Named collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, read_fn):
+        return self._register(Gauge(name, documentation, read_fn))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(registry, port=9100, host="127.0.0.1"):
+    """Serve registry.render() on http://host:port/metrics from a daemon thread; returns the server"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scrapes every few seconds would flood the console
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -8,68 +8,276 @@ import os
 import sys
 import re
 import json
-import faiss
+import time
+import threading
+from collections import namedtuple
+from concurrent.futures import CancelledError
+from functools import lru_cache
 from sentence_transformers import SentenceTransformer
 from huggingface_hub import login
-from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteriaList, pipeline
+from faiss_index_utils import build_language_filters, prepare_queries, to_distances, uses_cosine
+from index_bundle import current_version, load_index
+from language_id import detect_languages
+from response_cache import SemanticResponseCache
+from conversation import ConversationSession
+from inference_client import RemoteTextGenerator, StubTextGenerator
+from generation_queue import CancelStoppingCriteria, GenerationJob, GenerationQueue, QueueFull, TokenTimingCriteria
+from metrics import MetricsRegistry, start_metrics_server
+from tracing import Trace, activate, current_trace, span
 
 # Load transformer model
-model = SentenceTransformer('sentence-transformers/all-MiniLM-L12-v2')  # LaBSE, MiniLM, distilUSE
+general_embedder = 'sentence-transformers/all-MiniLM-L12-v2'  # LaBSE, MiniLM, distilUSE
+model = SentenceTransformer(general_embedder)
 
-# Load sentence pairs data FAISS index and metadata
-index = faiss.read_index('data/sentence_pairs_index.faiss')  # add _version# if needed
-with open('data/sentence_pairs_metadata.jsonl', 'r', encoding='utf-8') as f:  # add _version# if needed
-    metadata = [json.loads(line) for line in f]
+# The travel index was built with the multilingual model, so travel queries must be encoded with it too
+travel_embedder = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+travel_model = SentenceTransformer(travel_embedder)
 
-# Load travel data FAISS index and metadata
-travel_index = faiss.read_index('data/chunked_travel_info_index.faiss')  # add _version# if needed
-with open('data/chunked_travel_info_metadata.jsonl', 'r', encoding='utf-8') as f:  # add _version# if needed
-    travel_metadata = [json.loads(line) for line in f]
+# Indexes and metadata are read from CHATBOT_DATA_DIR (default "data"), e.g. a synthetic benchmark corpus
+data_dir = os.environ.get("CHATBOT_DATA_DIR", "data")
 
-# Authentication with Hugging Face
-# Make sure to set your Hugging Face token in the environment as HF_TOKEN
-# e.g., export HF_TOKEN=hf_xxx in your terminal, or use a .env file if supported
-hf_token = os.environ["HF_TOKEN"]
-login(hf_token)  # Hugging Face login
+# Everything retrieval reads, swapped as one object when a new index bundle is loaded, so a request
+# never mixes an index with another version's metadata
+RetrievalIndexes = namedtuple("RetrievalIndexes", ["general", "travel", "travel_lang_filters", "versions"])
+
+
+def load_retrieval_indexes():
+    """
+    Load the sentence pairs and travel indexes with their metadata: the current versioned bundle
+    (see index_bundle.py), or the plain files in data_dir if no bundle was published
+    Raises ValueError if an index and its metadata (or embedding model) don't match
+    """
+    general = load_index(data_dir, "sentence_pairs", ('sentence_pairs_index.faiss', 'sentence_pairs_metadata.jsonl'), general_embedder)  # add _version# if needed
+    travel = load_index(data_dir, "travel", ('chunked_travel_info_index.faiss', 'chunked_travel_info_metadata.jsonl'), travel_embedder)  # add _version# if needed
+
+    # Per-language ID filters over the travel index, so a routed query only scores chunks in its own language
+    travel_lang_filters = build_language_filters(travel.metadata, field="lang")
+    return RetrievalIndexes(general, travel, travel_lang_filters, (general.version, travel.version))
+
+
+retrieval_indexes = load_retrieval_indexes()
+_reload_lock = threading.Lock()
+_rejected_versions = None  # bundle versions that failed validation, not retried until CURRENT changes again
 
 # Load LLM model
 llm_name = "mistralai/Mistral-7B-Instruct-v0.3"
 
-# Load tokenizer
-tokenizer = AutoTokenizer.from_pretrained(llm_name, use_fast=True)
-llm = AutoModelForCausalLM.from_pretrained(llm_name, device_map='auto')
-
-# Set pad token for batching and inference
-if tokenizer.pad_token is None:
-    tokenizer.pad_token = tokenizer.eos_token
-llm.config.pad_token_id = tokenizer.pad_token_id
-
-# Create pipeline
-pipe = pipeline(
-    'text-generation',
-    model=llm,
-    tokenizer=tokenizer,
-    pad_token_id=tokenizer.pad_token_id
+# Set INFERENCE_SERVER_URL (e.g. http://localhost:8080) to generate on an external
+# text-generation-inference server instead of loading the LLM in this process
+inference_server_url = os.environ.get("INFERENCE_SERVER_URL")
+
+# Set CHATBOT_GENERATOR=stub to answer with a deterministic stub instead of an LLM (benchmarks, no GPU or HF token)
+use_stub_generator = os.environ.get("CHATBOT_GENERATOR") == "stub"
+
+if use_stub_generator:
+    tokenizer = None  # tokens are counted as words
+else:
+    # Authentication with Hugging Face
+    # Make sure to set your Hugging Face token in the environment as HF_TOKEN
+    # e.g., export HF_TOKEN=hf_xxx in your terminal, or use a .env file if supported
+    hf_token = os.environ["HF_TOKEN"]
+    login(hf_token)  # Hugging Face login
+
+    # Load tokenizer (also used to count history tokens when generating remotely)
+    tokenizer = AutoTokenizer.from_pretrained(llm_name, use_fast=True)
+
+    # Set pad token for batching and inference
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+if use_stub_generator:
+    llm = None
+    pipe = StubTextGenerator(seconds_per_token=float(os.environ.get("STUB_SECONDS_PER_TOKEN", 0)))
+elif inference_server_url:
+    llm = None
+    pipe = RemoteTextGenerator(inference_server_url)  # called like the pipeline below
+else:
+    llm = AutoModelForCausalLM.from_pretrained(llm_name, device_map='auto')
+    llm.config.pad_token_id = tokenizer.pad_token_id
+
+    # Create pipeline
+    pipe = pipeline(
+        'text-generation',
+        model=llm,
+        tokenizer=tokenizer,
+        pad_token_id=tokenizer.pad_token_id
+    )
+
+# Semantic cache of deterministic answers, keyed by mode, prompt and generation settings
+# Queries are compared with the multilingual model so English and Spanish paraphrases can match
+response_cache = SemanticResponseCache(
+    embed_fn=lambda query: travel_model.encode([query], convert_to_numpy=True),
+    threshold=0.92,
+    ttl_seconds=24 * 3600,
+    max_entries=2000
+)
+
+# Runtime metrics by mode (Prometheus text format); set METRICS_PORT to serve them on http://127.0.0.1:<port>/metrics
+metrics = MetricsRegistry()
+retrieval_seconds = metrics.histogram("chatbot_retrieval_seconds", "Time to retrieve context for a query", ("mode",))
+generation_seconds = metrics.histogram("chatbot_generation_seconds", "Time to generate a response", ("mode",))
+generated_tokens = metrics.histogram(
+    "chatbot_generated_tokens", "Tokens generated per response", ("mode",), buckets=(16, 32, 64, 128, 256, 512, 1024)
 )
+responses_total = metrics.counter("chatbot_responses_total", "Responses returned", ("mode",))
+cache_lookups_total = metrics.counter("chatbot_response_cache_lookups_total", "Response cache lookups by result", ("mode", "result"))
+queue_depth = metrics.histogram(
+    "chatbot_queue_depth", "Generation queue depth seen by each submitted request", buckets=(0, 1, 2, 4, 8, 16, 32)
+)
+queue_rejected_total = metrics.counter("chatbot_queue_rejected_total", "Requests rejected because the generation queue was full")
+metrics.gauge("chatbot_queue_depth_current", "Requests waiting or generating", lambda: generation_queue.depth())
+
+if os.environ.get("METRICS_PORT"):
+    start_metrics_server(metrics, port=int(os.environ["METRICS_PORT"]))
+
+
+# RAG helpers
+def select_results(results, max_distance=None, gap=None, min_k=1):
+    """
+    Trim (row, distance) results sorted by distance
+    max_distance: drop results further than this
+    gap: adaptive k, stop at the first jump in distance larger than gap (after at least min_k results)
+    """
+    if max_distance is not None:
+        results = [(row, dist) for row, dist in results if dist <= max_distance]
+
+    if gap is not None:
+        for i in range(max(min_k, 1), len(results)):
+            if results[i][1] - results[i - 1][1] > gap:
+                return results[:i]
+
+    return results
+
+
+@lru_cache(maxsize=4096)
+def detect_query_language(query):
+    """Detect the language of a query ("en", "es", ...) or None if unknown; cached per query string"""
+    return detect_languages([query])[0]
+
+
+def encode_query(query, source="general"):
+    """Embed a query with the model the source's index was built with"""
+    encoder = travel_model if source == "travel" else model
+    with span("encode"):
+        return encoder.encode([query], convert_to_numpy=True)
+
 
-# RAG helper
-def retrieve_context(query, k=5, source="general"):
+def search_rows(search_index, rows, query_vector, k, params=None):
+    """
+    Search one index and return (row, distance) pairs
+    params: faiss.SearchParameters, e.g. a per-language filter from build_language_filters
+    """
+    # Queries get the same normalisation as the index (cosine indexes store unit vectors)
+    with span("search"):
+        D, I = search_index.search(prepare_queries(search_index, query_vector), k, params=params)
+    distances = to_distances(search_index, D[0])
+
+    # FAISS pads with -1 when fewer than k vectors (pass the filter)
+    return [(rows[i], float(dist)) for i, dist in zip(I[0], distances) if i >= 0]
+
+
+def distance_scale(source="general", sample_size=1000):
+    """
+    (metric, scale) of the distances a source's index returns, for choosing max_distance and gap
+    Cosine indexes return 1 - cosine similarity (scale 1); L2 indexes return squared L2, whose scale
+    is 2 x the mean squared vector norm, so a cosine distance c is roughly an L2 distance of c * scale
+    (exactly 2c for unit vectors)
+    """
+    index = (retrieval_indexes.travel if source == "travel" else retrieval_indexes.general).index
+    if uses_cosine(index):
+        return "cosine", 1.0
+    if index.ntotal == 0:
+        return "l2", 2.0
+    sample = index.reconstruct_n(0, min(sample_size, index.ntotal))
+    return "l2", 2 * float((sample ** 2).sum(axis=1).mean())
+
+
+def retrieve_context_with_scores(
+    query,
+    k=5,
+    source="general",
+    max_distance=None,
+    gap=None,
+    min_k=1,
+    rerank_top_n=None,
+    rerank_budget_ms=300,
+    lang=None,
+    cross_lingual_fallback=True,
+    query_vector=None
+):
+    """
+    Retrieve up to k rows for the query together with their distances (lower is better)
+    Distances are squared L2 for L2 indexes and 1 - cosine similarity for cosine indexes
+    Returns an empty list when nothing clears max_distance, so the prompt is built without context
+    If rerank_top_n is set, the k FAISS candidates are re-ranked by a cross-encoder and only the best
+    rerank_top_n are kept (FAISS order is used if re-ranking exceeds rerank_budget_ms)
+    Travel mode can be routed to one language's chunks: lang="en"/"es", or "auto" to detect it from
+    the query. With cross_lingual_fallback, the other languages are searched if fewer than min_k rows pass
+    query_vector can be passed when the caller has already embedded the query (see encode_query)
+    """
     if source == "no_retrieval":
         return []  # No context retrieved
 
-    query_vector = model.encode([query], convert_to_numpy=True).astype('float32')
+    start = time.perf_counter()
+    if query_vector is None:
+        query_vector = encode_query(query, source)
 
+    indexes = retrieval_indexes  # one consistent version for the whole request, even if a reload swaps it
     if source == "travel":
-        D, I = travel_index.search(query_vector, k)
-        results = [travel_metadata[i] for i in I[0]]
+        travel_index, travel_metadata = indexes.travel.index, indexes.travel.metadata
+        with span("detect_language"):
+            query_lang = detect_query_language(query) if lang == "auto" else lang
+
+        if query_lang in indexes.travel_lang_filters:
+            candidates = search_rows(travel_index, travel_metadata, query_vector, k, indexes.travel_lang_filters[query_lang])
+            results = select_results(candidates, max_distance=max_distance, gap=gap, min_k=min_k)
+
+            if cross_lingual_fallback and len(results) < min_k:
+                # Unfiltered search: the nearest chunks in any language
+                candidates = search_rows(travel_index, travel_metadata, query_vector, k)
+                results = select_results(candidates, max_distance=max_distance, gap=gap, min_k=min_k)
+        else:
+            candidates = search_rows(travel_index, travel_metadata, query_vector, k)
+            results = select_results(candidates, max_distance=max_distance, gap=gap, min_k=min_k)
     else:
-        D, I = index.search(query_vector, k)
-        results = [metadata[i] for i in I[0]]
+        candidates = search_rows(indexes.general.index, indexes.general.metadata, query_vector, k)
+        results = select_results(candidates, max_distance=max_distance, gap=gap, min_k=min_k)
+
+    if rerank_top_n:
+        from reranker import rerank  # only loads the cross-encoder when re-ranking is used
+        with span("rerank"):
+            results = rerank(query, results, source=source, top_n=rerank_top_n, budget_ms=rerank_budget_ms)
 
+    retrieval_seconds.observe(time.perf_counter() - start, mode=source)
     return results
 
 
-def format_prompt(query, context, source_mode="general", instruction=None):
+def retrieve_context(query, k=5, source="general", **retrieval_args):
+    """Retrieve context rows only; retrieval_args are passed to retrieve_context_with_scores"""
+    return [row for row, _ in retrieve_context_with_scores(query, k=k, source=source, **retrieval_args)]
+
+
+def retrieve_for_session(session, query, k=5, source="general", **retrieval_args):
+    """
+    Retrieve context for one turn of a conversation
+    Reuses the previous turn's passages when the query is close to the previous question
+    (a follow-up on the same topic), otherwise searches the index as usual
+    Returns (results, query_vector, reused)
+    """
+    if source == "no_retrieval":
+        return [], None, False
+
+    query_vector = encode_query(query, source)
+    results = session.reusable_results(query_vector)
+    if results is not None:
+        return results, query_vector, True
+
+    results = retrieve_context_with_scores(query, k=k, source=source, query_vector=query_vector, **retrieval_args)
+    return results, query_vector, False
+
+
+def format_prompt(query, context, source_mode="general", instruction=None, history=None):
     # Build context block based on mode
     if source_mode == "no_retrieval":
         context_block = ""
@@ -90,16 +298,31 @@ def format_prompt(query, context, source_mode="general", instruction=None):
         else:
             header = "You are a helpful multilingual assistant. Answer the user's question naturally and informatively."
 
+    # Earlier turns of a multi-turn conversation (see ConversationSession.history_text)
+    history_block = f"Conversation so far:\n{history}\n\n" if history else ""
+
     # Format full prompt
     return f"""{header}
 
 Context:
 {context_block}
 
-User: {query}
+{history_block}User: {query}
 Answer:"""
 
 
+def count_tokens(text):
+    """Number of LLM tokens in a text, used to keep conversation history within budget"""
+    if tokenizer is None:
+        return len(text.split())
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def new_session(mode="general", **session_args):
+    """Start a conversation whose history budget is measured in LLM tokens"""
+    return ConversationSession(mode=mode, count_tokens=count_tokens, **session_args)
+
+
 def parse_queries(filepath):
     with open(filepath, 'r', encoding='utf-8') as f:
         text = f.read()
@@ -182,7 +405,10 @@ def run_cli():
             else:
                 print("Please type 1, 2, 3, or 'exit'")
 
-        print("Type '/switch' to change modes. Type 'exit' to quit \n")
+        print("Type '/switch' to change modes, '/new' to start a new conversation. Type 'exit' to quit \n")
+
+        # Conversation history is kept per mode and cleared on /switch or /new
+        session = new_session(source_mode)
 
         while True:
             user_input = input("\nYou: ").strip()
@@ -203,10 +429,19 @@ def run_cli():
                         else:
                             source_mode = "no_retrieval"
                         print(f"Mode switched to: {source_mode.title()}")
+                        break
+                session.reset(source_mode)
+                continue
+
+            if user_input.lower() == "/new":
+                session.reset()
+                print("Started a new conversation")
+                continue
 
             # RAG section
-            context = retrieve_context(user_input, k=5, source=source_mode)
-            prompt = format_prompt(user_input, context, source_mode=source_mode)
+            results, query_vector, _ = retrieve_for_session(session, user_input, k=5, source=source_mode)
+            context = [row for row, _ in results]
+            prompt = format_prompt(user_input, context, source_mode=source_mode, history=session.history_text())
 
             print("Generating answer...")
 
@@ -241,12 +476,181 @@ def run_cli():
             else:
                 answer = response.strip()
 
+            session.add_turn(user_input, answer, results, query_vector)
             print(f"\nBot: {answer}")
 
     print()
 
 
-def generate_response(user_input, mode="general", instruction=None, do_sample=False, top_p=None, temperature=None):
+def record_generation_stats(trace, prompt, answer, ttft_ms=None, batch_size=1):
+    """
+    Add prompt/generated token counts, tokens/sec and time to first token to a trace
+    tokens_per_sec is left unset for prompts generated in a batch (batch_size > 1): generate_ms is then
+    the whole batch's time, so callers log the batch's throughput instead
+    """
+    generated_tokens = count_tokens(answer)
+    generate_ms = trace.values.get("generate_ms", 0.0)
+    trace.set("prompt_tokens", count_tokens(prompt))
+    trace.set("generated_tokens", generated_tokens)
+    if batch_size == 1:
+        trace.set("tokens_per_sec", round(generated_tokens / generate_ms * 1000, 2) if generate_ms else None)
+    if ttft_ms is not None:
+        trace.set("ttft_ms", ttft_ms)
+
+
+def generate_text(prompt, cancel_event=None, mode="general", **generation_args):
+    """
+    Run the generator on one prompt and return the cleaned answer (mode labels the metrics)
+    A local model stops early once cancel_event is set (a remote server finishes the request)
+    When a trace is active, token counts and time to first token (local model only) are recorded
+    """
+    trace = current_trace()
+    criteria = []
+    if cancel_event is not None and llm is not None:
+        criteria.append(CancelStoppingCriteria(cancel_event))
+    timer = None
+    if trace is not None and llm is not None:
+        timer = TokenTimingCriteria()
+        criteria.append(timer)
+    if criteria:
+        generation_args["stopping_criteria"] = StoppingCriteriaList(criteria)
+
+    start = time.perf_counter()
+    with span("generate"):
+        response = pipe(prompt, **generation_args)[0]['generated_text']
+    answer = response.split("Answer:")[-1].strip() if "Answer:" in response else response.strip()
+
+    generation_seconds.observe(time.perf_counter() - start, mode=mode)
+    generated_tokens.observe(count_tokens(answer), mode=mode)
+
+    if trace is not None:
+        record_generation_stats(trace, prompt, answer, ttft_ms=timer.ttft_ms() if timer is not None else None)
+    return answer
+
+
+def build_request(
+    user_input,
+    mode="general",
+    instruction=None,
+    do_sample=False,
+    top_p=None,
+    temperature=None,
+    k=5,
+    max_distance=None,
+    gap=None,
+    rerank_top_n=None,
+    rerank_budget_ms=300,
+    lang=None,
+    use_cache=True,
+    session=None,
+    trace=False
+):
+    """
+    Shared setup of generate_response and submit_response (same arguments)
+    Returns (request, cached): cached holds the details of a response cache hit, otherwise request
+    holds everything prepare_request and finish_request need
+    """
+    generation_args = {"max_new_tokens": 512, "do_sample": do_sample}
+    if do_sample:
+        if top_p is not None:
+            generation_args["top_p"] = top_p
+        if temperature is not None:
+            generation_args["temperature"] = temperature
+
+    history = session.history_text() if session is not None else ""
+    trace = Trace() if trace else None
+
+    # Only deterministic generations are safe to reuse for a paraphrased question,
+    # and only at the start of a conversation (later answers depend on the history)
+    cache_key, cache_vector = None, None
+    if use_cache and not do_sample and not history:
+        # The query language is part of the key: the multilingual embedder puts a question and its
+        # translation close together, but each must get an answer in its own language
+        cache_key = json.dumps({
+            "model": llm_name,
+            "mode": mode,
+            "instruction": instruction,
+            "generation_args": generation_args,
+            "retrieval": [k, max_distance, gap, rerank_top_n, lang],
+            "query_lang": detect_query_language(user_input)
+        }, sort_keys=True)
+        with activate(trace), span("cache_lookup"):
+            cache_vector = response_cache.embed(user_input)  # reused by finish_request to store the answer
+            cached, _ = response_cache.lookup(user_input, cache_key, cache_vector)
+        cache_lookups_total.inc(mode=mode, result="miss" if cached is None else "hit")
+        if cached is not None:
+            responses_total.inc(mode=mode)
+            if session is not None:
+                session.add_turn(user_input, cached["answer"])
+            details = {**cached, "cache_hit": True}
+            if trace is not None:
+                details["timings"] = trace.as_dict()
+            return None, details
+
+    request = {
+        "user_input": user_input,
+        "mode": mode,
+        "instruction": instruction,
+        "k": k,
+        "retrieval_args": {
+            "max_distance": max_distance,
+            "gap": gap,
+            "rerank_top_n": rerank_top_n,
+            "rerank_budget_ms": rerank_budget_ms,
+            "lang": lang
+        },
+        "generation_args": generation_args,
+        "history": history,
+        "cache_key": cache_key,
+        "cache_vector": cache_vector,
+        "session": session,
+        "trace": trace
+    }
+    return request, None
+
+
+def prepare_request(request):
+    """Retrieve context and build the prompt for a request from build_request"""
+    user_input, mode, session = request["user_input"], request["mode"], request["session"]
+
+    with activate(request["trace"]):
+        query_vector, reused = None, False
+        with span("retrieve"):
+            if session is not None:
+                results, query_vector, reused = retrieve_for_session(
+                    session, user_input, k=request["k"], source=mode, **request["retrieval_args"]
+                )
+            else:
+                results = retrieve_context_with_scores(user_input, k=request["k"], source=mode, **request["retrieval_args"])
+
+        with span("format"):
+            context = [row for row, _ in results]
+            prompt = format_prompt(user_input, context, source_mode=mode, instruction=request["instruction"], history=request["history"])
+    return {**request, "results": results, "query_vector": query_vector, "reused": reused, "prompt": prompt}
+
+
+def finish_request(prepared, answer):
+    """Cache the answer, record the conversation turn and return the response details"""
+    results = prepared["results"]
+    details = {
+        "answer": answer,
+        "context": [row for row, _ in results],
+        "distances": [dist for _, dist in results],
+        "prompt": prepared["prompt"]
+    }
+    if prepared["cache_key"] is not None:
+        response_cache.store(prepared["user_input"], prepared["cache_key"], details, prepared["cache_vector"])
+    if prepared["session"] is not None:
+        prepared["session"].add_turn(prepared["user_input"], answer, results, prepared["query_vector"])
+
+    responses_total.inc(mode=prepared["mode"])
+    details = {**details, "cache_hit": False, "context_reused": prepared["reused"]}
+    if prepared["trace"] is not None:
+        details["timings"] = prepared["trace"].as_dict()
+    return details
+
+
+def generate_response(user_input, mode="general", return_details=False, **request_args):
     """
     Generates a response using the RAG pipeline or no-retrieval mode.
 
@@ -257,22 +661,145 @@ def generate_response(user_input, mode="general", instruction=None, do_sample=Fa
         do_sample (bool): Whether to sample (creative mode). Defaults to False.
         top_p (float, optional): Top-p sampling parameter.
         temperature (float, optional): Temperature sampling parameter.
+        k (int): Maximum number of retrieved passages.
+        max_distance (float, optional): Drop passages further than this (see retrieve_context_with_scores).
+        gap (float, optional): Adaptive k, stop at the first distance jump larger than this.
+        rerank_top_n (int, optional): Re-rank the k candidates with a cross-encoder and keep this many.
+        rerank_budget_ms (int): Time budget for re-ranking before falling back to FAISS order.
+        lang (str, optional): Route travel retrieval to "en" or "es" chunks, or "auto" to detect the query language.
+        use_cache (bool): Serve deterministic (do_sample=False) requests from the semantic response cache.
+        session (ConversationSession, optional): Multi-turn conversation; its history is added to the prompt,
+            passages are reused for follow-up questions, and the turn is recorded after generation.
+        trace (bool): Time each stage (encode, search, format, generate, ...) and count tokens; the
+            details dict then has a "timings" entry.
+        return_details (bool): Return a dict with the answer, context, distances and prompt instead of a string.
 
     Returns:
-        str: Cleaned response string.
+        str: Cleaned response string (or a dict if return_details is True).
     """
-    context = retrieve_context(user_input, k=5, source=mode)
-    prompt = format_prompt(user_input, context, source_mode=mode, instruction=instruction)
+    request, details = build_request(user_input, mode=mode, **request_args)
+    if details is None:
+        prepared = prepare_request(request)
+        with activate(prepared["trace"]):
+            answer = generate_text(prepared["prompt"], mode=mode, **prepared["generation_args"])
+        details = finish_request(prepared, answer)
+
+    return details if return_details else details["answer"]
+
+
+# Generations from all app sessions go through one bounded queue, so concurrent users
+# take turns on the model instead of contending for it
+generation_queue = GenerationQueue(max_pending=int(os.environ.get("GENERATION_QUEUE_SIZE", 8)), workers=1)
+
+
+def submit_response(session_id, user_input, mode="general", **request_args):
+    """
+    Queue a generate_response request (same arguments) and return a GenerationJob
+    whose result() is the details dict. Retrieval starts immediately and overlaps with
+    waiting for the generator; generation_queue.cancel(session_id) cancels the job.
+    Raises QueueFull when too many requests are already waiting
+    """
+    request, details = build_request(user_input, mode=mode, **request_args)
+    if details is not None:
+        return GenerationJob.completed(session_id, details)
+
+    submitted_at = time.perf_counter()
+
+    def generate(prepared, cancel_event):
+        with activate(prepared["trace"]):
+            if prepared["trace"] is not None:
+                prepared["trace"].set("queue_wait_ms", (time.perf_counter() - submitted_at) * 1000)
+            answer = generate_text(prepared["prompt"], cancel_event=cancel_event, mode=mode, **prepared["generation_args"])
+        if cancel_event.is_set():
+            raise CancelledError()  # don't cache or record a cut-off answer
+        return finish_request(prepared, answer)
+
+    queue_depth.observe(generation_queue.depth())
+    try:
+        return generation_queue.submit(session_id, lambda: prepare_request(request), generate)
+    except QueueFull:
+        queue_rejected_total.inc()
+        raise
+
+
+def health_check():
+    """
+    Check that the loaded resources are usable
+    Returns {check name: (ok, detail)}
+    """
+    indexes = retrieval_indexes
+    checks = {}
+    for name, bundle in (("sentence pairs index", indexes.general), ("travel index", indexes.travel)):
+        version = f"bundle {bundle.version}" if bundle.version else "unbundled files"
+        checks[name] = (bundle.index.ntotal == len(bundle.metadata), f"{bundle.index.ntotal} vectors, {len(bundle.metadata)} metadata rows ({version})")
+    checks["general embedding model"] = (model.get_sentence_embedding_dimension() == indexes.general.index.d, f"dimension {model.get_sentence_embedding_dimension()}, index {indexes.general.index.d}")
+    checks["travel embedding model"] = (travel_model.get_sentence_embedding_dimension() == indexes.travel.index.d, f"dimension {travel_model.get_sentence_embedding_dimension()}, index {indexes.travel.index.d}")
+    if use_stub_generator:
+        checks["generator"] = (True, "deterministic stub")
+    elif llm is None:
+        checks["generator"] = (pipe.health(), f"inference server {inference_server_url}")
+    else:
+        checks["generator"] = (True, f"{llm_name} on {llm.device}")
+    return checks
+
+
+def warm_up(rerank=False):
+    """
+    Run one tiny request through every component so the first user doesn't pay for lazy
+    initialisation (tokenizer caches, CUDA kernels, FAISS and HTTP connections)
+    rerank: also load the cross-encoder, for callers that offer re-ranking (loading it takes seconds,
+    far over the re-ranking budget of a request)
+    Returns the time taken in seconds
+    """
+    start = time.time()
+    for source in ["general", "travel"]:
+        retrieve_context_with_scores("Hello", k=1, source=source)
+    if rerank:
+        from reranker import load_reranker
+        load_reranker().predict([("Hello", "Hello")])
+    pipe(format_prompt("Hello", [], source_mode="no_retrieval"), max_new_tokens=1, do_sample=False)
+    return time.time() - start
+
+
+def reload_indexes():
+    """
+    Load newly published index bundles (index_bundle.py publish/activate) and swap them in
+    The new indexes are loaded and validated while requests keep using the old ones; a bundle that
+    fails validation is not swapped in (ValueError). Returns True if the indexes were replaced
+    """
+    global retrieval_indexes, _rejected_versions
+    with _reload_lock:
+        versions = (current_version(data_dir, "sentence_pairs"), current_version(data_dir, "travel"))
+        if versions in (retrieval_indexes.versions, _rejected_versions):
+            return False
+        try:
+            retrieval_indexes = load_retrieval_indexes()
+        except ValueError:
+            _rejected_versions = versions
+            raise
+        response_cache.clear()  # cached answers were built from the old context
+        print(f"Loaded index bundles {retrieval_indexes.versions}")
+        return True
+
+
+def start_index_watcher(interval_seconds):
+    """Check for new index bundles every interval_seconds in a background thread"""
+    def watch():
+        while True:
+            time.sleep(interval_seconds)
+            try:
+                reload_indexes()
+            except (OSError, ValueError) as e:
+                print(f"Index reload failed, still serving the previous indexes: {e}")
+
+    thread = threading.Thread(target=watch, name="index-watcher", daemon=True)
+    thread.start()
+    return thread
 
-    generation_args = {"max_new_tokens": 512, "do_sample": do_sample}
-    if do_sample:
-        if top_p is not None:
-            generation_args["top_p"] = top_p
-        if temperature is not None:
-            generation_args["temperature"] = temperature
 
-    response = pipe(prompt, **generation_args)[0]['generated_text']
-    return response.split("Answer:")[-1].strip() if "Answer:" in response else response.strip()
+# Set INDEX_RELOAD_SECONDS to pick up rebuilt index bundles without restarting
+if os.environ.get("INDEX_RELOAD_SECONDS"):
+    start_index_watcher(float(os.environ["INDEX_RELOAD_SECONDS"]))
 
 
 # Only run CLI if directly invoked (not when imported by Streamlit)
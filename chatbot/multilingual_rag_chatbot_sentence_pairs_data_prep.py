@@ -4,87 +4,216 @@
 # Filters and compiles data from various sources into a single JSONL file
 # Applies preprocessing and cleans the data
 
-from langdetect import detect
 from tqdm import tqdm
+from itertools import islice, zip_longest
+import hashlib
 import json
 import time
 import random
+from columnar_store import ColumnarWriter
+from language_id import detect_languages, make_langid_executor, open_langid_cache
 
-def filter_tatoeba(
-    infile,
+def pair_fingerprint(en_line, es_line):
+    """64-bit fingerprint of an English-Spanish pair, used for duplicate removal"""
+    digest = hashlib.blake2b(f"{en_line}\t{es_line}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def reservoir_sample(items, sample_size, rng=random):
+    """
+    Uniformly sample up to sample_size items from an iterable in a single pass (Algorithm R)
+    Returns the sample and the number of items seen
+    Memory is bounded by sample_size, not by the length of the iterable
+    """
+    reservoir = []
+    seen = 0
+    for item in items:
+        if seen < sample_size:
+            reservoir.append(item)
+        else:
+            j = rng.randint(0, seen)
+            if j < sample_size:
+                reservoir[j] = item
+        seen += 1
+    return reservoir, seen
+
+
+def read_parallel_lines(eng_infile, spa_infile):
+    """Yield aligned (English, Spanish) lines from two files read in lock-step"""
+    with open(eng_infile, 'r', encoding='utf-8') as f_en, open(spa_infile, 'r', encoding='utf-8') as f_es:
+        for line_num, (en_line, es_line) in enumerate(zip_longest(f_en, f_es), start=1):
+            # One file ran out before the other
+            if en_line is None or es_line is None:
+                raise ValueError(
+                    f"Mismatch in line count: {eng_infile} and {spa_infile} "
+                    f"differ in length at line {line_num}"
+                )
+            yield en_line, es_line
+
+
+def parse_tatoeba_line(line):
+    """Split a Tatoeba TSV line into an (English, Spanish) pair, or None if malformed"""
+    parts = line.strip().split('\t')
+    if len(parts) < 4:
+        return None
+    return parts[1], parts[3]
+
+
+def filter_pairs_to_files(
+    pairs,
     eng_outfile,
     spa_outfile,
     min_length=3,
     max_length=1000,
     remove_duplicates=True,
     use_langdetect=False,
-    max_lines=None,
-    sample_size=None,  # set to a number n to process n random lines from each file
-    print_examples=False
+    total=None,
+    desc="Filtering lines",
+    langid_backend="langdetect",
+    langid_workers=None,  # processes for language ID, None = all CPUs, 1 = in-process
+    langid_cache=None,  # path to the SQLite language ID cache, None to disable
+    langid_batch_size=20000  # pairs buffered before each language ID batch
 ):
-    """Filter Tatoeba lines, each containing English and Spanish separated by tabs and write the filtered lines to a new file"""
+    """
+    Stream (English, Spanish) pairs through the filters and write the kept ones straight to the output files
+    Malformed pairs (None) are counted but skipped
+    Language detection runs in batches of langid_batch_size pairs through language_id.detect_languages
+    Returns (kept, total, first 5 kept pairs)
+    """
 
-    with open(infile, 'r', encoding='utf-8') as f_in:
-        lines = f_in.readlines()
+    seen_fingerprints = set()
+    examples = []
+    kept = 0
+    seen = 0
+    candidates = []
 
-    if max_lines:
-        lines = lines[:max_lines]
+    cache = open_langid_cache(langid_cache) if use_langdetect and langid_cache else None
+    executor = make_langid_executor(langid_workers) if use_langdetect else None
 
-    # Sample before filtering
-    if sample_size and len(lines) > sample_size:
-        lines = random.sample(lines, sample_size)
+    with open(eng_outfile, 'w', encoding='utf-8') as f_en_out, open(spa_outfile, 'w', encoding='utf-8') as f_es_out:
 
-    filtered_pairs = []
-    start_time = time.time()
+        def write_pairs(batch):
+            """Language-check a batch of candidates (if enabled) and write the ones that pass"""
+            nonlocal kept
+
+            if use_langdetect and batch:
+                # English and Spanish sides go through one batch so the pool stays busy
+                langs = detect_languages(
+                    [en for en, _ in batch] + [es for _, es in batch],
+                    backend=langid_backend,
+                    cache=cache,
+                    executor=executor
+                )
+                en_langs, es_langs = langs[:len(batch)], langs[len(batch):]
+                # If lines do not match expected languages (or detection failed), skip
+                batch = [
+                    pair for pair, en_lang, es_lang in zip(batch, en_langs, es_langs)
+                    if en_lang == 'en' and es_lang == 'es'
+                ]
+
+            for en_line, es_line in batch:
+                f_en_out.write(en_line + "\n")
+                f_es_out.write(es_line + "\n")
+                kept += 1
+
+                if len(examples) < 5:
+                    examples.append((en_line, es_line))
+
+        try:
+            for pair in tqdm(pairs, total=total, desc=desc, dynamic_ncols=True, unit="line"):
+                seen += 1
+                if pair is None:
+                    continue
+
+                en_line = pair[0].strip()
+                es_line = pair[1].strip()
+
+                # Skip empty lines
+                if not en_line or not es_line:
+                    continue
 
-    for line in tqdm(lines, desc="Filtering Tatoeba lines", ncols=100, unit="line"):
-        line = line.strip()
-        if not line:
-            continue
-
-        parts = line.split('\t')
-        if len(parts) < 4:
-            continue
-
-        en_line = parts[1].strip()
-        es_line = parts[3].strip()
-
-        # Length checks
-        if len(en_line) < min_length or len(es_line) < min_length:
-            continue
-        if len(en_line) > max_length or len(es_line) > max_length:
-            continue
-
-        # Language detection
-        if use_langdetect:
-            try:
-                en_lang = detect(en_line)
-                es_lang = detect(es_line)
-                if en_lang != 'en' or es_lang != 'es':
+                # Length checks
+                if len(en_line) < min_length or len(es_line) < min_length:
                     continue
-            except:
-                continue
+                if len(en_line) > max_length or len(es_line) > max_length:
+                    continue
+
+                # Remove duplicates (optional) using 64-bit fingerprints instead of the strings themselves
+                # Done before language ID so repeated pairs are never detected twice
+                if remove_duplicates:
+                    fingerprint = pair_fingerprint(en_line, es_line)
+                    if fingerprint in seen_fingerprints:
+                        continue
+                    seen_fingerprints.add(fingerprint)
+
+                candidates.append((en_line, es_line))
+                if len(candidates) >= langid_batch_size:
+                    write_pairs(candidates)
+                    candidates = []
+
+            write_pairs(candidates)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if cache is not None:
+                cache.close()
+
+    return kept, seen, examples
 
-        # Add to the list if valid
-        filtered_pairs.append((en_line, es_line))
 
-    # Remove duplicates
-    if remove_duplicates:
-        filtered_pairs = list(set(filtered_pairs))
+def filter_tatoeba(
+    infile,
+    eng_outfile,
+    spa_outfile,
+    min_length=3,
+    max_length=1000,
+    remove_duplicates=True,
+    use_langdetect=False,
+    max_lines=None,
+    sample_size=None,  # set to a number n to process n random lines from each file
+    print_examples=False,
+    langid_workers=None,  # processes for language ID, None = all CPUs, 1 = in-process
+    langid_cache=None,  # path to the SQLite language ID cache, None to disable
+    seed=None  # seed for sampling, so the same sample is drawn on every run
+):
+    """Filter Tatoeba lines, each containing English and Spanish separated by tabs and write the filtered lines to a new file"""
+
+    start_time = time.time()
 
-    if print_examples and filtered_pairs:
+    with open(infile, 'r', encoding='utf-8') as f_in:
+        lines = f_in
+
+        if max_lines:
+            lines = islice(lines, max_lines)
+
+        pairs = map(parse_tatoeba_line, lines)
+        total = None
+
+        # Sample before filtering, keeping only sample_size lines in memory
+        if sample_size:
+            pairs, _ = reservoir_sample(pairs, sample_size, rng=random.Random(seed))
+            total = len(pairs)
+
+        kept, total, examples = filter_pairs_to_files(
+            pairs,
+            eng_outfile,
+            spa_outfile,
+            min_length=min_length,
+            max_length=max_length,
+            remove_duplicates=remove_duplicates,
+            use_langdetect=use_langdetect,
+            total=total,
+            desc="Filtering Tatoeba lines",
+            langid_workers=langid_workers,
+            langid_cache=langid_cache
+        )
+
+    if print_examples and examples:
         print("Showing 5 filtered Tatoeba pairs:")
-        for i, (en, es) in enumerate(filtered_pairs[:5]):
+        for i, (en, es) in enumerate(examples):
             print(f"Pair {i+1}:\n  [EN] {en}\n  [ES] {es}\n")
 
-    with open(eng_outfile, 'w', encoding='utf-8') as f_en, open(spa_outfile, 'w', encoding='utf-8') as f_es:
-        for en_line, es_line in filtered_pairs:
-            f_en.write(en_line + "\n")
-            f_es.write(es_line + "\n")
-
-    kept = len(filtered_pairs)
-    total = len(lines)
-    percent = kept / total * 100 if total < 0 else 0
+    percent = kept / total * 100 if total > 0 else 0
 
     print(f"Tatoeba filtering complete: {infile}")
     print(f"Kept {kept}/{total} lines after filtering ({percent:.1f}%).")
@@ -105,88 +234,53 @@ def filter_parallel_corpus(
     use_langdetect=False,
     max_lines=None,  # set to a number n to process only the first n lines from each file
     sample_size=None,  # set to a number n to process n random lines from each file
-    print_examples=False  # set to True to print the first 5 pairs of lines
+    print_examples=False,  # set to True to print the first 5 pairs of lines
+    langid_workers=None,  # processes for language ID, None = all CPUs, 1 = in-process
+    langid_cache=None,  # path to the SQLite language ID cache, None to disable
+    seed=None  # seed for sampling, so the same sample is drawn on every run
 ):
-    """Filter parallel English-Spanish lines in sync and write to new files"""
-
-    # Read lines
-    with open(eng_infile, 'r', encoding='utf-8') as f_en, open(spa_infile, 'r', encoding='utf-8') as f_es:
-        eng_lines = f_en.readlines()
-        spa_lines = f_es.readlines()
-
-    # Check line count
-    if len(eng_lines) != len(spa_lines):
-        raise ValueError(
-            f"Mismatch in line count: {eng_infile} has {len(eng_lines)} lines, "
-            f"{spa_infile} has {len(spa_lines)} lines"
-        )
-
-    # If max_lines is specified, slice the arrays
-    if max_lines is not None:
-        eng_lines = eng_lines[:max_lines]
-        spa_lines = spa_lines[:max_lines]
-
-    # Apply random sampling before filtering
-    if sample_size and len(eng_lines) > sample_size:
-        paired = list(zip(eng_lines, spa_lines))
-        paired = random.sample(paired, sample_size)
-        eng_lines, spa_lines = zip(*paired)
+    """
+    Filter parallel English-Spanish lines in sync and write to new files
+    Both files are streamed in lock-step, so memory does not grow with the corpus size
+    """
 
-    total_lines = len(eng_lines)
-    filtered_pairs = []
     start_time = time.time()
 
-    # Wrap loop in tqdm for a progress bar
-    for en_line, es_line in tqdm(zip(eng_lines, spa_lines), total=total_lines, desc="Filtering lines", dynamic_ncols=True, unit="line"):
-        en_line = en_line.strip()
-        es_line = es_line.strip()
-
-        # Skip empty lines
-        if not en_line or not es_line:
-            continue
-
-        # Length checks
-        if len(en_line) < min_length or len(es_line) < min_length:
-            continue
-        if len(en_line) > max_length or len(es_line) > max_length:
-            continue
-
-        # Language detection
-        if use_langdetect:
-            try:
-                en_lang = detect(en_line)
-                es_lang = detect(es_line)
-                # If lines do not match expected languages, skip
-                if en_lang != 'en' or es_lang != 'es':
-                    continue
-            except:
-                # If langdetect fails, skip the line
-                continue
+    pairs = read_parallel_lines(eng_infile, spa_infile)
 
-        # If it passes all filters, append it
-        filtered_pairs.append((en_line, es_line))
-
-    # Remove duplicates (optional)
-    if remove_duplicates:
-        filtered_pairs = list(set(filtered_pairs))
+    # If max_lines is specified, only read that many lines
+    if max_lines is not None:
+        pairs = islice(pairs, max_lines)
+
+    # Apply reservoir sampling before filtering
+    total = None
+    if sample_size:
+        pairs, _ = reservoir_sample(pairs, sample_size, rng=random.Random(seed))
+        total = len(pairs)
+
+    kept, total_lines, examples = filter_pairs_to_files(
+        pairs,
+        eng_outfile,
+        spa_outfile,
+        min_length=min_length,
+        max_length=max_length,
+        remove_duplicates=remove_duplicates,
+        use_langdetect=use_langdetect,
+        total=total,
+        langid_workers=langid_workers,
+        langid_cache=langid_cache
+    )
 
     # DEBUG: print examples if requested
-    if print_examples and filtered_pairs:
+    if print_examples and examples:
         print("Showing up to 5 filtered line pairs:")
-        for i, (en, es) in enumerate(filtered_pairs[:5]):
+        for i, (en, es) in enumerate(examples):
             print(f"Pair {i+1}:")
             print(f"  [EN]: {en}")
             print(f"  [ES]: {es}")
             print("")
 
-    # Write to output
-    with open(eng_outfile, 'w', encoding='utf-8') as f_en_out, open(spa_outfile, 'w', encoding='utf-8') as f_es_out:
-        for en_line, es_line in filtered_pairs:
-            f_en_out.write(en_line + "\n")
-            f_es_out.write(es_line + "\n")
-
-    kept = len(filtered_pairs)
-    percent = kept / total_lines * 100 if total_lines < 0 else 0
+    percent = kept / total_lines * 100 if total_lines > 0 else 0
 
     print(f"Filtering complete: {eng_infile} and {spa_infile}")
     print(f"Kept {kept}/{total_lines} lines after filtering ({percent:.1f}%)")
@@ -196,60 +290,61 @@ def filter_parallel_corpus(
     print(f"Elapsed time: {elapsed:.2f} seconds")
 
 
-def combined_filtered_files_to_jsonl(pairs_list, output_file):
+def combined_filtered_files_to_jsonl(pairs_list, output_file, columnar_dir=None, buffer_size=1 << 20):
     """
     Combine filtered data into one JSONL file
     Contains:
         English sentence
         Spanish sentence
         source
+    Lines are streamed from the filtered files straight to the output, so memory stays constant
+    If columnar_dir is given, the same rows are also written in the binary columnar format (see columnar_store.py)
     """
 
     start_time = time.time()
-    combined_data = []
-
-    for en_path, es_path, source_name in pairs_list:
-        with open(en_path, 'r', encoding='utf-8') as f_en, open(es_path, 'r', encoding='utf-8') as f_es:
-            en_lines = f_en.readlines()
-            es_lines = f_es.readlines()
-
-        # Each source should have aligned line counts
-        assert len(en_lines) == len(es_lines), f"Line mismatch in {source_name}"
-
-        print(f"Processing {source_name}: {len(en_lines)} pairs")
-
-        # Combine aligned lines from sources
-        for en, es in tqdm(
-        zip(en_lines, es_lines),
-        total=len(en_lines),
-        desc=f"Adding {source_name}",
-        dynamic_ncols=True,
-        unit="pair"
-        ):
-            en = en.strip()
-            es = es.strip()
-            combined_data.append({
-                "en": en,
-                "es": es,
-                "source": source_name
-            })
-
-    # Write all combined entries to a single JSONL file
-    with open(output_file, 'w', encoding='utf-8') as f_out:
-        for item in tqdm(
-        combined_data,
-        desc="Writing JSONL",
-        dynamic_ncols=True,
-        unit="entry"
-        ):
-            f_out.write(json.dumps(item, ensure_ascii=False) + '\n')
+    total = 0
+    columnar_writer = ColumnarWriter(columnar_dir, ["en", "es", "source"]) if columnar_dir else None
+
+    try:
+        with open(output_file, 'w', encoding='utf-8', buffering=buffer_size) as f_out:
+            for en_path, es_path, source_name in pairs_list:
+                count = 0
+
+                # Each source should have aligned line counts (checked while reading in lock-step)
+                for en, es in tqdm(
+                read_parallel_lines(en_path, es_path),
+                desc=f"Adding {source_name}",
+                dynamic_ncols=True,
+                unit="pair"
+                ):
+                    item = {
+                        "en": en.strip(),
+                        "es": es.strip(),
+                        "source": source_name
+                    }
+                    f_out.write(json.dumps(item, ensure_ascii=False) + '\n')
+                    if columnar_writer is not None:
+                        columnar_writer.write_row(item)
+                    count += 1
+
+                print(f"Processed {source_name}: {count} pairs")
+                total += count
+    except BaseException:
+        if columnar_writer is not None:
+            columnar_writer.abort()  # no manifest: the partial columnar copy must not be loaded
+        raise
+    if columnar_writer is not None:
+        columnar_writer.close()
 
     # Print completion message and elapsed time
     elapsed = time.time() - start_time
-    print(f"Combined file written to {output_file} with {len(combined_data)} entries")
+    print(f"Combined file written to {output_file} with {total} entries")
+    if columnar_dir:
+        print(f"Columnar copy written to {columnar_dir}")
     print(f"Elapsed time: {elapsed:.2f} seconds")
 
-# CALL THE METHODS
+
+# FILE PATHS
 
 # Load filenames
 TATOEBA_INFILE = "data/tatoeba/tatoeba_en-es.tsv"
@@ -272,74 +367,22 @@ OPENSUBTITLES_SPA_OUTFILE = "data/opensubtitles/opensubtitles.en-es.es.filtered"
 OPENSUBTITLES_ENG_300K_OUTFILE = "data/opensubtitles/opensubtitles_300k.en-es.en.filtered"
 OPENSUBTITLES_SPA_300K_OUTFILE = "data/opensubtitles/opensubtitles_300k.en-es.es.filtered"
 
-# FILTER DATA
+COMBINED_OUTFILE = "data/combined_sentence_pairs_300k_each.en-es.jsonl"  # add _version# if needed
+DEDUPED_OUTFILE = "data/combined_sentence_pairs_300k_each.en-es.dedup.jsonl"  # after near-duplicate removal
+DEDUPED_COLUMNAR_DIR = "data/sentence_pairs_columns"  # binary columnar copy of DEDUPED_OUTFILE for the index builders
 
-# Tatoeba
-print("TATOEBA")
-print("-" * 100)
-filter_tatoeba(
-    infile=TATOEBA_INFILE,
-    eng_outfile=TATOEBA_ENG_300K_OUTFILE,
-    spa_outfile=TATOEBA_SPA_300K_OUTFILE,
-    min_length=3,
-    max_length=1000,
-    remove_duplicates=True,
-    use_langdetect=True,
-    max_lines=None,  # set to a number n to process only the first n lines from each file
-    sample_size=300000,  # 300k samples
-    print_examples=True  # set to True to print the first 5 pairs of lines
-)
-print("DONE 1/3")
-print()
-
-# Wikimatrix
-print("WIKIMATRIX")
-print("-" * 100)
-filter_parallel_corpus(
-    eng_infile=WIKIMATRIX_ENG_INFILE,
-    spa_infile=WIKIMATRIX_SPA_INFILE,
-    eng_outfile=WIKIMATRIX_ENG_300K_OUTFILE,
-    spa_outfile=WIKIMATRIX_SPA_300K_OUTFILE,
-    min_length=3,
-    max_length=1000,
-    remove_duplicates=True,
-    use_langdetect=True,
-    max_lines=None,  # set to a number n to process only the first n lines from each file
-    sample_size=300000, # 300k samples
-    print_examples=True  # set to True to print the first 5 pairs of lines
-)
-print("DONE 2/3")
-print()
-
-# Open Subtitles
-print("OPEN SUBTITLES")
-print("-" * 100)
-filter_parallel_corpus(
-    eng_infile=OPENSUBTITLES_ENG_INFILE,
-    spa_infile=OPENSUBTITLES_SPA_INFILE,
-    eng_outfile=OPENSUBTITLES_ENG_300K_OUTFILE,
-    spa_outfile=OPENSUBTITLES_SPA_300K_OUTFILE,
-    min_length=3,
-    max_length=1000,
-    remove_duplicates=True,
-    use_langdetect=True,
-    max_lines=None,  # set to a number n to process only the first n lines from each file
-    sample_size=600000,  # 600k samples
-    print_examples=True  # set to True to print the first 5 pairs of lines
-)
-print("DONE 3/3")
-print()
-
-# COMBINE ALL FILTERED FILES INTO ONE JSONL
-
-print("COMBINING FILTERED FILES INTO JSONL")
-print("-" * 100)
-
-combined_filtered_files_to_jsonl(
-    pairs_list=[
-        (TATOEBA_ENG_300K_OUTFILE, TATOEBA_SPA_300K_OUTFILE, "tatoeba"),
-        (WIKIMATRIX_ENG_300K_OUTFILE, WIKIMATRIX_SPA_300K_OUTFILE, "wikimatrix"),
-        (OPENSUBTITLES_ENG_300K_OUTFILE, OPENSUBTITLES_SPA_300K_OUTFILE, "opensubtitles")
-    ],
-    output_file="data/combined_300k_each.en-es.jsonl"  # add _version# if needed
-)
\ No newline at end of file
+# Language ID cache shared by all sources, so re-runs do not re-detect lines
+LANGID_CACHE_FILE = "data/langid_cache.sqlite"
+
+# Seed for all sampling, so runs are reproducible
+SAMPLING_SEED = 42
+
+
+# CALL THE METHODS
+# The filtering and combining steps are stages in data_prep_pipeline.py, which runs
+# the three sources in parallel and skips any stage whose inputs and parameters have not changed
+
+if __name__ == "__main__":
+    from data_prep_pipeline import run_pipeline
+
+    run_pipeline(targets=["near_dedup_sentence_pairs"])
@@ -5,64 +5,120 @@
 # index them for fast similarity search, and store metadata for
 # later use by the chatbot
 
+import argparse
 import json
+import os
 from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
 from tqdm import tqdm
 import torch
+from columnar_store import read_column
+from faiss_index_utils import INDEX_METRICS, INDEX_STORAGE, build_faiss_index
+from index_bundle import publish_bundle
 
-# Load embedding model
-model = SentenceTransformer('sentence-transformers/all-MiniLM-L12-v2')
-
-# Move model to GPU if available
-if torch.cuda.is_available():
-    model = model.to('cuda')
-    device = 'cuda'
-    print("Using GPU for embedding")
-else:
-    device = 'cpu'
-    print("GPU not available, using CPU")
-
-# Load data
-data_path = "data/combined_sentence_pairs_300k_each.en-es.jsonl"  # add _version# if needed
-entries = []
-with open(data_path, 'r', encoding='utf-8') as f:
-    for line in tqdm(f, desc="Loading data", unit='line', dynamic_ncols=True):
-        entries.append(json.loads(line))
-
-# Prepare texts to embed (English)
-texts = [entry["en"] for entry in entries]
-
-# Encode texts into dense vectors
-print("Encoding texts...")
-embeddings = model.encode(
-    texts,
-    batch_size=64,
-    show_progress_bar=True,
-    convert_to_numpy=True,
-    device=device
-)
-
-embeddings = np.array(embeddings).astype('float32')  # to be extra safe
-
-# Create FAISS index
-dimension = embeddings.shape[1]
-index = faiss.IndexFlatL2(dimension)
-index.add(embeddings)
-
-# Save FAISS index
-faiss.write_index(index, 'data/rag_index.faiss')
-print("Saved FAISS index")
-
-# Save associated metadata (Spanish sentences + source)
-with open('data/rag_metadata.jsonl', 'w', encoding='utf-8') as f:
-    for entry in tqdm(entries, desc="Writing metadata", unit='entry', dynamic_ncols=True):
-        f.write(json.dumps({
-            "en": entry["en"],
-            "es": entry["es"],
-            "source": entry["source"]
-        }, ensure_ascii=False) + "\n")
-print("Saved metadata")
-
-print(f"Indexed {len(embeddings)} entries with dimension {dimension}")
\ No newline at end of file
+# Parameters
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L12-v2"
+DATA_FILE = "data/combined_sentence_pairs_300k_each.en-es.jsonl"  # add _version# if needed
+EMBEDDINGS_FILE = "data/sentence_pairs_embeddings.npy"  # add _version# if needed
+FAISS_INDEX_FILE = "data/sentence_pairs_index.faiss"  # add _version# if needed
+METADATA_FILE = "data/sentence_pairs_metadata.jsonl"  # add _version# if needed
+
+
+def load_embedding_model(model_name=EMBEDDING_MODEL_NAME):
+    """Load the embedding model, on GPU if available"""
+    model = SentenceTransformer(model_name)
+
+    # Move model to GPU if available
+    if torch.cuda.is_available():
+        model = model.to('cuda')
+        device = 'cuda'
+        print("Using GPU for embedding")
+    else:
+        device = 'cpu'
+        print("GPU not available, using CPU")
+
+    return model, device
+
+
+def embed_sentence_pairs(data_path=DATA_FILE, embeddings_file=EMBEDDINGS_FILE, batch_size=64, columnar_dir=None):
+    """
+    Encode the English side of every sentence pair and save the vectors as a .npy file
+    If columnar_dir is given, the English column is read from the binary columnar copy instead of parsing the JSONL
+    """
+
+    # Load data
+    if columnar_dir:
+        print(f"Loading English column from {columnar_dir}")
+        texts = read_column(columnar_dir, "en")
+    else:
+        texts = []
+        with open(data_path, 'r', encoding='utf-8') as f:
+            for line in tqdm(f, desc="Loading data", unit='line', dynamic_ncols=True):
+                texts.append(json.loads(line)["en"])  # Prepare texts to embed (English)
+
+    model, device = load_embedding_model()
+
+    # Encode texts into dense vectors
+    print("Encoding texts...")
+    embeddings = model.encode(
+        texts,
+        batch_size=batch_size,
+        show_progress_bar=True,
+        convert_to_numpy=True,
+        device=device
+    )
+
+    embeddings = np.array(embeddings).astype('float32')  # to be extra safe
+    np.save(embeddings_file, embeddings)
+    print(f"Saved {len(embeddings)} embeddings to {embeddings_file}")
+
+
+def build_sentence_pairs_index(
+    data_path=DATA_FILE,
+    embeddings_file=EMBEDDINGS_FILE,
+    index_file=FAISS_INDEX_FILE,
+    metadata_file=METADATA_FILE,
+    metric="l2",  # "l2" or "cosine" (normalised vectors, inner product)
+    storage="float32",  # "float32", "float16" or "sq8"
+    bundle=True  # also publish index + metadata as a new versioned bundle the chatbot loads (index_bundle.py)
+):
+    """Build the FAISS index from saved embeddings and write the aligned metadata file"""
+
+    embeddings = np.load(embeddings_file).astype('float32')
+
+    # Create FAISS index
+    dimension = embeddings.shape[1]
+    index = build_faiss_index(embeddings, metric=metric, storage=storage)
+    print(f"Built {metric}/{storage} index")
+
+    # Save FAISS index
+    faiss.write_index(index, index_file)
+    print(f"Saved FAISS index to {index_file}")
+
+    # Save associated metadata (Spanish sentences + source), streamed in the same order as the embeddings
+    with open(data_path, 'r', encoding='utf-8') as f_in, open(metadata_file, 'w', encoding='utf-8') as f_out:
+        for line in tqdm(f_in, desc="Writing metadata", unit='entry', dynamic_ncols=True):
+            entry = json.loads(line)
+            f_out.write(json.dumps({
+                "en": entry["en"],
+                "es": entry["es"],
+                "source": entry["source"]
+            }, ensure_ascii=False) + "\n")
+    print(f"Saved metadata to {metadata_file}")
+
+    print(f"Indexed {len(embeddings)} entries with dimension {dimension}")
+
+    if bundle:
+        publish_bundle(os.path.dirname(index_file) or ".", "sentence_pairs", index_file, metadata_file, EMBEDDING_MODEL_NAME)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--metric", choices=INDEX_METRICS, default="l2", help="l2 or cosine (normalised, inner product)")
+    parser.add_argument("--storage", choices=INDEX_STORAGE, default="float32", help="How vectors are stored in the index")
+    parser.add_argument("--no_bundle", action="store_true", help="Only write the index and metadata files, don't publish a bundle (the chatbot keeps loading the current bundle if one exists)")
+    args = parser.parse_args()
+
+    embed_sentence_pairs()
+    build_sentence_pairs_index(metric=args.metric, storage=args.storage, bundle=not args.no_bundle)
@@ -112,34 +112,41 @@ def chunk_text(text, lang="en", max_words=CHUNK_SIZE, max_tokens=MAX_TOKENS):
 
     return chunks
 
-# Combine all JSONL files with chunking
-chunked_records = []
-
-# Read from combined JSONL file
-with open(INPUT_FILE, "r", encoding="utf-8") as f:
-    for line in tqdm(f, desc="Chunking combined city data"):
-        record = json.loads(line)
-        city = record.get("city")
-        lang = record.get("lang")
-        text = record.get(lang)
-
-        if not text:
-            continue
-
-        for i, chunk_data in enumerate(chunk_text(text, lang=lang)):
-            chunked_records.append({
-                "lang": lang,
-                "city": city,
-                "source": "wikivoyage",
-                "chunk_id": f"{city.lower().replace(' ', '_')}_{lang}_{i}",
-                "text": chunk_data["text"],
-                "section": chunk_data["section"]
-            })
-
-# Save chunked data to combined output JSONL
-os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
-with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-    for record in chunked_records:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
-
-print(f"Saved {len(chunked_records)} chunks to {OUTPUT_FILE}")
\ No newline at end of file
+def chunk_travel_file(input_file=INPUT_FILE, output_file=OUTPUT_FILE):
+    """Chunk every city record in the combined travel file and write the chunks to one JSONL file"""
+
+    # Combine all JSONL files with chunking
+    chunked_records = []
+
+    # Read from combined JSONL file
+    with open(input_file, "r", encoding="utf-8") as f:
+        for line in tqdm(f, desc="Chunking combined city data"):
+            record = json.loads(line)
+            city = record.get("city")
+            lang = record.get("lang")
+            text = record.get(lang)
+
+            if not text:
+                continue
+
+            for i, chunk_data in enumerate(chunk_text(text, lang=lang)):
+                chunked_records.append({
+                    "lang": lang,
+                    "city": city,
+                    "source": "wikivoyage",
+                    "chunk_id": f"{city.lower().replace(' ', '_')}_{lang}_{i}",
+                    "text": chunk_data["text"],
+                    "section": chunk_data["section"]
+                })
+
+    # Save chunked data to combined output JSONL
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as f:
+        for record in chunked_records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    print(f"Saved {len(chunked_records)} chunks to {output_file}")
+
+
+if __name__ == "__main__":
+    chunk_travel_file()
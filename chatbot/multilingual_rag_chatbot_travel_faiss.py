@@ -2,48 +2,85 @@
 # April 28, 2025
 # Vector index for retrieval - embed and index data with FAISS
 
+import argparse
 import os
 import json
 import numpy as np
 from tqdm import tqdm
 from sentence_transformers import SentenceTransformer
 import faiss
+from faiss_index_utils import INDEX_METRICS, INDEX_STORAGE, build_faiss_index
+from index_bundle import publish_bundle
 
 # Parameters
 CHUNKED_FILE = "data/chunked_travel_info_orig_data.jsonl"  # add _version# if needed
 EMBEDDING_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+EMBEDDINGS_FILE = "data/chunked_travel_info_embeddings.npy"  # add _version# if needed
 FAISS_INDEX_FILE = "data/chunked_travel_info_index.faiss"  # add _version# if needed
 METADATA_FILE = "data/chunked_travel_info_metadata.jsonl"  # add _version# if needed
 
-# Load chunked records
-print("Loading chunked records...")
-chunked_records = []
-with open(CHUNKED_FILE, "r", encoding="utf-8") as f:
-    for line in tqdm(f, desc="Reading chunks"):
-        chunked_records.append(json.loads(line))
-
-# Load multilingual embedding model
-print("Loading model...")
-model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-
-# Encode all chunks
-texts = [record["text"] for record in chunked_records]
-print("Encoding texts...")
-embeddings = model.encode(texts, show_progress_bar=True, batch_size=64)
-
-# Create FAISS index
-print("Creating FAISS index...")
-dimension = embeddings.shape[1]
-faiss_index = faiss.IndexFlatL2(dimension)
-faiss_index.add(np.array(embeddings))
-
-# Save FAISS index
-os.makedirs(os.path.dirname(FAISS_INDEX_FILE), exist_ok=True)
-faiss.write_index(faiss_index, FAISS_INDEX_FILE)
-print(f"Saved FAISS index to {FAISS_INDEX_FILE}")
-
-# Save metadata to JSON file for easy lookups
-with open(METADATA_FILE, "w", encoding="utf-8") as f:
-    for record in chunked_records:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
-print(f"Saved metadata to {METADATA_FILE}")
\ No newline at end of file
+
+def embed_travel_chunks(chunked_file=CHUNKED_FILE, embeddings_file=EMBEDDINGS_FILE, batch_size=64):
+    """Encode every travel chunk and save the vectors as a .npy file"""
+
+    # Load chunked records
+    print("Loading chunked records...")
+    texts = []
+    with open(chunked_file, "r", encoding="utf-8") as f:
+        for line in tqdm(f, desc="Reading chunks"):
+            texts.append(json.loads(line)["text"])
+
+    # Load multilingual embedding model
+    print("Loading model...")
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+    # Encode all chunks
+    print("Encoding texts...")
+    embeddings = model.encode(texts, show_progress_bar=True, batch_size=batch_size)
+
+    os.makedirs(os.path.dirname(embeddings_file), exist_ok=True)
+    np.save(embeddings_file, np.array(embeddings).astype("float32"))
+    print(f"Saved {len(embeddings)} embeddings to {embeddings_file}")
+
+
+def build_travel_index(
+    chunked_file=CHUNKED_FILE,
+    embeddings_file=EMBEDDINGS_FILE,
+    index_file=FAISS_INDEX_FILE,
+    metadata_file=METADATA_FILE,
+    metric="l2",  # "l2" or "cosine" (normalised vectors, inner product)
+    storage="float32",  # "float32", "float16" or "sq8"
+    bundle=True  # also publish index + metadata as a new versioned bundle the chatbot loads (index_bundle.py)
+):
+    """Build the FAISS index from saved embeddings and write the aligned metadata file"""
+
+    embeddings = np.load(embeddings_file).astype("float32")
+
+    # Create FAISS index
+    print(f"Creating {metric}/{storage} FAISS index...")
+    faiss_index = build_faiss_index(embeddings, metric=metric, storage=storage)
+
+    # Save FAISS index
+    os.makedirs(os.path.dirname(index_file), exist_ok=True)
+    faiss.write_index(faiss_index, index_file)
+    print(f"Saved FAISS index to {index_file}")
+
+    # Save metadata to JSON file for easy lookups
+    with open(chunked_file, "r", encoding="utf-8") as f_in, open(metadata_file, "w", encoding="utf-8") as f_out:
+        for line in f_in:
+            f_out.write(json.dumps(json.loads(line), ensure_ascii=False) + "\n")
+    print(f"Saved metadata to {metadata_file}")
+
+    if bundle:
+        publish_bundle(os.path.dirname(index_file) or ".", "travel", index_file, metadata_file, EMBEDDING_MODEL_NAME)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--metric", choices=INDEX_METRICS, default="l2", help="l2 or cosine (normalised, inner product)")
+    parser.add_argument("--storage", choices=INDEX_STORAGE, default="float32", help="How vectors are stored in the index")
+    parser.add_argument("--no_bundle", action="store_true", help="Only write the index and metadata files, don't publish a bundle (the chatbot keeps loading the current bundle if one exists)")
+    args = parser.parse_args()
+
+    embed_travel_chunks()
+    build_travel_index(metric=args.metric, storage=args.storage, bundle=not args.no_bundle)
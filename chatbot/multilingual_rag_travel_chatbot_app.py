@@ -1,14 +1,45 @@
 # Streamlit app for multilingual travel assistant chatbot with optional sampling
 
+import json
+import uuid
+from concurrent.futures import CancelledError, wait
+
 import streamlit as st
-from multilingual_rag_chatbot_llm import generate_response, format_prompt
+from conversation import ConversationSession
+from generation_queue import QueueFull
 
 st.set_page_config(page_title="Multilingual Travel Assistant Chatbot", layout="centered")
+
+
+@st.cache_resource(show_spinner="Loading models and indexes...")
+def load_chatbot():
+    """
+    Retriever (embedding models, FAISS indexes, metadata) and generator (local Mistral or an
+    INFERENCE_SERVER_URL client), loaded and warmed up once per server process and shared by all sessions
+    The re-ranker is preloaded too, since the retrieval settings offer it
+    """
+    import multilingual_rag_chatbot_llm as chatbot
+    print(f"Warm-up took {chatbot.warm_up(rerank=True):.1f} s")
+    return chatbot
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def health_status():
+    return load_chatbot().health_check()
+
+
+chatbot = load_chatbot()
+
+with st.sidebar:
+    st.markdown("**Health**")
+    for name, (ok, detail) in health_status().items():
+        st.markdown(f"{'✅' if ok else '❌'} {name}: {detail}")
+
 st.title("Multilingual Travel Assistant Chatbot")
 st.markdown("Ask about language, grammar, or travel info in English or Spanish")
 
 # Input and settings
-lang = st.selectbox("Select language:", ["en", "es"])
+lang = st.selectbox("Select language:", ["auto", "en", "es"])  # travel mode searches only this language's passages
 
 # Example buttons
 col1, col2 = st.columns(2)
@@ -29,41 +60,130 @@ if do_sample:
 else:
     top_p = temperature = None
 
+# Conversation memory survives reruns as a plain dict in session state; switching mode starts a new one
+state = st.session_state.get("conversation")
+if st.button("New conversation") or state is None or state["mode"] != mode:
+    session = chatbot.new_session(mode)
+else:
+    session = ConversationSession.from_dict(state, count_tokens=chatbot.count_tokens)
+
+if session.turns or session.summary:
+    with st.expander("Conversation so far"):
+        st.text(session.history_text())
+
+# Retrieval settings: only keep context that is actually close to the question
+max_distance = gap = rerank_top_n = None
+if mode != "no_retrieval":
+    with st.expander("Retrieval settings"):
+        k = st.slider("Max passages (k)", 1, 20, 5)
+        # Thresholds are in the loaded index's own distance: 1 - cosine similarity, or squared L2
+        # with the ranges scaled to the size of its vectors
+        metric, scale = chatbot.distance_scale(mode)
+        unit = "1 - cosine similarity" if metric == "cosine" else "squared L2"
+        if st.checkbox("Drop unrelated passages (distance threshold)", value=False):
+            max_distance = st.slider(f"Max distance ({unit})", round(0.05 * scale, 2), round(1.0 * scale, 2), round(0.6 * scale, 2))
+        if st.checkbox("Adaptive k (stop at a gap in distance)", value=False):
+            gap = st.slider(f"Distance gap ({unit})", round(0.01 * scale, 2), round(0.5 * scale, 2), round(0.1 * scale, 2))
+        if st.checkbox("Re-rank with a cross-encoder", value=False):
+            rerank_top_n = st.slider("Passages kept after re-ranking", 1, 5, 2)
+else:
+    k = 5
+
+show_timings = st.checkbox("Show timings", value=False)
+
 # Handle response generation
+# Requests go through the shared generation queue; a request still running when the page reruns
+# (e.g. the Cancel button was clicked) is kept in session state and picked up again below
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = uuid.uuid4().hex
+session_id = st.session_state["session_id"]
+
 if st.button("Send"):
     if not user_input.strip():
         st.warning("Please enter a message")
+    elif "pending" in st.session_state:
+        st.warning("Still answering your previous message, cancel it or wait for it to finish")
     else:
-        with st.spinner("Generating response..."):
-                answer = generate_response(
-                    user_input=user_input,
-                    mode=mode,
-                    do_sample=do_sample,
-                    top_p=top_p,
-                    temperature=temperature
-                )
-
-        st.success("Bot Response:")
+        try:
+            job = chatbot.submit_response(
+                session_id,
+                user_input=user_input,
+                mode=mode,
+                do_sample=do_sample,
+                top_p=top_p,
+                temperature=temperature,
+                k=k,
+                max_distance=max_distance,
+                gap=gap,
+                rerank_top_n=rerank_top_n,
+                lang=lang,
+                session=session,
+                trace=show_timings
+            )
+            st.session_state["pending"] = {"job": job, "session": session, "mode": mode}
+        except QueueFull:
+            st.error(f"The assistant is busy ({chatbot.generation_queue.depth()} requests in progress), please try again in a moment")
+
+pending = st.session_state.get("pending")
+if pending is not None:
+    job = pending["job"]
+    if st.button("Cancel"):
+        chatbot.generation_queue.cancel(session_id)
+
+    # Show the queue position while waiting; each update is also where Streamlit can interrupt for a rerun
+    status = st.empty()
+    while not job.done():
+        ahead = chatbot.generation_queue.position(job)
+        if ahead:
+            status.info(f"Waiting for the assistant: {ahead} request(s) ahead of yours")
+        else:
+            status.info("Generating response...")
+        wait([job.future], timeout=0.5)
+    status.empty()
+    del st.session_state["pending"]
+
+    try:
+        result = job.result()
+    except CancelledError:
+        st.warning("Generation cancelled")
+        result = None
+
+    if result is not None:
+        session, mode = pending["session"], pending["mode"]
+        answer = result["answer"]
+        context = result["context"]
+
+        st.success("Bot Response (cached):" if result.get("cache_hit") else "Bot Response:")
+        if result.get("context_reused"):
+            st.caption("Follow-up question: reused the passages from the previous turn")
         st.markdown(answer)
 
         # Show retrieved context (except in no_retrieval mode)
         if mode != "no_retrieval":
-            from multilingual_rag_chatbot_llm import retrieve_context
-            context = retrieve_context(user_input, k=5, source=mode)
-
-            st.markdown("**Context Used:**")
-            for c in context:
-                if mode == "travel":
-                    st.markdown(f"- {c['text']}")
-                else:
-                    st.markdown(f"- {c.get('en', '')} → {c.get('es', '')}")
-        else:
-            context = []
+            if context:
+                st.markdown("**Context Used:**")
+                for c, dist in zip(context, result["distances"]):
+                    if mode == "travel":
+                        st.markdown(f"- {c['text']} _(distance {dist:.3f})_")
+                    else:
+                        st.markdown(f"- {c.get('en', '')} → {c.get('es', '')} _(distance {dist:.3f})_")
+            else:
+                st.markdown("**No passage was close enough, answered without context.**")
+
+        if result.get("timings"):
+            with st.expander("Timings"):
+                st.json(result["timings"])
 
-        # Build full prompt for download
-        full_prompt = format_prompt(user_input, context if mode != "no_retrieval" else [], source_mode=mode)
+        # Full prompt for download
         st.download_button(
             label="Download Prompt + Answer",
-            data=f"{full_prompt}\n\nAnswer:\n{answer}",
+            data=f"{result['prompt']}\n\nAnswer:\n{answer}",
             file_name="chatbot_output.txt"
         )
+
+st.session_state["conversation"] = session.to_dict()
+st.download_button(
+    label="Download Conversation",
+    data=json.dumps(session.to_dict(), ensure_ascii=False, indent=2),
+    file_name="conversation.json"
+)
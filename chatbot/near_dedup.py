@@ -0,0 +1,192 @@
+# Near-duplicate removal for sentence pairs with MinHash + LSH
+# Catches pairs that exact dedup misses, e.g. "- Merci, gracias." vs "Merci, gracias."
+# Signatures are kept in a memory-mapped file on disk and LSH bands are processed one at a time,
+# so memory stays bounded for millions of rows
+
+import json
+import os
+import re
+import tempfile
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+from tqdm import tqdm
+
+from columnar_store import ColumnarWriter
+
+# splitmix64 finaliser constants, used to derive num_perm independent hash functions
+MIX_MULTIPLIER_1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX_MULTIPLIER_2 = np.uint64(0x94D049BB133111EB)
+
+NON_WORD_PATTERN = re.compile(r"[^\w\s]+", re.UNICODE)
+
+
+def normalize_text(text):
+    """Lowercase, drop punctuation (including leading dialogue dashes) and collapse whitespace"""
+    return " ".join(NON_WORD_PATTERN.sub(" ", text.lower()).split())
+
+
+def shingle_hashes(text, shingle_size=4):
+    """32-bit hashes of the character shingles of a normalised text"""
+    if len(text) <= shingle_size:
+        shingles = {text}
+    else:
+        shingles = {text[i:i + shingle_size] for i in range(len(text) - shingle_size + 1)}
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+def make_permutations(num_perm=64, seed=42):
+    """Random 64-bit seeds, one per hash function h_i(x) = mix(x xor seed_i)"""
+    rng = np.random.RandomState(seed)
+    return rng.randint(0, 1 << 62, size=num_perm, dtype=np.int64).astype(np.uint64)
+
+
+def mix64(x):
+    """splitmix64 finaliser over a uint64 array (multiplications wrap mod 2^64 on purpose)"""
+    x = x ^ (x >> np.uint64(30))
+    x = x * MIX_MULTIPLIER_1
+    x = x ^ (x >> np.uint64(27))
+    x = x * MIX_MULTIPLIER_2
+    return x ^ (x >> np.uint64(31))
+
+
+def minhash_signature(text, permutations, shingle_size=4):
+    """MinHash signature (num_perm uint32 values) of a normalised text"""
+    hashes = shingle_hashes(text, shingle_size)
+    permuted = mix64(hashes[:, None] ^ permutations[None, :])
+    # Keep the top 32 bits of each minimum to halve the signature size
+    return (permuted.min(axis=0) >> np.uint64(32)).astype(np.uint32)
+
+
+def pair_text(record, fields):
+    """Normalised text of a record's fields (e.g. English + Spanish side of a pair)"""
+    return " | ".join(normalize_text(record.get(field, "")) for field in fields)
+
+
+def compute_signatures(input_file, signature_file, fields=("en", "es"), num_perm=64, shingle_size=4, seed=42):
+    """Stream a JSONL file and append one MinHash signature per row to a raw uint32 file"""
+    permutations = make_permutations(num_perm, seed)
+    rows = 0
+    with open(input_file, "r", encoding="utf-8") as f_in, open(signature_file, "wb") as f_sig:
+        for line in tqdm(f_in, desc="MinHash signatures", unit="row", dynamic_ncols=True):
+            text = pair_text(json.loads(line), fields)
+            f_sig.write(minhash_signature(text, permutations, shingle_size).tobytes())
+            rows += 1
+    return rows
+
+
+def find(parent, i):
+    """Union-find root with path halving"""
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def cluster_near_duplicates(signatures, bands=16, threshold=0.8, verify_chunk=100000):
+    """
+    LSH over signature bands: rows sharing a band are candidates, and candidates whose
+    estimated Jaccard similarity reaches threshold are merged into one cluster
+    Returns the union-find parent array; a row is kept iff it is the root of its cluster (parent[i] == i)
+    Each cluster's root is its earliest row, so the first occurrence wins
+    """
+    num_rows, num_perm = signatures.shape
+    rows_per_band = num_perm // bands
+    parent = np.arange(num_rows, dtype=np.int64)
+    multipliers = np.array([pow(1000003, j, 1 << 64) for j in range(rows_per_band)], dtype=np.uint64)
+
+    for band in tqdm(range(bands), desc="LSH bands", unit="band", dynamic_ncols=True):
+        # One band in memory at a time: num_rows x rows_per_band uint32
+        band_sig = np.ascontiguousarray(signatures[:, band * rows_per_band:(band + 1) * rows_per_band])
+        keys = (band_sig.astype(np.uint64) * multipliers).sum(axis=1)  # wraps mod 2^64, fine for bucketing
+        del band_sig
+
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        same_bucket = np.nonzero(sorted_keys[1:] == sorted_keys[:-1])[0]
+
+        # Compare each candidate with its neighbour in the bucket; clusters form transitively
+        for start in range(0, len(same_bucket), verify_chunk):
+            idx = same_bucket[start:start + verify_chunk]
+            left = order[idx]
+            right = order[idx + 1]
+            similarity = (signatures[left] == signatures[right]).mean(axis=1)
+            for i, j in zip(left[similarity >= threshold], right[similarity >= threshold]):
+                root_i, root_j = find(parent, i), find(parent, j)
+                if root_i != root_j:
+                    # Attach the later row under the earlier one
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    return parent
+
+
+def near_dedup_jsonl(
+    input_file,
+    output_file,
+    fields=("en", "es"),
+    threshold=0.8,  # estimated Jaccard similarity of character shingles to count as a duplicate
+    num_perm=64,
+    bands=16,
+    shingle_size=4,
+    seed=42,
+    work_dir=None,  # where to keep the temporary signature file, defaults to the output folder
+    columnar_dir=None  # also write the kept rows in the binary columnar format (see columnar_store.py)
+):
+    """
+    Remove near-duplicate rows from a JSONL file, keeping the first occurrence of each cluster
+    Prints and returns how many rows were removed (overall and per source)
+    """
+    if num_perm % bands != 0:
+        raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+
+    start_time = time.time()
+    work_dir = work_dir or os.path.dirname(output_file) or "."
+    os.makedirs(work_dir, exist_ok=True)
+    fd, signature_file = tempfile.mkstemp(suffix=".minhash", dir=work_dir)
+    os.close(fd)
+
+    try:
+        num_rows = compute_signatures(input_file, signature_file, fields, num_perm, shingle_size, seed)
+        if num_rows:
+            signatures = np.memmap(signature_file, dtype=np.uint32, mode="r", shape=(num_rows, num_perm))
+            parent = cluster_near_duplicates(signatures, bands=bands, threshold=threshold)
+            del signatures
+        else:
+            parent = np.arange(0, dtype=np.int64)
+
+        # Second pass: write the rows that are the root of their cluster
+        kept = 0
+        removed_by_source = Counter()
+        columnar_writer = ColumnarWriter(columnar_dir, ["en", "es", "source"]) if columnar_dir else None
+        try:
+            with open(input_file, "r", encoding="utf-8") as f_in, open(output_file, "w", encoding="utf-8", buffering=1 << 20) as f_out:
+                for i, line in enumerate(tqdm(f_in, total=num_rows, desc="Writing deduplicated rows", unit="row", dynamic_ncols=True)):
+                    if parent[i] == i:
+                        f_out.write(line)
+                        if columnar_writer is not None:
+                            columnar_writer.write_row(json.loads(line))
+                        kept += 1
+                    else:
+                        removed_by_source[json.loads(line).get("source", "unknown")] += 1
+        except BaseException:
+            if columnar_writer is not None:
+                columnar_writer.abort()  # no manifest: the partial columnar copy must not be loaded
+            raise
+        if columnar_writer is not None:
+            columnar_writer.close()
+    finally:
+        os.remove(signature_file)
+
+    removed = num_rows - kept
+    percent = removed / num_rows * 100 if num_rows > 0 else 0
+
+    print(f"Near-duplicate removal complete: {input_file}")
+    print(f"Removed {removed}/{num_rows} rows ({percent:.1f}%), kept {kept}")
+    for source, count in removed_by_source.most_common():
+        print(f"  {source}: {count} removed")
+    print(f"Results saved to: {output_file}")
+    print(f"Elapsed time: {time.time() - start_time:.2f} seconds")
+
+    return {"rows": num_rows, "kept": kept, "removed": removed, "removed_by_source": dict(removed_by_source)}
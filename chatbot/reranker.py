@@ -0,0 +1,72 @@
+# Optional cross-encoder re-ranking of retrieved passages
+# Scores all FAISS candidates against the query in one batch and keeps the best few,
+# falling back to FAISS order when scoring does not finish within the time budget
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from sentence_transformers import CrossEncoder
+
+# Multilingual (en/es) MS MARCO cross-encoder, small enough for CPU
+RERANKER_MODEL_NAME = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+_reranker = None
+_load_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+_inflight = None
+_inflight_lock = threading.Lock()
+
+
+def load_reranker(model_name=RERANKER_MODEL_NAME):
+    """Load the cross-encoder once and reuse it (takes seconds, so warm_up can call it at startup)"""
+    global _reranker
+    with _load_lock:
+        if _reranker is None:
+            _reranker = CrossEncoder(model_name)
+    return _reranker
+
+
+def passage_text(row, source="general"):
+    """Text the cross-encoder sees for a metadata row"""
+    if source == "travel":
+        return row["text"]
+    return f"{row.get('en', '')} ({row.get('es', '')})"
+
+
+def _score(model, query, passages):
+    return model.predict([(query, p) for p in passages], batch_size=len(passages))
+
+
+def rerank(query, results, source="general", top_n=2, budget_ms=None):
+    """
+    Re-order (row, distance) results by cross-encoder score and keep the top_n
+    If scoring takes longer than budget_ms, or a previous request is still being scored,
+    the first top_n results in FAISS order are returned instead
+    Loading the model is not part of the budget: only scoring is timed
+    """
+    global _inflight
+
+    if len(results) <= 1:
+        return results[:top_n]
+
+    model = load_reranker()
+    start = time.time()
+    passages = [passage_text(row, source) for row, _ in results]
+
+    with _inflight_lock:
+        # Never queue behind a slow request, that would only push this one over budget too
+        if _inflight is not None and not _inflight.done():
+            print("Re-ranker busy, using FAISS order")
+            return results[:top_n]
+        future = _inflight = _executor.submit(_score, model, query, passages)
+
+    try:
+        scores = future.result(timeout=budget_ms / 1000 if budget_ms else None)
+    except TimeoutError:
+        print(f"Re-ranking exceeded {budget_ms} ms budget, using FAISS order")
+        return results[:top_n]
+
+    order = sorted(range(len(results)), key=lambda i: float(scores[i]), reverse=True)
+    print(f"Re-ranked {len(results)} passages in {(time.time() - start) * 1000:.0f} ms")
+    return [results[i] for i in order[:top_n]]
@@ -0,0 +1,112 @@
+# Semantic response cache
+# Keeps a small FAISS index of past query embeddings per cache key (mode, prompt, generation settings)
+# and returns the stored answer when a new query is similar enough, e.g. "things to do in Oaxaca"
+# vs "what can I do in Oaxaca?". Entries expire after a TTL and the oldest are evicted past max_entries
+
+import threading
+import time
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+
+class SemanticResponseCache:
+    """Thread-safe semantic cache of responses keyed by a settings key"""
+
+    def __init__(self, embed_fn, threshold=0.92, ttl_seconds=24 * 3600, max_entries=2000):
+        """
+        embed_fn: maps a query string to a 1 x d (or d) embedding
+        threshold: minimum cosine similarity between queries for a hit
+        ttl_seconds: entries older than this are never returned (None = no expiry)
+        max_entries: total entries across all keys before the oldest are evicted
+        """
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._indexes = {}  # cache key -> IndexIDMap over normalised query embeddings
+        self._entries = OrderedDict()  # entry id -> (cache key, created_at, query, value), oldest first
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, query):
+        """Normalised 1 x d embedding of a query; compute it once and pass it to lookup and store"""
+        vector = np.ascontiguousarray(np.asarray(self.embed_fn(query), dtype="float32").reshape(1, -1))
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _expired(self, created_at, now):
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _remove(self, entry_id):
+        key = self._entries.pop(entry_id)[0]
+        self._indexes[key].remove_ids(np.array([entry_id], dtype="int64"))
+        if self._indexes[key].ntotal == 0:
+            del self._indexes[key]
+
+    def lookup(self, query, key, vector=None):
+        """Return (value, similarity) of the closest cached query for this key, or (None, similarity)"""
+        vector = self.embed(query) if vector is None else vector
+
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                self.misses += 1
+                return None, 0.0
+
+            D, I = index.search(vector, 1)
+            entry_id, similarity = int(I[0][0]), float(D[0][0])
+            if entry_id < 0 or similarity < self.threshold:
+                self.misses += 1
+                return None, similarity
+
+            _, created_at, _, value = self._entries[entry_id]
+            if self._expired(created_at, time.time()):
+                self._remove(entry_id)
+                self.misses += 1
+                return None, similarity
+
+            self.hits += 1
+            return value, similarity
+
+    def store(self, query, key, value, vector=None):
+        """Cache a value for the query under key, evicting expired and then oldest entries"""
+        vector = self.embed(query) if vector is None else vector
+        now = time.time()
+
+        with self._lock:
+            if key not in self._indexes:
+                self._indexes[key] = faiss.IndexIDMap(faiss.IndexFlatIP(vector.shape[1]))
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._indexes[key].add_with_ids(vector, np.array([entry_id], dtype="int64"))
+            self._entries[entry_id] = (key, now, query, value)
+
+            # Entries are in insertion order, so expired ones are at the front
+            while self._entries:
+                oldest_id, (_, created_at, _, _) = next(iter(self._entries.items()))
+                if self._expired(created_at, now) or len(self._entries) > self.max_entries:
+                    self._remove(oldest_id)
+                else:
+                    break
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "keys": len(self._indexes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
@@ -0,0 +1,224 @@
+# Columnar store for experiment results
+# The JSONL logs repeat the full prompt twice per row (in "prompt" and in "model_output", which is
+# prompt + answer). The store keeps each prompt once in a side table keyed by its hash, keeps only
+# the generated continuation of model_output, and stores everything else as typed Parquet columns,
+# so analyses can load just the columns they need for many runs at once
+#
+# Layout of <run_dir>/result_store:
+#   results.parquet             one row per generation (compacted)
+#   prompts.parquet             prompt_hash -> prompt
+#   results.<part>.parquet      rows written by one batch, merged into results.parquet by compact_store
+#   prompts.<part>.parquet      prompts first seen by that batch
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+STORE_DIR = "result_store"
+
+RESULT_SCHEMA = pa.schema([
+    ("run", pa.string()),
+    ("unit_key", pa.string()),
+    ("mode", pa.dictionary(pa.int32(), pa.string())),
+    ("language", pa.dictionary(pa.int32(), pa.string())),
+    ("setting", pa.dictionary(pa.int32(), pa.string())),
+    ("prompt_id", pa.dictionary(pa.int32(), pa.string())),
+    ("query", pa.string()),
+    ("do_sample", pa.bool_()),
+    ("temperature", pa.float64()),
+    ("top_p", pa.float64()),
+    ("context_used", pa.list_(pa.string())),
+    ("prompt_hash", pa.string()),
+    ("completion", pa.string()),  # model_output without the prompt it starts with
+    ("completion_has_prompt", pa.bool_()),  # False if model_output did not start with the prompt (kept whole)
+    ("final_answer", pa.string()),
+    # Trace values (see tracing.py), null when not recorded
+    ("retrieve_ms", pa.float64()),
+    ("format_ms", pa.float64()),
+    ("generate_ms", pa.float64()),
+    ("ttft_ms", pa.float64()),
+    ("total_ms", pa.float64()),
+    ("prompt_tokens", pa.int64()),
+    ("generated_tokens", pa.int64()),
+    ("tokens_per_sec", pa.float64()),  # single-prompt generations only
+    ("batch_size", pa.int64()),  # prompts generated together (experiments)
+    ("batch_tokens_per_sec", pa.float64()),  # generated tokens of the whole batch / its generate_ms
+    ("generation_cached", pa.bool_()),
+    ("extra", pa.string())  # JSON of any other logged fields, so no value is lost
+])
+
+PROMPT_SCHEMA = pa.schema([("prompt_hash", pa.string()), ("prompt", pa.string())])
+
+_LOGGED_FIELDS = {"mode", "language", "query", "setting", "prompt_id", "unit_key", "context_used", "prompt", "model_output", "final_answer", "timings"}
+_TYPED_FIELDS = {field.name for field in RESULT_SCHEMA}
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:32]
+
+
+def entry_to_row(entry, run=None):
+    """Split one logged entry (as written to the JSONL logs) into a result row and its prompt"""
+    prompt = entry.get("prompt", "")
+    output = entry.get("model_output", "")
+    has_prompt = output.startswith(prompt)
+    timings = entry.get("timings") or {}
+
+    row = {
+        "run": run,
+        "unit_key": entry.get("unit_key"),
+        "context_used": entry.get("context_used", []),
+        "prompt_hash": prompt_hash(prompt),
+        "completion": output[len(prompt):] if has_prompt else output,
+        "completion_has_prompt": has_prompt,
+        "final_answer": entry.get("final_answer")
+    }
+    extra = {}
+    for key, value in list(entry.items()) + list(timings.items()):
+        if key in _TYPED_FIELDS and key not in row:
+            row[key] = value
+        elif key not in _LOGGED_FIELDS and key not in _TYPED_FIELDS:
+            extra[key] = value
+    row["extra"] = json.dumps(extra, ensure_ascii=False) if extra else None
+    return row, prompt
+
+
+def entries_to_tables(entries, run=None):
+    """Result and (deduplicated) prompt tables for a list of logged entries"""
+    rows, prompts = [], {}
+    for entry in entries:
+        row, prompt = entry_to_row(entry, run)
+        rows.append(row)
+        prompts[row["prompt_hash"]] = prompt
+    results = pa.Table.from_pylist(rows, schema=RESULT_SCHEMA)
+    prompt_table = pa.Table.from_pydict({"prompt_hash": list(prompts), "prompt": list(prompts.values())}, schema=PROMPT_SCHEMA)
+    return results, prompt_table
+
+
+def _write_atomic(table, path):
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)  # readers never see a half-written file
+
+
+def write_result_part(run_dir, entries, part):
+    """Write one batch of logged entries as a part file (part: unique name, e.g. worker and batch number)"""
+    store_dir = os.path.join(run_dir, STORE_DIR)
+    os.makedirs(store_dir, exist_ok=True)
+    results, prompts = entries_to_tables(entries, run=os.path.basename(os.path.normpath(run_dir)))
+    # Prompts first: a results part is only visible once the prompts it refers to are
+    _write_atomic(prompts, os.path.join(store_dir, f"prompts.{part}.parquet"))
+    _write_atomic(results, os.path.join(store_dir, f"results.{part}.parquet"))
+
+
+def _store_files(store_dir, table):
+    return sorted(glob.glob(os.path.join(store_dir, f"{table}.parquet")) + glob.glob(os.path.join(store_dir, f"{table}.*.parquet")))
+
+
+def _read_tables(paths, columns=None, schema=None):
+    tables = [pq.read_table(path, columns=columns) for path in paths]
+    if not tables:
+        return (schema if columns is None else pa.schema([schema.field(c) for c in columns])).empty_table()
+    return pa.concat_tables(tables, promote_options="permissive")
+
+
+def compact_store(run_dir):
+    """Merge part files into results.parquet and prompts.parquet, dropping repeated prompts and units"""
+    store_dir = os.path.join(run_dir, STORE_DIR)
+    result_paths, prompt_paths = _store_files(store_dir, "results"), _store_files(store_dir, "prompts")
+    compacted = ("results.parquet", "prompts.parquet")
+    if all(os.path.basename(path) in compacted for path in result_paths + prompt_paths):
+        return
+
+    results = _read_tables(result_paths, schema=RESULT_SCHEMA).to_pandas()
+    keyed = results["unit_key"].notna()
+    results = pd.concat([results[keyed].drop_duplicates("unit_key", keep="last"), results[~keyed]])
+    prompts = _read_tables(prompt_paths, schema=PROMPT_SCHEMA).to_pandas().drop_duplicates("prompt_hash")
+
+    # Compacted files replace results.parquet/prompts.parquet first, parts are removed after;
+    # if interrupted in between, loading still works because repeated units are dropped again
+    _write_atomic(pa.Table.from_pandas(prompts, schema=PROMPT_SCHEMA, preserve_index=False), os.path.join(store_dir, "prompts.parquet"))
+    _write_atomic(pa.Table.from_pandas(results, schema=RESULT_SCHEMA, preserve_index=False), os.path.join(store_dir, "results.parquet"))
+    for path in result_paths + prompt_paths:
+        if os.path.basename(path) not in compacted:
+            os.remove(path)
+
+
+def has_store(run_dir):
+    return bool(_store_files(os.path.join(run_dir, STORE_DIR), "results"))
+
+
+def read_jsonl_entries(run_dir):
+    """Logged entries of every JSONL file in a run folder (skipping lines cut off by an interrupted run)"""
+    entries = []
+    for path in sorted(glob.glob(os.path.join(run_dir, "*.jsonl"))):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return entries
+
+
+def load_results(run_dirs, columns=None, with_prompts=False):
+    """
+    Load the results of one or more run folders into one DataFrame
+    columns: result columns to read (None = all); "run" is always included
+    with_prompts: also add the "prompt" and "model_output" columns from the prompt side table
+    Runs without a store are read from their JSONL logs (slower)
+    """
+    if isinstance(run_dirs, str):
+        run_dirs = [run_dirs]
+    if columns is not None:
+        columns = list(dict.fromkeys(["run"] + list(columns) + (["prompt_hash", "completion", "completion_has_prompt"] if with_prompts else [])))
+
+    results, prompts = [], []
+    for run_dir in run_dirs:
+        store_dir = os.path.join(run_dir, STORE_DIR)
+        if has_store(run_dir):
+            table = _read_tables(_store_files(store_dir, "results"), columns, RESULT_SCHEMA)
+            if with_prompts:
+                prompts.append(_read_tables(_store_files(store_dir, "prompts"), schema=PROMPT_SCHEMA))
+        else:
+            table, prompt_table = entries_to_tables(read_jsonl_entries(run_dir), run=os.path.basename(os.path.normpath(run_dir)))
+            table = table.select(columns) if columns is not None else table
+            prompts.append(prompt_table)
+        results.append(table)
+
+    df = pa.concat_tables(results, promote_options="permissive").to_pandas()
+    if "unit_key" in df.columns:
+        keyed = df["unit_key"].notna()
+        df = pd.concat([df[keyed].drop_duplicates(["run", "unit_key"], keep="last"), df[~keyed]]).sort_index()
+
+    if with_prompts:
+        prompt_df = pa.concat_tables(prompts).to_pandas().drop_duplicates("prompt_hash").set_index("prompt_hash")["prompt"]
+        df["prompt"] = df["prompt_hash"].map(prompt_df)
+        df["model_output"] = df["prompt"].where(df["completion_has_prompt"], "") + df["completion"]
+    return df.reset_index(drop=True)
+
+
+def convert_run(run_dir):
+    """Write a store for a run folder from its JSONL logs"""
+    entries = read_jsonl_entries(run_dir)
+    write_result_part(run_dir, entries, "converted")
+    compact_store(run_dir)
+    return len(entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert run folders' JSONL logs to the columnar result store")
+    parser.add_argument("run_dirs", nargs="+")
+    args = parser.parse_args()
+
+    for run_dir in args.run_dirs:
+        count = convert_run(run_dir)
+        jsonl_bytes = sum(os.path.getsize(path) for path in glob.glob(os.path.join(run_dir, "*.jsonl")))
+        store_bytes = sum(os.path.getsize(path) for path in glob.glob(os.path.join(run_dir, STORE_DIR, "*.parquet")))
+        print(f"{run_dir}: {count} rows, JSONL {jsonl_bytes / 1e6:.2f} MB -> store {store_bytes / 1e6:.2f} MB")
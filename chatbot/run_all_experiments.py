@@ -1,36 +1,194 @@
 # Jade Oakes
 # May 2, 2025
 # Runs all experiments
+# Expands the (mode x prompt_id x setting x lang x query) matrix into work units, skips units
+# already present in the run folder (so an interrupted run resumes where it stopped), and runs the
+# rest in batches on a pool of worker processes. Each worker appends to its own shard file per
+# mode/prompt_id, so workers never write to the same file and a crash loses at most one batch
+# With --store, batches are written to the columnar result store (result_store.py) instead of JSONL
 
+import argparse
+import glob
+import json
+import multiprocessing as mp
 import os
-from run_prompt_experiments import run_prompt_experiments
-from prompt_loader import load_prompt_templates
-
-# Create output folder
-os.makedirs("results/run_1", exist_ok=True)  # CHANGE FOLDER NAME FOR NEW RUN
-
-# Load prompt templates
-prompt_templates = load_prompt_templates("chatbot/prompt_templates.json")  # add _version# if needed
-
-# How many lines = “safe” to skip (e.g. each experiment generates 10+ entries)
-MIN_VALID_LINES = 10
-
-# Run for all mode/prompt_id combinations
-for mode, prompts in prompt_templates.items():
-    for prompt_id in prompts:
-        # Format filename
-        safe_prompt_id = prompt_id.replace("/", "_")
-        output_path = f"results/run_1/{mode}_{safe_prompt_id}.jsonl"  # CHANGE FOLDER NAME FOR NEW RUN
-
-        # Skip if file exists and has at least MIN_VALID_LINES lines
-        if os.path.exists(output_path):
-            with open(output_path, "r", encoding="utf-8") as f:
-                num_lines = sum(1 for _ in f)
-            if num_lines >= MIN_VALID_LINES:
-                print(f"Skipping {mode} | {prompt_id} — {num_lines} lines already written")
+import uuid
+from collections import OrderedDict
+from prompt_loader import load_prompt_templates, get_prompt_by_id
+from experiment_config import GENERATION_SETTINGS, load_experiment_queries
+from result_store import compact_store, has_store, load_results, write_result_part
+
+RUN_DIR = "results/run_1"  # CHANGE FOLDER NAME FOR NEW RUN
+BATCH_SIZE = 16  # units handed to a worker at once; the batch scheduler splits them to fit memory
+
+_worker = {}  # per-process state set by init_worker
+
+
+def unit_key(mode, prompt_id, setting, lang, query):
+    """Identifies one generation; also rebuilt from logged entries to find completed units"""
+    return json.dumps([mode, prompt_id, setting, lang, query], ensure_ascii=False)
+
+
+def build_matrix(prompt_templates, queries, modes=None, prompt_ids=None, settings=None, langs=None):
+    """All work units (dicts) of the run matrix, optionally filtered"""
+    units = []
+    for mode, prompts in prompt_templates.items():
+        if modes and mode not in modes:
+            continue
+        for prompt_id in prompts:
+            if prompt_ids and prompt_id not in prompt_ids:
                 continue
-            else:
-                print(f"Found incomplete file for {mode} | {prompt_id} — only {num_lines} lines. Re-running...")
+            for lang, lang_queries in queries.get(mode, {}).items():
+                if langs and lang not in langs:
+                    continue
+                for setting in GENERATION_SETTINGS:
+                    if settings and setting not in settings:
+                        continue
+                    for query in lang_queries:
+                        units.append({
+                            "key": unit_key(mode, prompt_id, setting, lang, query),
+                            "mode": mode,
+                            "prompt_id": prompt_id,
+                            "setting": setting,
+                            "lang": lang,
+                            "query": query
+                        })
+    return units
+
+
+def completed_keys(run_dir):
+    """Keys of every unit logged in the run folder (shards, older single-file outputs and the result store)"""
+    keys = set()
+    if has_store(run_dir):
+        stored = load_results(run_dir, columns=["unit_key", "mode", "prompt_id", "setting", "language", "query"])
+        for row in stored.itertuples(index=False):
+            keys.add(row.unit_key if isinstance(row.unit_key, str) else unit_key(row.mode, row.prompt_id, row.setting, row.language, row.query))
+    for path in glob.glob(os.path.join(run_dir, "*.jsonl")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # line cut off by an interrupted run
+                keys.add(entry.get("unit_key") or unit_key(
+                    entry.get("mode"), entry.get("prompt_id"), entry.get("setting"), entry.get("language"), entry.get("query")
+                ))
+    return keys
+
+
+def make_batches(units, batch_size):
+    """Group units that share mode, prompt and setting (they can be generated together) into batches"""
+    groups = OrderedDict()
+    for unit in units:
+        groups.setdefault((unit["mode"], unit["prompt_id"], unit["setting"]), []).append(unit)
+    return [group[i:i + batch_size] for group in groups.values() for i in range(0, len(group), batch_size)]
+
+
+def init_worker(worker_ids, run_dir, devices, use_generation_cache, use_store):
+    """Give the process a shard number (and GPU), then load the models once"""
+    worker_id = worker_ids.get()
+    if devices:
+        os.environ["CUDA_VISIBLE_DEVICES"] = devices[worker_id % len(devices)]
+
+    import run_prompt_experiments  # loads the LLM, so only in workers
+    from generation_cache import GENERATION_CACHE_FILE, open_generation_cache
+    _worker.update(
+        id=worker_id,
+        run_dir=run_dir,
+        use_store=use_store,
+        experiments=run_prompt_experiments,
+        prompt_templates=load_prompt_templates(),
+        cache=open_generation_cache(GENERATION_CACHE_FILE) if use_generation_cache else None,
+        prepared={}  # (mode, prompt_id, lang, query) -> prepared entry, shared by the generation settings
+    )
+
+
+def run_batch(batch):
+    """Generate one batch and append it to this worker's shard; returns the number of units done"""
+    experiments = _worker["experiments"]
+    first = batch[0]
+    mode, prompt_id, setting = first["mode"], first["prompt_id"], first["setting"]
+    instruction = get_prompt_by_id(_worker["prompt_templates"], mode, prompt_id)
+
+    entries = []
+    for unit in batch:
+        prepared_key = (mode, prompt_id, unit["lang"], unit["query"])
+        if prepared_key not in _worker["prepared"]:
+            _worker["prepared"][prepared_key] = experiments.prepare_entry(mode, unit["lang"], unit["query"], instruction)
+        entry = experiments.for_setting(_worker["prepared"][prepared_key])
+        entry["unit_key"] = unit["key"]
+        entries.append(entry)
+
+    if _worker["use_store"]:
+        entries = experiments.run_and_log_batch(entries, setting, GENERATION_SETTINGS[setting], None, prompt_id, _worker["cache"])
+        write_result_part(_worker["run_dir"], entries, f"w{_worker['id']:02d}-{uuid.uuid4().hex[:12]}")
+        return len(batch)
+
+    safe_prompt_id = prompt_id.replace("/", "_")
+    shard_path = os.path.join(_worker["run_dir"], f"{mode}_{safe_prompt_id}.shard{_worker['id']:02d}.jsonl")
+    with open(shard_path, "a", encoding="utf-8") as out_file:
+        experiments.run_and_log_batch(entries, setting, GENERATION_SETTINGS[setting], out_file, prompt_id, _worker["cache"])
+    return len(batch)
+
+
+def run_all_experiments(run_dir=RUN_DIR, workers=1, batch_size=BATCH_SIZE, devices=None, dry_run=False, use_generation_cache=True, use_store=False, **filters):
+    os.makedirs(run_dir, exist_ok=True)
+
+    # Load prompt templates
+    prompt_templates = load_prompt_templates("chatbot/prompt_templates.json")  # add _version# if needed
+    units = build_matrix(prompt_templates, load_experiment_queries(), **filters)
+
+    done = completed_keys(run_dir)
+    pending = [unit for unit in units if unit["key"] not in done]
+    batches = make_batches(pending, batch_size)
+    print(f"{len(units)} units in the matrix, {len(units) - len(pending)} already done, {len(pending)} to run in {len(batches)} batches")
+
+    if dry_run or not batches:
+        return
+
+    # Spawned workers each load their own copy of the model: use several with INFERENCE_SERVER_URL or one GPU each (--devices)
+    context = mp.get_context("spawn")
+    worker_ids = context.Queue()
+    for i in range(workers):
+        worker_ids.put(i)
+
+    finished = 0
+    with context.Pool(workers, initializer=init_worker, initargs=(worker_ids, run_dir, devices, use_generation_cache, use_store)) as pool:
+        for count in pool.imap_unordered(run_batch, batches):
+            finished += count
+            print(f"Completed {finished}/{len(pending)} units")
+
+    if use_store:
+        compact_store(run_dir)  # merge the per-batch part files
+
+    print(f"\nDone. Results saved to {run_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the experiment matrix, resuming from completed units")
+    parser.add_argument("--run_dir", default=RUN_DIR, help="Output folder (completed units in it are skipped)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes, each loads the generator")
+    parser.add_argument("--batch_size", type=int, default=BATCH_SIZE, help="Units handed to a worker at once (split into generation batches by the scheduler)")
+    parser.add_argument("--devices", default=None, help="Comma-separated GPU ids assigned to workers round-robin")
+    parser.add_argument("--modes", nargs="+", default=None)
+    parser.add_argument("--prompt_ids", nargs="+", default=None)
+    parser.add_argument("--settings", nargs="+", default=None, choices=list(GENERATION_SETTINGS))
+    parser.add_argument("--langs", nargs="+", default=None)
+    parser.add_argument("--dry_run", action="store_true", help="Only report how many units would run")
+    parser.add_argument("--no_generation_cache", action="store_true", help="Always regenerate deterministic outputs")
+    parser.add_argument("--store", action="store_true", help="Write results to the columnar result store instead of JSONL shards")
+    args = parser.parse_args()
 
-        print(f"\nRunning {mode} | {prompt_id}")
-        run_prompt_experiments(mode, prompt_id, output_path)
\ No newline at end of file
+    run_all_experiments(
+        run_dir=args.run_dir,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        devices=args.devices.split(",") if args.devices else None,
+        dry_run=args.dry_run,
+        use_generation_cache=not args.no_generation_cache,
+        use_store=args.store,
+        modes=args.modes,
+        prompt_ids=args.prompt_ids,
+        settings=args.settings,
+        langs=args.langs
+    )
@@ -6,41 +6,92 @@ import json
 import os
 import sys
 import argparse
+import time
 import torch
-from multilingual_rag_chatbot_llm import retrieve_context, format_prompt, pipe
+from transformers import StoppingCriteriaList
+from multilingual_rag_chatbot_llm import retrieve_context, format_prompt, pipe, llm, count_tokens, record_generation_stats, llm_name, use_stub_generator
+from batch_scheduler import AdaptiveBatchScheduler
+from generation_queue import TokenTimingCriteria
+from tracing import Trace, activate, span
+from generation_cache import GENERATION_CACHE_FILE, cache_lookup, cache_store, generation_key, is_deterministic, open_generation_cache
 from prompt_loader import load_prompt_templates, get_prompt_by_id
-
-# Define generation settings
-GENERATION_SETTINGS = {
-    "deterministic": {"do_sample": False},
-    "balanced": {"do_sample": True, "top_p": 0.85, "temperature": 0.6}
-}
-
-
-def load_experiment_queries(path="chatbot/experiment_queries.json"):
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
+from experiment_config import GENERATION_SETTINGS, load_experiment_queries
 
 # Define queries
 EXPERIMENT_QUERIES = load_experiment_queries()
 
-# Define batch size
-BATCH_SIZE = 2
-
-
-def run_and_log_batch(batch, setting_name, setting_args, out_file, prompt_id):
-    prompts = [entry["prompt"] for entry in batch]
-    generations = pipe(prompts, max_new_tokens=512, batch_size=BATCH_SIZE, **setting_args)
-
-    # Flatten output if needed
-    if isinstance(generations[0], list):
-        generations = [g for batch in generations for g in batch]
-
-
-    for entry, result in zip(batch, generations):
-        text = result['generated_text']
-        final_answer = text.split("Answer:")[-1].strip() if "Answer:" in text else text.strip()
+# Batch sizes come from prompt lengths and free memory (see batch_scheduler), shared by every run in the process
+scheduler = AdaptiveBatchScheduler.for_model(llm)
+
+# Model identity in generation cache keys
+MODEL_ID = "stub" if use_stub_generator else llm_name
+
+
+def final_answer_of(text):
+    """Answer part of a generated text (after the last "Answer:")"""
+    return text.split("Answer:")[-1].strip() if "Answer:" in text else text.strip()
+
+
+def run_and_log_batch(batch, setting_name, setting_args, out_file, prompt_id, cache=None):
+    """
+    Generate the batch's prompts and log one entry per prompt; returns the logged entries
+    out_file: JSONL file to append the entries to (None = only return them, e.g. for the result store)
+    cache: an open connection from open_generation_cache; deterministic outputs are read from and saved to it
+    """
+    generation_args = {"max_new_tokens": 512, **setting_args}
+    outputs = {}  # batch position -> generated text
+
+    keys = None
+    if cache is not None and is_deterministic(generation_args):
+        keys = [generation_key(entry["prompt"], MODEL_ID, generation_args) for entry in batch]
+        cached = cache_lookup(cache, keys)
+        outputs = {i: cached[key] for i, key in enumerate(keys) if key in cached}
+
+    to_generate = [i for i in range(len(batch)) if i not in outputs]
+    timings = {}  # batch position -> (generate_ms, ttft_ms, batch_size, batch_tokens_per_sec) of the sub-batch it was generated in
+    if to_generate:
+        scheduler.max_new_tokens = generation_args["max_new_tokens"]
+        lengths = [count_tokens(batch[i]["prompt"]) for i in to_generate]
+
+        def generate_sub_batch(sub_batch):
+            positions = [to_generate[j] for j in sub_batch]
+            # One timing criterion per sub-batch: generation time and time to first token are shared by the prompts generated together
+            timer = TokenTimingCriteria()
+            start = time.perf_counter()
+            prompts = [batch[i]["prompt"] for i in positions]
+            generations = pipe(prompts, batch_size=len(prompts), stopping_criteria=StoppingCriteriaList([timer]), **generation_args)
+            generate_ms = (time.perf_counter() - start) * 1000
+
+            # Flatten output if needed
+            if isinstance(generations[0], list):
+                generations = [g for group in generations for g in group]
+
+            texts = [result['generated_text'] for result in generations]
+            # Throughput of the sub-batch as a whole: per prompt it would fall as batches grow
+            batch_tokens = sum(count_tokens(final_answer_of(text)) for text in texts)
+            batch_tokens_per_sec = round(batch_tokens / generate_ms * 1000, 2) if generate_ms else None
+            timings.update({i: (generate_ms, timer.ttft_ms(), len(positions), batch_tokens_per_sec) for i in positions})
+            return texts
+
+        generated = scheduler.run(lengths, generate_sub_batch)
+        outputs.update({to_generate[j]: text for j, text in generated.items()})
+        if keys is not None:
+            cache_store(cache, MODEL_ID, {keys[i]: outputs[i] for i in to_generate})
+
+    log_entries = []
+    for i, entry in enumerate(batch):
+        text = outputs[i]
+        final_answer = final_answer_of(text)
+
+        trace = entry["trace"]
+        if i in timings:
+            generate_ms, ttft_ms, batch_size, batch_tokens_per_sec = timings[i]
+            trace.add_time("generate", generate_ms)
+            record_generation_stats(trace, entry["prompt"], final_answer, ttft_ms=ttft_ms, batch_size=batch_size)
+            trace.set("batch_size", batch_size)
+            trace.set("batch_tokens_per_sec", batch_tokens_per_sec)
+        else:
+            trace.set("generation_cached", True)
 
         log_entry = {
             "mode": entry["mode"],
@@ -52,49 +103,71 @@ def run_and_log_batch(batch, setting_name, setting_args, out_file, prompt_id):
             "context_used": entry["context_texts"],
             "prompt": entry["prompt"],
             "model_output": text,
-            "final_answer": final_answer
+            "final_answer": final_answer,
+            "timings": trace.as_dict()
         }
-        out_file.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+        if "unit_key" in entry:
+            log_entry["unit_key"] = entry["unit_key"]
+        log_entries.append(log_entry)
+        if out_file is not None:
+            out_file.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
 
     # Free GPU memory after batch finishes
-    torch.cuda.empty_cache()
+    if to_generate and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    return log_entries
+
+
+def prepare_entry(mode, lang, query, prompt_instruction):
+    """Retrieve context and build the prompt for one query, timing both"""
+    trace = Trace()
+    with activate(trace):
+        with span("retrieve"):
+            context = retrieve_context(query, k=5, source=mode)
+        context_texts = [c['text'] if mode == 'travel' else f"{c.get('en', '')} -> {c.get('es', '')}" for c in context]
+        with span("format"):
+            prompt = format_prompt(query, context, source_mode=mode, instruction=prompt_instruction)
+
+    return {
+        "mode": mode,
+        "lang": lang,
+        "query": query,
+        "context_texts": context_texts,
+        "prompt": prompt,
+        "trace": trace
+    }
 
 
-def run_prompt_experiments(mode, prompt_id, output_path):
+def for_setting(entry):
+    """Copy of a prepared entry for one generation setting, so each setting logs its own timings"""
+    return {**entry, "trace": entry["trace"].copy()}
+
+
+def run_prompt_experiments(mode, prompt_id, output_path, use_generation_cache=True):
     prompt_templates = load_prompt_templates()
     prompt_instruction = get_prompt_by_id(prompt_templates, mode, prompt_id)
     if prompt_instruction is None:
         raise ValueError(f"Prompt ID '{prompt_id}' not found for mode '{mode}'")
 
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    cache = open_generation_cache(GENERATION_CACHE_FILE) if use_generation_cache else None
 
     with open(output_path, 'w', encoding='utf-8') as out_file:
         # Only run the experiment queries for the selected mode
         lang_dict = EXPERIMENT_QUERIES[mode]
 
         for lang, queries in lang_dict.items():
+            # The prompt doesn't depend on the generation setting: retrieve and format each query once
+            prepared = [prepare_entry(mode, lang, query, prompt_instruction) for query in dict.fromkeys(queries)]
+
             for setting_name, setting_args in GENERATION_SETTINGS.items():
                 batch = []
-                for query in queries:
-                    context = retrieve_context(query, k=5, source=mode)
-                    context_texts = [c['text'] if mode == 'travel' else f"{c.get('en', '')} -> {c.get('es', '')}" for c in context]
-                    prompt = format_prompt(query, context, source_mode=mode, instruction=prompt_instruction)
-
-                    print(f"Queued: [{mode}] [{lang}] [{setting_name}] — {query}")
-
-                    batch.append({
-                        "mode": mode,
-                        "lang": lang,
-                        "query": query,
-                        "context_texts": context_texts,
-                        "prompt": prompt
-                    })
-
-                    if len(batch) == 4:
-                        run_and_log_batch(batch, setting_name, setting_args, out_file, prompt_id)
-                        batch = []
-                if batch:
-                    run_and_log_batch(batch, setting_name, setting_args, out_file, prompt_id)
+                for entry in prepared:
+                    print(f"Queued: [{mode}] [{lang}] [{setting_name}] — {entry['query']}")
+                    batch.append(for_setting(entry))
+
+                # The scheduler splits the setting's prompts into length-sorted batches that fit in memory
+                run_and_log_batch(batch, setting_name, setting_args, out_file, prompt_id, cache)
 
     print(f"\nDone. Results saved to {output_path}")
 
@@ -106,11 +179,13 @@ if __name__ == "__main__":
         parser.add_argument("--mode", required=True, help="Mode: general, travel, no_retrieval")
         parser.add_argument("--prompt_id", required=True, help="Prompt ID from prompt_templates.json")  # add _version# if needed
         parser.add_argument("--output", default="results/run_1/prompt_experiment_results.jsonl", help="Output file path")  # CHANGE FOLDER NAME FOR NEW RUN
+        parser.add_argument("--no_generation_cache", action="store_true", help="Always regenerate deterministic outputs")
         args = parser.parse_args()
 
         mode = args.mode
         prompt_id = args.prompt_id
         output_path = args.output
+        use_generation_cache = not args.no_generation_cache
 
     else:
         # Manual defaults for running interactively
@@ -118,5 +193,6 @@ if __name__ == "__main__":
         mode = "general"
         prompt_id = "v1_general_default_en"
         output_path = f"results/run_1/manual_{mode}_{prompt_id}.jsonl"  # CHANGE FOLDER NAME FOR NEW RUN
+        use_generation_cache = True
 
-    run_prompt_experiments(mode, prompt_id, output_path)
+    run_prompt_experiments(mode, prompt_id, output_path, use_generation_cache)
@@ -0,0 +1,78 @@
+# Lightweight request tracing
+# A Trace is a per-request dict of timings (ms) and counts. Code wraps stages in span("name"),
+# which records into the trace active in the current thread; with no active trace span()
+# returns a shared no-op context manager, so instrumented code costs almost nothing untraced
+
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+_active = threading.local()
+_NO_SPAN = nullcontext()
+
+
+class Trace:
+    """Timings (ms, accumulated per span name) and values for one request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.values = {}
+
+    def add_time(self, name, ms):
+        key = f"{name}_ms"
+        self.values[key] = self.values.get(key, 0.0) + ms
+
+    def set(self, name, value):
+        self.values[name] = value
+
+    def copy(self):
+        """Independent trace with the same start time and values so far (e.g. one per generation setting)"""
+        trace = Trace()
+        trace.start = self.start
+        trace.values = dict(self.values)
+        return trace
+
+    def as_dict(self):
+        """Timings rounded to 0.1 ms plus total_ms since the trace started"""
+        values = {key: round(value, 1) if isinstance(value, float) else value for key, value in self.values.items()}
+        values["total_ms"] = round((time.perf_counter() - self.start) * 1000, 1)
+        return values
+
+
+class _Span:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add_time(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+def current_trace():
+    """Trace active in this thread, or None"""
+    return getattr(_active, "trace", None)
+
+
+@contextmanager
+def activate(trace):
+    """Make trace the active trace in this thread for the duration of the block (None = tracing off)"""
+    previous = current_trace()
+    _active.trace = trace
+    try:
+        yield trace
+    finally:
+        _active.trace = previous
+
+
+def span(name):
+    """Time the block as stage name in the active trace"""
+    trace = current_trace()
+    return _NO_SPAN if trace is None else _Span(trace, name)
+
@@ -1,24 +1,9 @@
 # Jade Oakes
 # April 21, 2025
 # Use this to display samples of the FAISS files
+# Shows the travel index via inspect_index.py; pass --names sentence_pairs (or --index/--metadata) for others
 
-import faiss
-import numpy as np
+from inspect_index import main
 
-# Path to the FAISS index (UNCOMMENT which one to test)
-# FAISS_INDEX_FILE = "data/sentence_pairs_index.faiss"  # add _version# if needed
-FAISS_INDEX_FILE = "data/chunked_travel_info_index.faiss"  # add _version# if needed
-
-# Load the index
-index = faiss.read_index(FAISS_INDEX_FILE)
-
-# Basic info
-print(f"Index loaded: {type(index)}")
-print(f"Number of vectors: {index.ntotal}")
-print(f"Vector dimension: {index.d}")
-
-# Display the first 5 vectors
-print("\nFirst 5 vectors (truncated to 5 dimensions):")
-vectors = index.reconstruct_n(0, min(5, index.ntotal))
-for i, vec in enumerate(vectors):
-    print(f"Vector {i}: {np.round(vec[:5], 4)} ...")
+if __name__ == "__main__":
+    raise SystemExit(0 if main(names=["travel"]) else 1)
@@ -0,0 +1,200 @@
+# Analyze annotated results of one or more runs
+# Every run's results_annotated.csv is read once into one DataFrame, then each summary (overall,
+# by mode, setting, language, mode x setting, and by run when several runs are given) is a single
+# vectorised groupby. The graphs are drawn from these summaries, so a new run needs no hand-copied numbers
+
+import argparse
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+RUN_DIRS = ["results/run_1"]  # CHANGE FOLDER NAME AS NEEDED
+ANNOTATIONS_FILE = "results_annotated.csv"
+GRAPHS_DIR = "results/graphs"
+
+SCORE_COLUMNS = ["correctness", "fluency", "relevance", "helpfulness", "conciseness"]
+RATE_COLUMNS = ["expected_lang", "cut_off"]  # 0/1 annotations, reported as % of samples
+
+GROUPINGS = {
+    "overall": [],
+    "mode": ["mode"],
+    "setting": ["setting"],
+    "language": ["language"],
+    "mode_setting": ["mode", "setting"]
+}
+
+# Color Universal Design palette (color-blind safe), fixed per group so graphs stay comparable across runs
+CUD_PALETTE = ["#E69F00", "#0072B2", "#009E73", "#CC79A7", "#56B4E9", "#D55E00", "#F0E442", "#000000"]
+COLORS = {
+    "general": "#E69F00", "travel": "#009E73", "no_retrieval": "#0072B2",
+    "balanced": "#E69F00", "deterministic": "#0072B2"
+}
+MODE_ORDER = ["general", "travel", "no_retrieval"]
+
+
+def load_annotations(run_dirs, filename=ANNOTATIONS_FILE):
+    """Annotated results of every run in one DataFrame, with a "run" column"""
+    frames = []
+    for run_dir in run_dirs:
+        df = pd.read_csv(os.path.join(run_dir, filename))
+        df.columns = df.columns.str.strip()
+        df.insert(0, "run", os.path.basename(os.path.normpath(run_dir)))
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+
+def summarize(df, keys):
+    """Sample count, mean/std of every score and % rate of every 0/1 column per group (keys=[] for overall)"""
+    scores = [c for c in SCORE_COLUMNS if c in df.columns]
+    rates = [c for c in RATE_COLUMNS if c in df.columns]
+    values = df[scores + rates].apply(pd.to_numeric, errors="coerce")
+    values[rates] = values[rates] * 100
+
+    grouped = values.groupby([df[k] for k in keys], sort=True) if keys else values.groupby(np.zeros(len(df), dtype=int))
+    summary = grouped.agg({**{c: ["mean", "std"] for c in scores}, **{c: "mean" for c in rates}})
+    summary.columns = [f"{c}_{stat}" if stat != "mean" or c in scores else f"{c}_percent" for c, stat in summary.columns]
+    summary.insert(0, "samples", grouped.size())
+    if not keys:
+        summary.index = ["all"]
+    return summary.round(2)
+
+
+def score_counts(df, keys):
+    """How often each score value was given, per group and score column (one melt + one groupby)"""
+    columns = [c for c in SCORE_COLUMNS + RATE_COLUMNS if c in df.columns]
+    long = df[keys + columns].melt(id_vars=keys, var_name="metric", value_name="score")
+    return long.groupby(keys + ["metric", "score"], sort=True).size().unstack("score", fill_value=0)
+
+
+def analyze(df, groupings=GROUPINGS):
+    """{name: summary} for every grouping; adds per-run groupings when df holds several runs"""
+    groupings = dict(groupings)
+    if df["run"].nunique() > 1:
+        groupings.update({f"run_{name}": ["run"] + keys for name, keys in groupings.items()})
+    return {name: summarize(df, keys) for name, keys in groupings.items()}
+
+
+def _ordered(summary):
+    order = [m for m in MODE_ORDER if m in summary.index] + [i for i in summary.index if i not in MODE_ORDER]
+    return summary.loc[order]
+
+
+def _colors(labels):
+    return [COLORS.get(str(label).lower(), CUD_PALETTE[i % len(CUD_PALETTE)]) for i, label in enumerate(labels)]
+
+
+def plot_score_comparison(summary, title, legend_title, path, show=False):
+    """Grouped bars of mean scores, one bar group per metric and one bar per summary row"""
+    scores = [c for c in SCORE_COLUMNS if f"{c}_mean" in summary.columns]
+    labels = list(summary.index)
+    x = np.arange(len(scores))
+    bar_width = 0.75 / len(labels)
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    for i, (label, color) in enumerate(zip(labels, _colors(labels))):
+        ax.bar(x + i * bar_width, summary.loc[label, [f"{c}_mean" for c in scores]], width=bar_width, label=label, color=color)
+
+    ax.set_xlabel("Evaluation Metric")
+    ax.set_ylabel("Mean Score")
+    ax.set_title(title)
+    ax.set_xticks(x + bar_width * (len(labels) - 1) / 2)
+    ax.set_xticklabels([c.capitalize() for c in scores])
+    ax.set_ylim(0, 5.5)
+    ax.legend(title=legend_title)
+    _save(fig, path, show)
+
+
+def plot_rate(summary, column, ylabel, title, path, show=False):
+    """One bar per summary row for a % rate column"""
+    labels = list(summary.index)
+    fig = plt.figure(figsize=(6, 4))
+    plt.bar(labels, summary[f"{column}_percent"], color=_colors(labels))
+    plt.ylabel(ylabel)
+    plt.title(title)
+    plt.ylim(0, 100)
+    _save(fig, path, show)
+
+
+def _save(fig, path, show):
+    fig.tight_layout()
+    fig.savefig(path, dpi=300)
+    if show:
+        plt.show()
+    plt.close(fig)
+
+
+def create_graphs(summaries, graphs_dir=GRAPHS_DIR, show=False):
+    """Render the report graphs from the mode and setting summaries"""
+    os.makedirs(graphs_dir, exist_ok=True)
+    by_mode = _ordered(summaries["mode"])
+    plot_score_comparison(by_mode, "Evaluation Scores by Mode", "Mode", os.path.join(graphs_dir, "mode_comparison_bar_chart.png"), show)
+    if "cut_off_percent" in by_mode.columns:
+        plot_rate(by_mode, "cut_off", "Cut-Off Rate (%)", "Cut-Off Rate by Mode", os.path.join(graphs_dir, "cutoff_rate_by_mode.png"), show)
+    if "expected_lang_percent" in by_mode.columns:
+        plot_rate(by_mode, "expected_lang", "Expected Language Match (%)", "Expected Language Accuracy by Mode", os.path.join(graphs_dir, "expected_lang_match_by_mode.png"), show)
+
+    by_setting = summaries["setting"].rename(index=str.capitalize)
+    plot_score_comparison(by_setting, "Evaluation Scores by Generation Setting", "Generation Setting", os.path.join(graphs_dir, "generation_setting_comparison.png"), show)
+    by_language = summaries["language"]
+    plot_score_comparison(by_language, "Evaluation Scores by Query Language", "Language", os.path.join(graphs_dir, "language_comparison_bar_chart.png"), show)
+
+
+def print_summaries(summaries, names=None):
+    for name in names or summaries:
+        print("=" * 60)
+        print("OVERALL SUMMARY" if name == "overall" else f"SUMMARY BY {name.upper().replace('_', ' x ')}")
+        print("=" * 60)
+        with pd.option_context("display.max_columns", None, "display.width", 200):
+            print(summaries[name])
+        print()
+
+
+def print_counts(df, keys):
+    print("-" * 60)
+    print(f"SCORE COUNTS{' BY ' + ' x '.join(keys).upper() if keys else ''}")
+    print("-" * 60)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(score_counts(df, keys))
+    print()
+
+
+def main(argv=None, **defaults):
+    """Command line entry point; defaults override argument defaults (used by the per-view scripts)"""
+    parser = argparse.ArgumentParser(description="Summaries and graphs of annotated results for one or more runs")
+    parser.add_argument("run_dirs", nargs="*", default=RUN_DIRS, help="Run folders containing results_annotated.csv")
+    parser.add_argument("--groupings", nargs="+", default=None, choices=list(GROUPINGS), help="Summaries to print (default: all)")
+    parser.add_argument("--counts", action="store_true", help="Also print how often each score was given")
+    parser.add_argument("--output_dir", default=None, help="Write every summary to <output_dir>/summary_<name>.csv")
+    parser.add_argument("--graphs", action="store_true", help="Render the graphs (to --graphs_dir)")
+    parser.add_argument("--graphs_dir", default=GRAPHS_DIR)
+    parser.add_argument("--show", action="store_true", help="Also display the graphs")
+    parser.set_defaults(**defaults)
+    args = parser.parse_args(argv)
+
+    df = load_annotations(args.run_dirs)
+    summaries = analyze(df)
+
+    names = list(args.groupings or summaries)
+    if args.groupings and df["run"].nunique() > 1:
+        names += [f"run_{name}" for name in args.groupings]
+    print_summaries(summaries, names)
+    if args.counts:
+        for name in args.groupings or GROUPINGS:
+            print_counts(df, GROUPINGS[name])
+    print(f"Total samples: {len(df)} from {df['run'].nunique()} run(s)")
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        for name, summary in summaries.items():
+            summary.to_csv(os.path.join(args.output_dir, f"summary_{name}.csv"))
+        print(f"Saved summaries to {args.output_dir}")
+
+    if args.graphs:
+        create_graphs(summaries, args.graphs_dir, args.show)
+        print(f"Saved graphs to {args.graphs_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,101 @@
 # Creates a histogram for the retrieval metrics
+# Answers and context passages are deduplicated and encoded in one batch (SentenceTransformer.encode
+# sorts by length internally, so batches have little padding), then every answer-context similarity
+# comes from one vectorised product over the (rows x contexts) grid
+
+import argparse
 
-import pandas as pd
-from sentence_transformers import SentenceTransformer, util
 import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from sentence_transformers import SentenceTransformer
+
+RESULTS_FILE = "results/run_1/results_annotated.csv"  # CHANGE FOLDER NAME AS NEEDED
+COVERAGE_THRESHOLD = 0.5  # a context counts as used by the answer at this similarity or above
+
+
+def clean_texts(series):
+    """Strip text cells, treating NaN and "nan" as empty"""
+    series = series.fillna("").astype(str).str.strip()
+    return series.mask(series.str.lower() == "nan", "")
+
+
+def similarity_grid(model, answers, contexts, batch_size=64):
+    """
+    Cosine similarity of each answer with each of its contexts
+    answers: (n,) strings, contexts: (n, c) strings with "" for missing contexts
+    Returns an (n, c) array with NaN where the context is missing
+    """
+    unique_texts = pd.unique(np.concatenate([answers, contexts.ravel()]))
+    embeddings = model.encode(list(unique_texts), batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=True)
+
+    lookup = pd.Index(unique_texts)
+    answer_vectors = embeddings[lookup.get_indexer(answers)]  # (n, d)
+    context_vectors = embeddings[lookup.get_indexer(contexts.ravel())].reshape(contexts.shape + (-1,))  # (n, c, d)
+
+    sims = np.einsum("nd,ncd->nc", answer_vectors, context_vectors)
+    return np.where(contexts != "", sims, np.nan)
+
+
+def retrieval_metrics(sims, coverage_threshold=COVERAGE_THRESHOLD):
+    """Per-row max/mean/top-2 similarity and context coverage (0 when a row has no contexts)"""
+    has_context = ~np.isnan(sims)
+    n_contexts = has_context.sum(axis=1)
+    filled = np.where(has_context, sims, -np.inf)
+    ranked = -np.sort(-filled, axis=1)  # descending, missing contexts last
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        top2 = np.where(np.isfinite(ranked[:, :2]), ranked[:, :2], 0).sum(axis=1) / np.minimum(n_contexts, 2)
+        metrics = pd.DataFrame({
+            "max_similarity": np.where(n_contexts > 0, ranked[:, 0], 0),
+            "mean_similarity": np.where(n_contexts > 0, np.nansum(sims, axis=1) / n_contexts, 0),
+            "top2_similarity": np.where(n_contexts > 0, top2, 0),
+            "context_coverage": np.where(n_contexts > 0, (filled >= coverage_threshold).sum(axis=1) / n_contexts, 0)
+        })
+    return metrics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer vs. retrieved context similarity metrics")
+    parser.add_argument("--input", default=RESULTS_FILE)
+    parser.add_argument("--output", default=None, help="Optional CSV with the per-row metrics added")
+    parser.add_argument("--coverage_threshold", type=float, default=COVERAGE_THRESHOLD)
+    parser.add_argument("--no_plot", action="store_true")
+    args = parser.parse_args()
+
+    # Load CSV data
+    df = pd.read_csv(args.input)
+    df["answer"] = df["answer"].fillna("").str.strip()
+
+    # Load the SentenceTransformer model (MiniLM-L12)
+    model = SentenceTransformer("all-MiniLM-L12-v2")
+
+    # Identify context columns
+    context_cols = [col for col in df.columns if col.startswith("context_") and col != "context_count"]
+    contexts = np.column_stack([clean_texts(df[col]).to_numpy(dtype=object) for col in context_cols])
+
+    sims = similarity_grid(model, df["answer"].to_numpy(dtype=object), contexts)
+    metrics = retrieval_metrics(sims, args.coverage_threshold)
+    df = pd.concat([df.reset_index(drop=True), metrics], axis=1)
+
+    # Show summary and histogram
+    print("Average max similarity:", df["max_similarity"].mean())
+    print("Min similarity:", df["max_similarity"].min())
+    print("Max similarity:", df["max_similarity"].max())
+    print(df[metrics.columns].describe().round(3))
+    print(df.groupby("mode")[list(metrics.columns)].mean().round(3))
+
+    if args.output:
+        df.to_csv(args.output, index=False, encoding="utf-8")
+        print(f"Saved per-row metrics to {args.output}")
 
-# Load CSV data
-df = pd.read_csv("results/results_annotated.csv")
-df["answer"] = df["answer"].fillna("").str.strip()
-
-# Load the SentenceTransformer model (MiniLM-L12)
-model = SentenceTransformer("all-MiniLM-L12-v2")
-
-# Identify context columns
-context_cols = [col for col in df.columns if col.startswith("context_")]
-
-# Compute max cosine similarity between answer and context passages
-def max_similarity(row):
-    answer = row["answer"]
-    answer_emb = model.encode(answer, convert_to_tensor=True)
-    sims = []
-    for col in context_cols:
-        ctx = str(row[col]).strip()
-        if ctx and ctx.lower() != "nan":
-            ctx_emb = model.encode(ctx, convert_to_tensor=True)
-            sim = util.cos_sim(answer_emb, ctx_emb).item()
-            sims.append(sim)
-    return max(sims) if sims else 0
-
-df["max_similarity"] = df.apply(max_similarity, axis=1)
-
-# Show summary and histogram
-print("Average max similarity:", df["max_similarity"].mean())
-print("Min similarity:", df["max_similarity"].min())
-print("Max similarity:", df["max_similarity"].max())
-
-# Plot histogram
-plt.figure(figsize=(8, 5))
-plt.hist(df["max_similarity"], bins=20, color="cornflowerblue", edgecolor="black")
-plt.title("Distribution of Max Semantic Similarity\n(Answer vs. Retrieved Context)")
-plt.xlabel("Cosine Similarity")
-plt.ylabel("Number of Samples")
-plt.grid(True)
-plt.tight_layout()
-plt.show()
+    if not args.no_plot:
+        # Plot histogram
+        plt.figure(figsize=(8, 5))
+        plt.hist(df["max_similarity"], bins=20, color="cornflowerblue", edgecolor="black")
+        plt.title("Distribution of Max Semantic Similarity\n(Answer vs. Retrieved Context)")
+        plt.xlabel("Cosine Similarity")
+        plt.ylabel("Number of Samples")
+        plt.grid(True)
+        plt.tight_layout()
+        plt.show()